@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import click
+import numpy as np
+import requests
+
+
+def timed_get(session: requests.Session, url: str, timeout: float) -> float:
+    start_time = time.monotonic()
+    try:
+        session.get(url, timeout=timeout).content
+    except requests.exceptions.RequestException:
+        return float('nan')
+    return time.monotonic() - start_time
+
+def run_fast_requests(url: str, count: int, concurrency: int, timeout: float) -> List[float]:
+    sessions = threading.local()
+    def get() -> float:
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        return timed_get(sessions.session, url, timeout)
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(lambda _: get(), range(count)))
+
+def summary(phase: str, latencies: List[float]) -> Dict[str, Any]:
+    values = np.array(latencies, dtype=float)
+    failed = int(np.isnan(values).sum())
+    values = values[~np.isnan(values)] * 1000
+    if values.shape[0] == 0:
+        return {'phase': phase, 'requests': len(latencies), 'failed': failed}
+    return {
+        'phase': phase,
+        'requests': len(latencies),
+        'failed': failed,
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p95_ms': round(float(np.percentile(values, 95)), 1),
+        'p99_ms': round(float(np.percentile(values, 99)), 1),
+        'max_ms': round(float(values.max()), 1)
+    }
+
+@click.command()
+@click.option('-a', '--api_url', default='http://localhost:8080', help='provision_api instance to benchmark')
+@click.option('-f', '--fast_path', default='/api/list/city_functions/', help='cheap endpoint which latency is measured')
+@click.option('-s', '--slow_path', default='/api/db/?format=json&execute_as_is=true&query=SELECT%20pg_sleep({seconds})',
+        help='endpoint executing a slow database query, {seconds} is replaced with --slow_seconds')
+@click.option('-S', '--slow_seconds', type=float, default=5.0, help='duration of the slow query')
+@click.option('-sC', '--slow_count', type=int, default=1, help='number of slow requests kept in flight')
+@click.option('-n', '--requests_count', type=int, default=200, help='number of fast requests in each phase')
+@click.option('-c', '--concurrency', type=int, default=10, help='number of fast requests executed at the same time')
+@click.option('-t', '--timeout', type=float, default=60.0, help='timeout of a single request')
+def main(api_url: str, fast_path: str, slow_path: str, slow_seconds: float, slow_count: int, requests_count: int,
+        concurrency: int, timeout: float):
+    fast_url = api_url.rstrip('/') + fast_path
+    slow_url = api_url.rstrip('/') + slow_path.format(seconds=slow_seconds)
+
+    run_fast_requests(fast_url, concurrency, concurrency, timeout)
+    results = [summary('idle', run_fast_requests(fast_url, requests_count, concurrency, timeout))]
+
+    slow_latencies: List[Optional[float]] = [None] * slow_count
+    def slow(i: int) -> None:
+        slow_latencies[i] = timed_get(requests.Session(), slow_url, timeout + slow_seconds)
+    slow_threads = [threading.Thread(target=slow, args=(i,)) for i in range(slow_count)]
+    for thread in slow_threads:
+        thread.start()
+    time.sleep(min(0.5, slow_seconds / 10))
+    start_time = time.monotonic()
+    latencies = run_fast_requests(fast_url, requests_count, concurrency, timeout)
+    fast_phase_time = time.monotonic() - start_time
+    for thread in slow_threads:
+        thread.join()
+    results.append(summary('slow query in flight', latencies))
+
+    columns = ['phase', 'requests', 'failed', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    widths = [max(len(column), *(len(str(result.get(column, '-'))) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result.get(column, '-')).ljust(width) for column, width in zip(columns, widths)))
+    print(f'slow requests took {", ".join(f"{latency:.2f}s" for latency in slow_latencies)},'  # type: ignore
+            f' fast requests of the second phase took {fast_phase_time:.2f}s in total')
+
+
+if __name__ == '__main__':
+    main()
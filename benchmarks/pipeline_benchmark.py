@@ -0,0 +1,279 @@
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# provision_api patches the standard library with gevent on import, so it goes first
+import provision_api
+
+import click
+import numpy as np
+import pandas as pd
+import psycopg2
+from loguru import logger
+from psycopg2.extras import execute_values
+
+import prosperity
+import provision_engine
+import synthetic_city
+from synthetic_city import CityConfig, SyntheticCity
+
+API_PATHS = (
+    '/api/provision_v3/prosperity/districts/',
+    '/api/provision_v3/prosperity/municipalities/?social_group=mean&service_type=all',
+    '/api/provision_v3/prosperity/blocks/?city_function=all&social_group=all',
+    '/api/list/city_hierarchy/?include_blocks=1',
+    '/api/list/infrastructures/',
+    '/api/relevance/service_types/?social_group=Social%20group%201'
+)
+STAND_IN_TABLES = ('all_services', 'houses', 'blocks', 'municipalities', 'administrative_units', 'functional_objects', 'city_service_types',
+        'benchmark_city')
+
+Tables = Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+
+
+def measure(run: Callable[[Any], Any], repeat: int, setup: Callable[[], Any] = lambda: None) -> Dict[str, Any]:
+    durations: List[float] = []
+    for _ in range(repeat):
+        argument = setup()
+        start_time = time.perf_counter()
+        run(argument)
+        durations.append(time.perf_counter() - start_time)
+    return {
+        'runs': repeat,
+        'min_s': round(min(durations), 6),
+        'median_s': round(statistics.median(durations), 6),
+        'mean_s': round(statistics.mean(durations), 6),
+        'max_s': round(max(durations), 6)
+    }
+
+def copy_tables(tables: Dict[str, Tables]) -> Dict[str, Tables]:
+    return {service_type: tuple(table.copy() for table in service_tables) for service_type, service_tables in tables.items()} # type: ignore
+
+def process_all(update_provision: Any, city: SyntheticCity, tables: Dict[str, Tables]) -> Dict[str, Tables]:
+    processed = {}
+    for service_type, (table_1, table_2, table_3) in tables.items():
+        update_provision.service_type = service_type
+        processed[service_type] = update_provision.process_tables(table_1, table_2, table_3, city.normatives[service_type])
+    return processed
+
+def prepare_database(conn: 'psycopg2.connection', city: SyntheticCity) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('houses') IS NOT NULL, to_regclass('benchmark_city') IS NOT NULL")
+        has_houses, is_benchmark = cur.fetchone()
+        if has_houses and not is_benchmark:
+            raise click.ClickException('database already contains "houses" table which was not created by the benchmark, use an empty database')
+        cur.execute('DROP SCHEMA IF EXISTS provision CASCADE')
+        for table in STAND_IN_TABLES:
+            cur.execute(f'DROP TABLE IF EXISTS {table} CASCADE')
+        cur.execute('CREATE TABLE benchmark_city (name varchar PRIMARY KEY, config varchar NOT NULL)')
+        cur.execute('CREATE TABLE city_service_types (id int PRIMARY KEY, name varchar UNIQUE NOT NULL)')
+        cur.execute('CREATE TABLE functional_objects (id int PRIMARY KEY)')
+        for table in ('administrative_units', 'municipalities', 'blocks'):
+            cur.execute(f'CREATE TABLE {table} (id int PRIMARY KEY)')
+        cur.execute('CREATE TABLE houses (functional_object_id int PRIMARY KEY REFERENCES functional_objects(id), resident_number int)')
+        cur.execute('CREATE TABLE all_services (functional_object_id int PRIMARY KEY REFERENCES functional_objects(id), city varchar,'
+                ' city_service_type_id int REFERENCES city_service_types(id), city_service_type varchar)')
+
+        cur.execute('INSERT INTO benchmark_city (name, config) VALUES (%s, %s)', (city.name, json.dumps(city.config._asdict())))
+        execute_values(cur, 'INSERT INTO city_service_types (id, name) VALUES %s',
+                list(city.service_types[['id', 'name']].itertuples(index=False, name=None)))
+        execute_values(cur, 'INSERT INTO functional_objects (id) VALUES %s',
+                [(int(object_id),) for object_id in np.concatenate((city.houses['house_id'], city.services['func_id']))])
+        for table, units in (('administrative_units', city.districts), ('municipalities', city.municipalities), ('blocks', city.blocks)):
+            execute_values(cur, f'INSERT INTO {table} (id) VALUES %s', [(int(unit_id),) for unit_id in units['id']])
+        execute_values(cur, 'INSERT INTO houses (functional_object_id, resident_number) VALUES %s',
+                [(int(house_id), int(population)) for house_id, population in city.houses[['house_id', 'population']].itertuples(index=False)])
+        service_type_ids = dict(zip(city.service_types['name'], city.service_types['id']))
+        execute_values(cur, 'INSERT INTO all_services (functional_object_id, city, city_service_type_id, city_service_type) VALUES %s',
+                [(int(func_id), city.name, int(service_type_ids[service_type]), service_type) \
+                        for func_id, service_type in city.services[['func_id', 'service_type']].itertuples(index=False)])
+
+def truncate_results(conn: 'psycopg2.connection') -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute('TRUNCATE provision.houses, provision.services, provision.houses_services, provision.services_readiness,'
+                ' provision.houses_administrative_units, provision.houses_municipalities, provision.houses_blocks,'
+                ' provision.services_administrative_units, provision.services_municipalities, provision.services_blocks')
+
+def api_city_frames(city: SyntheticCity) -> Dict[str, pd.DataFrame]:
+    return {
+        'blocks': synthetic_city.blocks_frame(city),
+        **{location_column: synthetic_city.provision_frame(city, location_column) for location_column in ('district', 'municipality', 'block')}
+    }
+
+def api_global_data(city: SyntheticCity, city_frames: Dict[str, pd.DataFrame]) -> Any:
+    infrastructure = synthetic_city.infrastructure_frame(city)
+    city_hierarchy = synthetic_city.city_hierarchy_frame(city)
+    city_division_type = {city.name: 'ADMIN_UNIT_PARENT'}
+    listings = provision_api.Listings(
+        city.infrastructures[['id', 'name', 'code']], city.city_functions[['id', 'name', 'code']], city.service_types[['id', 'name', 'code']],
+        city.living_situations, city.social_groups[['id', 'name', 'code']]
+    )
+    cities = provision_api.CitiesData([city.name], lambda city_name: city_data(city, city_frames, infrastructure, city_hierarchy,
+            city_division_type))
+    return provision_api.GlobalData(1, city.name, city.needs, infrastructure, listings, city_hierarchy, provision_api.build_hierarchy_lookup(city_hierarchy),
+            {city.name: city.services['service_type'].value_counts().to_dict()}, city_division_type, cities,
+            provision_api.AccessibilityData(lambda _: synthetic_city.houses_frame(city),
+                    lambda _, service_type, houses: service_type_data(city, service_type, houses)), {}, 'synthetic')
+
+def service_type_data(city: SyntheticCity, service_type: str, houses: pd.DataFrame) -> Any:
+    _, _, table_3 = synthetic_city.update_provision_tables(city, service_type)
+    pairs = table_3.reset_index().rename(columns={'func_id': 'service_id'})[['house_id', 'service_id']]
+    accessibility = provision_engine.build_accessibility(houses, synthetic_city.services_frame(city, service_type), pairs)
+    normative = city.normatives[service_type]
+    return provision_api.ServiceTypeData(accessibility, normative, provision_engine.evaluate(accessibility, normative))
+
+def city_data(city: SyntheticCity, city_frames: Dict[str, pd.DataFrame], infrastructure: pd.DataFrame, city_hierarchy: pd.DataFrame,
+        city_division_type: Dict[str, str]) -> Any:
+    return provision_api.build_city_data(city.name, city_frames['blocks'], city_frames['district'], city_frames['municipality'],
+            city_frames['block'], city.needs, infrastructure, city_hierarchy, city_division_type)
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    for stage, result in results.items():
+        base = baseline['results'].get(stage)
+        if base is None or 'median_s' not in result or 'median_s' not in base:
+            continue
+        result['baseline_median_s'] = base['median_s']
+        result['ratio'] = round(result['median_s'] / base['median_s'], 3) if base['median_s'] > 0 else None
+        if result['ratio'] is not None and result['ratio'] > 1 + threshold:
+            regressions.append(stage)
+    return regressions
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    columns = ['stage', 'runs', 'min_s', 'median_s', 'max_s', 'baseline_median_s', 'ratio']
+    rows = [{'stage': stage, **result} for stage, result in results.items()]
+    widths = [max(len(column), *(len(str(row.get(column, '-'))) for row in rows)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        if 'skipped' in row:
+            print(f'{row["stage"].ljust(widths[0])}  skipped: {row["skipped"]}')
+        else:
+            print('  '.join(str(row.get(column, '-')).ljust(width) for column, width in zip(columns, widths)))
+
+@click.command()
+@click.option('-H', '--houses', type=int, default=3000, help='number of houses of the synthetic city')
+@click.option('-S', '--services', type=int, default=300, help='number of services of the synthetic city')
+@click.option('-d', '--districts', type=int, default=5, help='number of districts (administrative units)')
+@click.option('-m', '--municipalities', type=int, default=30, help='number of municipalities')
+@click.option('-b', '--blocks', type=int, default=300, help='number of blocks')
+@click.option('-st', '--service_types', type=int, default=12, help='number of service types')
+@click.option('-sg', '--social_groups', type=int, default=8, help='number of social groups')
+@click.option('-s', '--seed', type=int, default=1, help='seed of the synthetic city generator')
+@click.option('-u', '--update_service_types', type=int, default=2, help='number of service types passed through update_provision stages')
+@click.option('-r', '--repeat', type=int, default=5, help='number of runs of each stage')
+@click.option('-n', '--requests_count', type=int, default=20, help='number of requests to each API handler')
+@click.option('-D', '--database', default=None,
+        help='connection string of an empty scratch database to time insert_results with (its provision schema is recreated)')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None, help='file to write results in JSON')
+@click.option('-B', '--baseline', type=click.Path(exists=True, dir_okay=False), default=None, help='results JSON file to compare with')
+@click.option('-t', '--threshold', type=float, default=0.2, help='relative slowdown of a stage median considered as a regression')
+def main(houses: int, services: int, districts: int, municipalities: int, blocks: int, service_types: int, social_groups: int, seed: int,
+        update_service_types: int, repeat: int, requests_count: int, database: Optional[str], output: Optional[str], baseline: Optional[str],
+        threshold: float):
+    config = CityConfig(houses, services, districts, municipalities, blocks, service_types, social_groups, seed)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    results['synthetic_city.generate_city'] = measure(lambda _: synthetic_city.generate_city(config), repeat)
+    city = synthetic_city.generate_city(config)
+    selected_service_types = list(city.service_types['name'][:update_service_types])
+    tables = {service_type: synthetic_city.update_provision_tables(city, service_type) for service_type in selected_service_types}
+
+    try:
+        import update_provision
+    except ImportError as ex:
+        results['update_provision.process_tables'] = {'skipped': f'update_provision could not be imported: {ex}'}
+        results['update_provision.insert_results'] = {'skipped': f'update_provision could not be imported: {ex}'}
+    else:
+        results['update_provision.process_tables'] = measure(lambda tables_copy: process_all(update_provision, city, tables_copy),
+                repeat, lambda: copy_tables(tables))
+        if database is None:
+            results['update_provision.insert_results'] = {'skipped': 'database is not set'}
+        else:
+            processed = process_all(update_provision, city, copy_tables(tables))
+            conn = psycopg2.connect(database)
+            try:
+                prepare_database(conn, city)
+                update_provision.ensure_tables(conn)
+                def setup() -> Dict[str, Tables]:
+                    truncate_results(conn)
+                    return copy_tables(processed)
+                def insert(processed_copy: Dict[str, Tables]) -> None:
+                    for service_type, (table_1, table_2, table_3) in processed_copy.items():
+                        update_provision.insert_results(conn, table_1, table_2, table_3, service_type, city.normatives[service_type])
+                results['update_provision.insert_results'] = measure(insert, repeat, setup)
+            finally:
+                conn.close()
+
+    logger.remove()
+    provision_api.houses_properties = provision_api.isochrones_properties = provision_api.Properties('localhost', 5432, '-', '-', '-')
+    city_frames = api_city_frames(city)
+    provision_api.global_data = api_global_data(city, city_frames)
+    infrastructure, city_hierarchy = provision_api.global_data.infrastructure, provision_api.global_data.city_hierarchy
+    provision, blocks_frame = city_frames['municipality'], city_frames['blocks']
+
+    results['prosperity.build_prosperity_cube'] = measure(lambda _: prosperity.build_prosperity_cube(provision, 'municipality',
+            infrastructure, city.needs, blocks_frame, city_hierarchy), repeat)
+    cube = prosperity.build_prosperity_cube(provision, 'municipality', infrastructure, city.needs, blocks_frame, city_hierarchy)
+    queries = [(aggregation_type, value, social_group, provision_only) for aggregation_type in prosperity.AGGREGATION_TYPES
+            for value in ('all', 'mean') for social_group in ('all', 'mean', city.social_groups['name'][0]) for provision_only in (False, True)]
+    results['prosperity.query_prosperity'] = measure(lambda _: [prosperity.query_prosperity(cube, 'municipality', aggregation_type, None, value,
+            social_group, provision_only, False) for aggregation_type, value, social_group, provision_only in queries], repeat)
+    results['provision_api.build_city_data'] = measure(lambda _: city_data(city, city_frames, infrastructure, city_hierarchy,
+            provision_api.global_data.city_division_type), repeat)
+
+    lookups = [(value, kind, what) for kind, frame in (('service_type', city.service_types), ('city_function', city.city_functions),
+            ('social_group', city.social_groups), ('infrastructure', city.infrastructures)) for value in frame['name'].tolist() + frame['code'].tolist()
+            + [str(object_id) for object_id in frame['id']] for what in ('name', 'id')]
+    results['provision_api.get_parameter_of_request'] = measure(lambda _: [provision_api.get_parameter_of_request(value, kind, what) # type: ignore
+            for value, kind, what in lookups], repeat)
+
+    engine_data = provision_api.global_data.accessibility.get(city.name, selected_service_types[0])
+    results['provision_engine.evaluate'] = measure(lambda _: provision_engine.evaluate(engine_data.accessibility, # type: ignore
+            engine_data.normative), repeat) # type: ignore
+    results['provision_engine.accessibility_by_radius'] = measure(lambda _: provision_engine.accessibility_by_radius( # type: ignore
+            engine_data.accessibility, engine_data.normative['radius_meters']), repeat) # type: ignore
+
+    client = provision_api.app.test_client()
+    what_if_body = {'service_type': selected_service_types[0], 'remove': [int(engine_data.accessibility.services.index[0])], # type: ignore
+            'add': [{'longitude': synthetic_city.CITY_ORIGIN[0] + 0.1, 'latitude': synthetic_city.CITY_ORIGIN[1] + 0.05}]}
+    results['POST /api/provision_v3/what_if/'] = measure(lambda _: client.post('/api/provision_v3/what_if/', json=what_if_body).get_data(),
+            requests_count)
+    for path in API_PATHS:
+        response = client.get(path)
+        if response.status_code != 200:
+            results[f'GET {path}'] = {'skipped': f'status {response.status_code}: {response.get_data(as_text=True)[:200]}'}
+            continue
+        results[f'GET {path}'] = measure(lambda _: client.get(path).get_data(), requests_count)
+
+    regressions: List[str] = []
+    report: Dict[str, Any] = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {**config._asdict(), 'update_service_types': update_service_types, 'repeat': repeat, 'requests_count': requests_count},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': results
+    }
+    if baseline is not None:
+        with open(baseline, 'r', encoding='utf-8') as file:
+            baseline_report = json.load(file)
+        if baseline_report.get('config') != report['config']:
+            print(f'Warning: baseline config differs from the current one: {baseline_report.get("config")}', file=sys.stderr)
+        regressions = compare(results, baseline_report, threshold)
+        report['baseline'] = {'file': baseline, 'created_at': baseline_report.get('created_at'), 'threshold': threshold, 'regressions': regressions}
+
+    print_table(results)
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if regressions:
+        print(f'Regressions (median slower than baseline by more than {threshold:.0%}): {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
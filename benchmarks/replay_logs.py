@@ -0,0 +1,187 @@
+import ast
+import datetime
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+import click
+import numpy as np
+import requests
+
+LOG_LINE = re.compile(r'^\[(?P<level>\w+)\] - (?P<time>\d\d-\d\d-\d\d \d\d:\d\d:\d\d): (?P<user>\S+) (?P<method>[A-Z]+) (?P<endpoint>\S+)'
+        r' \((?P<handler>[^)]*)\): query_params: (?P<params>\{.*\})\s*$')
+DEFAULT_EXCLUDE = r'^/api/(db|logs|reload_data|profiles|metrics)(/|$)|^/api/provision_v3/(what_if|(houses|services)/(batch|availability_zones))/?$'
+
+LoggedRequest = NamedTuple('LoggedRequest', [
+    ('timestamp', float),
+    ('user', str),
+    ('method', str),
+    ('endpoint', str),
+    ('handler', str),
+    ('params', Dict[str, str])
+])
+Result = NamedTuple('Result', [
+    ('handler', str),
+    ('status', Optional[int]),
+    ('latency', float),
+    ('lag', float)
+])
+
+
+def _parse_params(text: str) -> Optional[Dict[str, str]]:
+    try:
+        params = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return None
+    return {str(key): str(value) for key, value in params.items()} if isinstance(params, dict) else None
+
+def read_log_files(paths: Iterable[str]) -> Iterator[LoggedRequest]:
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            for line in file:
+                match = LOG_LINE.match(line)
+                if match is None:
+                    continue
+                params = _parse_params(match.group('params'))
+                if params is None:
+                    continue
+                timestamp = datetime.datetime.strptime(match.group('time'), '%y-%m-%d %H:%M:%S').timestamp()
+                yield LoggedRequest(timestamp, match.group('user'), match.group('method'), match.group('endpoint'), match.group('handler'), params)
+
+def read_mongo(mongo_url: str, since: Optional[datetime.datetime], until: Optional[datetime.datetime]) -> Iterator[LoggedRequest]:
+    from pymongo import MongoClient
+    query: Dict[str, Any] = {'component': 'provision_api', 'message': {'$regex': '^query_params: '}}
+    if since is not None or until is not None:
+        query['timestamp'] = {**({'$gte': since} if since is not None else {}), **({'$lt': until} if until is not None else {})}
+    client = MongoClient(mongo_url)
+    try:
+        for entry in client.get_database('logs').get_collection('logs').find(query).sort('timestamp', 1):
+            params = _parse_params(entry['message'][len('query_params: '):])
+            if params is None:
+                continue
+            yield LoggedRequest(entry['timestamp'].replace(tzinfo=datetime.timezone.utc).timestamp(), str(entry.get('user')),
+                    str(entry.get('method')), str(entry.get('endpoint')), str(entry.get('handler')), params)
+    finally:
+        client.close()
+
+def spread_seconds(logged: List[LoggedRequest]) -> List[LoggedRequest]:
+    # log file timestamps have seconds precision, requests of the same second are spread evenly over it
+    result: List[LoggedRequest] = []
+    i = 0
+    while i < len(logged):
+        j = i
+        while j < len(logged) and logged[j].timestamp == logged[i].timestamp:
+            j += 1
+        result.extend(request._replace(timestamp=request.timestamp + k / (j - i)) for k, request in enumerate(logged[i:j]))
+        i = j
+    return result
+
+def replay(logged: List[LoggedRequest], api_url: str, concurrency: int, speedup: float, timeout: float) -> Tuple[List[Result], float]:
+    sessions = threading.local()
+    def execute(request: LoggedRequest, due: float) -> Result:
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        url = api_url.rstrip('/') + request.endpoint + (f'?{urlencode(request.params)}' if request.params else '')
+        start_time = time.monotonic()
+        try:
+            status: Optional[int] = sessions.session.request(request.method, url, timeout=timeout).status_code
+        except requests.exceptions.RequestException:
+            status = None
+        return Result(request.handler, status, time.monotonic() - start_time, max(start_time - due, 0.0))
+
+    first_timestamp = logged[0].timestamp if len(logged) != 0 else 0.0
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as executor:
+        futures = []
+        for request in logged:
+            due = start_time + ((request.timestamp - first_timestamp) / speedup if speedup > 0 else 0.0)
+            if due > time.monotonic():
+                time.sleep(due - time.monotonic())
+            futures.append(executor.submit(execute, request, due))
+        results = [future.result() for future in futures]
+    return results, time.monotonic() - start_time
+
+def summary(name: str, results: List[Result], duration: float) -> Dict[str, Any]:
+    succeeded = [result for result in results if result.status is not None and result.status < 400]
+    latencies = np.array([result.latency for result in succeeded]) * 1000
+    report: Dict[str, Any] = {
+        'endpoint': name,
+        'requests': len(results),
+        'client_errors': sum(1 for result in results if result.status is not None and 400 <= result.status < 500),
+        'errors': sum(1 for result in results if result.status is None or result.status >= 500),
+        'rps': round(len(succeeded) / duration, 2) if duration > 0 else None,
+        'lag_p95_ms': round(float(np.percentile([result.lag for result in results], 95)) * 1000, 1) if len(results) != 0 else None
+    }
+    if latencies.shape[0] != 0:
+        report.update({f'p{percentile}_ms': round(float(np.percentile(latencies, percentile)), 1) for percentile in (50, 90, 95, 99)})
+        report['max_ms'] = round(float(latencies.max()), 1)
+    return report
+
+@click.command()
+@click.option('-a', '--api_url', default='http://localhost:8080', help='provision_api instance to replay requests against')
+@click.option('-l', '--log_file', 'log_files', multiple=True, type=click.Path(exists=True, dir_okay=False),
+        help='provision_api.log file to read requests from (can be given multiple times, e.g. for rotated files)')
+@click.option('-m', '--mongo_url', default=None, help='MongoDB to read requests from "logs" collection instead of log files')
+@click.option('-sS', '--since', type=click.DateTime(), default=None, help='replay only requests logged since the given time (UTC for MongoDB)')
+@click.option('-sU', '--until', type=click.DateTime(), default=None, help='replay only requests logged before the given time (UTC for MongoDB)')
+@click.option('-i', '--include', default=None, help='regular expression, replay only endpoints matching it')
+@click.option('-e', '--exclude', default=DEFAULT_EXCLUDE, help='regular expression, skip endpoints matching it')
+@click.option('-M', '--methods', default='GET', help='comma-separated HTTP methods to replay (request bodies are not logged)')
+@click.option('-n', '--limit', type=int, default=None, help='replay only the first N requests')
+@click.option('-c', '--concurrency', type=int, default=10, help='maximum number of requests executed at the same time')
+@click.option('-s', '--speedup', type=float, default=1.0, help='replay speed relative to the logged timeline, 0 sends requests as fast as possible')
+@click.option('-t', '--timeout', type=float, default=60.0, help='timeout of a single request')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default=None, help='file to write the report in JSON')
+def main(api_url: str, log_files: Tuple[str, ...], mongo_url: Optional[str], since: Optional[datetime.datetime], until: Optional[datetime.datetime],
+        include: Optional[str], exclude: str, methods: str, limit: Optional[int], concurrency: int, speedup: float, timeout: float,
+        output: Optional[str]):
+    if (len(log_files) == 0) == (mongo_url is None):
+        raise click.UsageError('exactly one of --log_file or --mongo_url must be set')
+    source = read_mongo(mongo_url, since, until) if mongo_url is not None else read_log_files(log_files)
+    allowed_methods = {method.strip().upper() for method in methods.split(',')}
+    logged = [request for request in source if request.method in allowed_methods
+            and (include is None or re.search(include, request.endpoint)) and not (exclude and re.search(exclude, request.endpoint))
+            and (mongo_url is not None or (since is None or request.timestamp >= since.timestamp()) and (until is None or request.timestamp < until.timestamp()))]
+    logged.sort(key=lambda request: request.timestamp)
+    if mongo_url is None:
+        logged = spread_seconds(logged)
+    logged = logged[:limit]
+    if len(logged) == 0:
+        raise click.ClickException('no requests to replay are found')
+    logged_duration = logged[-1].timestamp - logged[0].timestamp
+    print(f'Replaying {len(logged)} requests logged over {logged_duration:.0f}s with concurrency {concurrency} and speedup {speedup:g}')
+
+    results, duration = replay(logged, api_url, concurrency, speedup, timeout)
+
+    by_handler: Dict[str, List[Result]] = {}
+    for result in results:
+        by_handler.setdefault(result.handler, []).append(result)
+    reports = [summary(handler, handler_results, duration) for handler, handler_results in sorted(by_handler.items(), key=lambda item: -len(item[1]))]
+    reports.append(summary('total', results, duration))
+
+    columns = ['endpoint', 'requests', 'client_errors', 'errors', 'rps', 'p50_ms', 'p90_ms', 'p95_ms', 'p99_ms', 'max_ms', 'lag_p95_ms']
+    widths = [max(len(column), *(len(str(report.get(column, '-'))) for report in reports)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for report in reports:
+        print('  '.join(str(report.get(column, '-')).ljust(width) for column, width in zip(columns, widths)))
+    print(f'replay took {duration:.2f}s, rps and latencies count only successful responses (4xx are client_errors, 5xx and failures are errors),'
+            ' lag is the delay of request start after its scheduled time (concurrency limit or client overload)')
+    if output is not None:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump({
+                'api_url': api_url,
+                'source': 'mongo' if mongo_url is not None else list(log_files),
+                'concurrency': concurrency,
+                'speedup': speedup,
+                'logged_duration_s': logged_duration,
+                'replay_duration_s': round(duration, 3),
+                'endpoints': reports
+            }, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
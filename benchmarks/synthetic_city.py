@@ -0,0 +1,212 @@
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+CityConfig = NamedTuple('CityConfig', [
+    ('houses', int),
+    ('services', int),
+    ('districts', int),
+    ('municipalities', int),
+    ('blocks', int),
+    ('service_types', int),
+    ('social_groups', int),
+    ('seed', int)
+])
+
+SyntheticCity = NamedTuple('SyntheticCity', [
+    ('config', CityConfig),
+    ('name', str),
+    ('districts', pd.DataFrame),
+    ('municipalities', pd.DataFrame),
+    ('blocks', pd.DataFrame),
+    ('houses', pd.DataFrame),
+    ('services', pd.DataFrame),
+    ('service_types', pd.DataFrame),
+    ('city_functions', pd.DataFrame),
+    ('infrastructures', pd.DataFrame),
+    ('social_groups', pd.DataFrame),
+    ('living_situations', pd.DataFrame),
+    ('needs', pd.DataFrame),
+    ('normatives', Dict[str, Dict[str, Any]])
+])
+
+CITY_NAME = 'Synthetic city'
+CITY_SIZE_METERS = 20000
+CITY_ORIGIN = (30.2, 59.85)
+METERS_PER_DEGREE = 111195.0
+LIVING_SITUATIONS = 5
+_PROVISION_COLUMNS = ('service_type', 'houses_count', 'services_count', 'services_load_mean', 'services_load_sum', 'houses_provision',
+        'services_evaluation', 'services_reserve_mean', 'services_reserve_sum', 'houses_reserve_mean', 'houses_reserve_sum')
+
+
+def _units(prefix: str, count: int) -> pd.DataFrame:
+    return pd.DataFrame({'id': np.arange(1, count + 1), 'name': [f'{prefix} {i}' for i in range(1, count + 1)],
+            'code': [f'{prefix.lower().replace(" ", "_")}_{i}' for i in range(1, count + 1)]})
+
+def generate_city(config: CityConfig) -> SyntheticCity:
+    rng = np.random.default_rng(config.seed)
+
+    districts = _units('District', config.districts)
+    municipalities = _units('Municipality', config.municipalities)
+    municipalities['district_id'] = np.sort(rng.integers(1, config.districts + 1, config.municipalities))
+    municipalities.loc[:min(config.districts, config.municipalities) - 1, 'district_id'] = \
+            np.arange(1, min(config.districts, config.municipalities) + 1)
+
+    blocks = pd.DataFrame({
+        'id': np.arange(1, config.blocks + 1),
+        'municipality_id': rng.integers(1, config.municipalities + 1, config.blocks),
+        'x': rng.uniform(0, CITY_SIZE_METERS, config.blocks),
+        'y': rng.uniform(0, CITY_SIZE_METERS, config.blocks)
+    })
+    blocks['district_id'] = municipalities.set_index('id').loc[blocks['municipality_id'], 'district_id'].to_numpy()
+
+    def placed(count: int, spread: float) -> pd.DataFrame:
+        block_ids = rng.integers(0, config.blocks, count)
+        return pd.DataFrame({
+            'block': blocks['id'].to_numpy()[block_ids],
+            'municipality': blocks['municipality_id'].to_numpy()[block_ids],
+            'district': blocks['district_id'].to_numpy()[block_ids],
+            'x': np.clip(blocks['x'].to_numpy()[block_ids] + rng.normal(0, spread, count), 0, CITY_SIZE_METERS),
+            'y': np.clip(blocks['y'].to_numpy()[block_ids] + rng.normal(0, spread, count), 0, CITY_SIZE_METERS)
+        })
+
+    houses = placed(config.houses, 150)
+    houses.insert(0, 'house_id', np.arange(1, config.houses + 1))
+    houses['population'] = np.maximum(rng.lognormal(4, 1, config.houses).round().astype(int), 1)
+    blocks['population'] = houses.groupby('block')['population'].sum().reindex(blocks['id'], fill_value=0).to_numpy()
+
+    infrastructures = _units('Infrastructure', max(config.service_types // 6, 1))
+    city_functions = _units('City function', max(config.service_types // 2, 1))
+    city_functions['infrastructure_id'] = np.arange(city_functions.shape[0]) % infrastructures.shape[0] + 1
+    service_types = _units('Service type', config.service_types)
+    service_types['city_function_id'] = np.arange(config.service_types) % city_functions.shape[0] + 1
+    social_groups = _units('Social group', config.social_groups)
+    living_situations = _units('Living situation', LIVING_SITUATIONS)[['id', 'name']]
+
+    services = placed(config.services, 300)
+    services.insert(0, 'func_id', np.arange(config.houses + 1, config.houses + config.services + 1))
+    services['service_type'] = service_types['name'].to_numpy()[np.arange(config.services) % config.service_types]
+    services['capacity'] = rng.integers(1, 11, config.services)
+
+    needs = pd.DataFrame([(social_group, living_situation, service_type) for social_group in social_groups['name']
+            for living_situation in living_situations['name'] for service_type in service_types['name']],
+            columns=('social_group', 'living_situation', 'service_type'))
+    needs = needs[rng.random(needs.shape[0]) < 0.6].reset_index(drop=True)
+    for column in ('walking', 'transport', 'car'):
+        needs[column] = rng.choice([None, 5, 10, 15, 20, 30], needs.shape[0])
+    needs['intensity'] = rng.integers(1, 6, needs.shape[0])
+    significance = pd.DataFrame(rng.integers(0, 6, (config.social_groups, city_functions.shape[0])) / 5,
+            index=social_groups['name'], columns=city_functions['id'])
+    city_function_of = dict(zip(service_types['name'], service_types['city_function_id']))
+    needs['significance'] = [significance.loc[social_group, city_function_of[service_type]]
+            for social_group, service_type in needs[['social_group', 'service_type']].itertuples(index=False)]
+
+    normatives = {}
+    for service_type in service_types['name']:
+        max_load = int(rng.integers(100, 2000))
+        normatives[service_type] = {
+            'normative': float(rng.integers(5, 150)),
+            'max_load': max_load,
+            'radius_meters': int(rng.choice([300, 500, 800, 1200, 2000])),
+            'public_transport_time': None,
+            'service_evaluation': [-max_load, -max_load // 2, 0, max_load // 4, max_load // 2],
+            'house_evaluation': [-100, -30, -10, 0, 10, 30, 100]
+        }
+
+    return SyntheticCity(config, CITY_NAME, districts, municipalities, blocks, houses, services, service_types, city_functions,
+            infrastructures, social_groups, living_situations, needs, normatives)
+
+def infrastructure_frame(city: SyntheticCity) -> pd.DataFrame:
+    frame = city.service_types.merge(city.city_functions, left_on='city_function_id', right_on='id', suffixes=('_st', '_cf')) \
+            .merge(city.infrastructures, left_on='infrastructure_id', right_on='id')
+    return pd.DataFrame({
+        'infrastructure_id': frame['id'], 'infrastructure': frame['name'], 'infrastructure_code': frame['code'],
+        'city_function_id': frame['id_cf'], 'city_function': frame['name_cf'], 'city_function_code': frame['code_cf'],
+        'service_type_id': frame['id_st'], 'service_type': frame['name_st'], 'service_type_code': frame['code_st']
+    }).sort_values(['infrastructure', 'city_function', 'service_type']).reset_index(drop=True)
+
+def city_hierarchy_frame(city: SyntheticCity) -> pd.DataFrame:
+    population = city.houses['population']
+    district_population = population.groupby(city.houses['district']).sum()
+    municipality_population = population.groupby(city.houses['municipality']).sum()
+    frame = city.municipalities.merge(city.districts, left_on='district_id', right_on='id', suffixes=('_m', '_d'))
+    return pd.DataFrame({
+        'city_id': 1, 'city': city.name, 'city_population': int(population.sum()),
+        'municipality_id': frame['id_m'], 'municipality': frame['name_m'],
+        'municipality_population': municipality_population.reindex(frame['id_m'], fill_value=0).to_numpy(),
+        'district_id': frame['id_d'], 'district': frame['name_d'],
+        'district_population': district_population.reindex(frame['id_d'], fill_value=0).to_numpy()
+    }).sort_values(['municipality', 'district']).reset_index(drop=True)
+
+def blocks_frame(city: SyntheticCity) -> pd.DataFrame:
+    return pd.DataFrame({
+        'population': city.blocks['population'].to_numpy(),
+        'municipality': city.municipalities.set_index('id').loc[city.blocks['municipality_id'], 'name'].to_numpy(),
+        'district': city.districts.set_index('id').loc[city.blocks['district_id'], 'name'].to_numpy(),
+        'city': city.name
+    }, index=pd.Index(city.blocks['id'], name='id'))
+
+def provision_frame(city: SyntheticCity, location_column: str) -> pd.DataFrame:
+    rng = np.random.default_rng(city.config.seed + len(location_column))
+    locations: List[Any] = list(city.blocks['id']) if location_column == 'block' else \
+            list((city.districts if location_column == 'district' else city.municipalities)['name'])
+    rows: List[Tuple[Any, ...]] = []
+    for location in locations:
+        for service_type in city.service_types['name']:
+            if rng.random() < 0.3:
+                continue
+            houses_count = int(rng.integers(1, 500))
+            services_count = int(rng.integers(1, 30))
+            services_load_mean = round(float(rng.uniform(0, 1000)), 2)
+            services_reserve_mean = round(float(rng.normal(0, 300)), 2)
+            houses_reserve_mean = round(float(rng.normal(0, 20)), 2)
+            rows.append((location, service_type, houses_count, services_count, services_load_mean, int(services_load_mean * services_count),
+                    round(float(rng.uniform(0, 10)), 2), round(float(rng.uniform(0, 5)), 2), services_reserve_mean,
+                    int(services_reserve_mean * services_count), houses_reserve_mean, int(houses_reserve_mean * houses_count)))
+    return pd.DataFrame(rows, columns=(location_column,) + _PROVISION_COLUMNS)
+
+def _coordinates(frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    return (CITY_ORIGIN[0] + frame['x'].to_numpy() / (METERS_PER_DEGREE * np.cos(np.radians(CITY_ORIGIN[1]))),
+            CITY_ORIGIN[1] + frame['y'].to_numpy() / METERS_PER_DEGREE)
+
+def houses_frame(city: SyntheticCity) -> pd.DataFrame:
+    longitude, latitude = _coordinates(city.houses)
+    return city.houses.set_index('house_id')[['district', 'municipality', 'block', 'population']].assign(longitude=longitude, latitude=latitude)
+
+def services_frame(city: SyntheticCity, service_type: str) -> pd.DataFrame:
+    services = city.services[city.services['service_type'] == service_type]
+    longitude, latitude = _coordinates(services)
+    return services.rename(columns={'func_id': 'service_id'}).set_index('service_id')[['district', 'municipality', 'block']] \
+            .assign(longitude=longitude, latitude=latitude)
+
+def update_provision_tables(city: SyntheticCity, service_type: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    normative = city.normatives[service_type]
+    houses = city.houses
+    services = city.services[city.services['service_type'] == service_type]
+    table_1 = houses[['house_id', 'district', 'municipality', 'block', 'population']].set_index('house_id')
+    provision = np.zeros(houses.shape[0])
+    provision_capacity = np.zeros(houses.shape[0])
+    table_2_rows: List[Tuple[Any, ...]] = []
+    table_3_rows: List[Tuple[Any, ...]] = []
+    house_xy = houses[['x', 'y']].to_numpy()
+    for func_id, district, municipality, block, x, y, capacity in services[['func_id', 'district', 'municipality', 'block', 'x', 'y', 'capacity']] \
+            .itertuples(index=False):
+        reachable = np.flatnonzero(((house_xy - (x, y)) ** 2).sum(axis=1) <= normative['radius_meters'] ** 2)
+        table_2_rows.append((func_id, district, municipality, block, service_type, capacity, normative['radius_meters'],
+                normative['public_transport_time'], reachable.shape[0], int(houses['population'].to_numpy()[reachable].sum())))
+        if reachable.shape[0] != 0:
+            provision[reachable] += 1 / reachable.shape[0]
+            provision_capacity[reachable] += capacity * 100 / reachable.shape[0]
+        for house in reachable:
+            table_3_rows.append((houses['house_id'].iat[house], houses['district'].iat[house], houses['municipality'].iat[house],
+                    houses['block'].iat[house], houses['population'].iat[house], func_id, normative['radius_meters'], normative['public_transport_time']))
+    if len(table_3_rows) == 0:
+        table_3_rows.append((-1, -1, -1, -1, 0, -1, normative['radius_meters'], normative['public_transport_time']))
+    table_1 = table_1.assign(**{f'{service_type} ({normative["radius_meters"]} метров)': provision,
+            f'{service_type}_capacity ({normative["radius_meters"]} метров)': provision_capacity})
+    table_2 = pd.DataFrame(table_2_rows, columns=('func_id', 'district', 'municipality', 'block', 'service_type', 'capacity', 'radius',
+            'transport', 'houses_available', 'population_available')).set_index('func_id')
+    table_3 = pd.DataFrame(table_3_rows, columns=('house_id', 'district', 'municipality', 'block', 'population', 'func_id', 'radius',
+            'transport')).set_index('house_id')
+    return table_1, table_2, table_3
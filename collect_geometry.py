@@ -49,6 +49,16 @@ def _execute_after(func: Callable[[], Any], log_text: str) -> threading.Thread:
     thread.start()
     return thread
 
+def _with_own_connection(conn: 'psycopg2.connection', connect: Optional[Callable[[], 'psycopg2.connection']],
+        func: Callable[['psycopg2.connection'], Any]) -> Any:
+    if connect is None:
+        return func(conn)
+    own_conn = connect()
+    try:
+        return func(own_conn)
+    finally:
+        own_conn.close()
+
 def _get_public_transport_internal(latitude: float, longitude: float, t: Union[int, List[int]], conn: 'psycopg2.connection',
         public_transport_endpoint: str, _city: str, timeout: int = 240) -> Union[Dict[str, Any], Dict[int, Dict[str, Any]]]:
     if isinstance(t, int):
@@ -210,7 +220,7 @@ def get_public_transport(latitude: float, longitude: float, t: int, conn: 'psyco
         public_transport_endpoint: str, city: Optional[str] = None, timeout: int = 20, raise_exceptions: bool = False,
         get_public_transport_internal: Callable[[float, float, Union[int, List[int]], 'psycopg2.connection', str, str, int],
                 Union[Dict[str, Any], Dict[int, Dict[str, Any]]]] = _get_public_transport_internal,
-        download_geometry_after_timeout: bool = False) -> Dict[str, Any]:
+        download_geometry_after_timeout: bool = False, connect: Optional[Callable[[], 'psycopg2.connection']] = None) -> Dict[str, Any]:
     latitude, longitude = round(latitude, 6), round(longitude, 6)
     with conn, conn.cursor() as cur:
         cur.execute('SELECT ST_AsGeoJSON(geometry) FROM transport WHERE latitude = %s AND longitude = %s AND time = %s', (latitude, longitude, t))
@@ -221,7 +231,8 @@ def get_public_transport(latitude: float, longitude: float, t: int, conn: 'psyco
         return get_public_transport_internal(latitude, longitude, t, conn, public_transport_endpoint, city or '', timeout) # type: ignore
     except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout) as ex:
         if download_geometry_after_timeout:
-            _execute_after(lambda: _get_public_transport_internal(latitude, longitude, t, conn, public_transport_endpoint, city or '', timeout * 20),
+            _execute_after(lambda: _with_own_connection(conn, connect, lambda bg_conn:
+                    _get_public_transport_internal(latitude, longitude, t, bg_conn, public_transport_endpoint, city or '', timeout * 20)),
                     f'public_transport_download ({latitude}, {longitude}, {t})')
         if raise_exceptions:
             raise TimeoutError(ex)
@@ -244,7 +255,7 @@ def get_personal_transport(latitude: float, longitude: float, t: int, conn: 'psy
         personal_transport_endpoint: str, city: Optional[str] = None, timeout: int = 20, raise_exceptions: bool = False,
         get_personal_transport_internal: Callable[[float, float, Union[int, List[int]], 'psycopg2.connection', str, str, int],
                 Union[Dict[str, Any], Dict[int, Dict[str, Any]]]] = _get_personal_transport_internal,
-        download_geometry_after_timeout: bool = False) -> Dict[str, Any]:
+        download_geometry_after_timeout: bool = False, connect: Optional[Callable[[], 'psycopg2.connection']] = None) -> Dict[str, Any]:
     latitude, longitude = round(latitude, 6), round(longitude, 6)
     with conn, conn.cursor() as cur:
         cur.execute('SELECT ST_AsGeoJSON(geometry) FROM car WHERE latitude = %s AND longitude = %s AND time = %s', (latitude, longitude, t))
@@ -256,7 +267,8 @@ def get_personal_transport(latitude: float, longitude: float, t: int, conn: 'psy
     except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout) as ex:
         if download_geometry_after_timeout:
             if download_geometry_after_timeout:
-                _execute_after(lambda: _get_personal_transport_internal(latitude, longitude, t, conn, personal_transport_endpoint, city or '', timeout * 20),
+                _execute_after(lambda: _with_own_connection(conn, connect, lambda bg_conn:
+                        _get_personal_transport_internal(latitude, longitude, t, bg_conn, personal_transport_endpoint, city or '', timeout * 20)),
                         f'personal_transport_download ({latitude}, {longitude}, {t})')
         if raise_exceptions:
             raise TimeoutError(ex)
@@ -277,7 +289,7 @@ def get_personal_transport(latitude: float, longitude: float, t: int, conn: 'psy
 
 def get_walking(latitude: float, longitude: float, t: int, conn: 'psycopg2.connection', walking_endpoint: str,
         city: Optional[str] = None, timeout: int = 20, multiple_times_allowed: bool = False, raise_exceptions: bool = False,
-        download_geometry_after_timeout: bool = False) -> Dict[str, Any]:
+        download_geometry_after_timeout: bool = False, connect: Optional[Callable[[], 'psycopg2.connection']] = None) -> Dict[str, Any]:
     latitude, longitude = round(latitude, 6), round(longitude, 6)
     with conn.cursor() as cur:
         cur.execute('SELECT ST_AsGeoJSON(geometry) FROM walking WHERE latitude = %s AND longitude = %s AND time = %s LIMIT 1', (latitude, longitude, t))
@@ -288,7 +300,8 @@ def get_walking(latitude: float, longitude: float, t: int, conn: 'psycopg2.conne
         return _get_walking_internal(latitude, longitude, t, conn, walking_endpoint, city or '', timeout, multiple_times_allowed) # type: ignore
     except (requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout) as ex:
         if download_geometry_after_timeout:
-            thread = threading.Thread(target=lambda: _get_walking_internal(latitude, longitude, t, conn, walking_endpoint, city or '', timeout * 20))
+            thread = threading.Thread(target=lambda: _with_own_connection(conn, connect, lambda bg_conn:
+                    _get_walking_internal(latitude, longitude, t, bg_conn, walking_endpoint, city or '', timeout * 20)))
             thread.start()
         if raise_exceptions:
             raise TimeoutError(ex)
@@ -310,7 +323,7 @@ def get_walking(latitude: float, longitude: float, t: int, conn: 'psycopg2.conne
         return json.loads(res[0])
 
 class CollectGeometry:
-    def __init__(self, conn: 'psycopg2.connection', public_transport_endpoint: str,
+    def __init__(self, conn: Union['psycopg2.connection', Callable[[], 'psycopg2.connection']], public_transport_endpoint: str,
             personal_transport_endpoint: str, walking_endpoint: str, walking_endpoint_allow_multiple_times: bool = False,
             timeout: int = 20, raise_exceptions: bool = False, download_geometry_after_timeout: bool = False,
             get_public_transport_func: Callable[
@@ -318,19 +331,22 @@ class CollectGeometry:
                         Callable[[float, float, Union[int, List[int]], 'psycopg2.connection', str, str, int],
                             Union[Dict[str, Any], Dict[int, Dict[str, Any]]]
                         ],
-                    bool],
+                    bool, Optional[Callable[[], 'psycopg2.connection']]],
                 Dict[str, Any]] = get_public_transport,
             get_personal_transport_func: Callable[
                     [float, float, int, 'psycopg2.connection', str, Optional[str], int, bool,
                         Callable[[float, float, Union[int, List[int]], 'psycopg2.connection', str, str, int],
                             Union[Dict[str, Any], Dict[int, Dict[str, Any]]]
                         ],
-                    bool],
+                    bool, Optional[Callable[[], 'psycopg2.connection']]],
                 Dict[str, Any]] = get_personal_transport,
-            get_walking_func: Callable[[float, float, int, 'psycopg2.connection', str, Optional[str], int, bool, bool, bool], Dict[str, Any]] = get_walking,
-            use_alternative_public_transport: bool = False, use_alternative_personal_transport: bool = False
+            get_walking_func: Callable[[float, float, int, 'psycopg2.connection', str, Optional[str], int, bool, bool, bool,
+                    Optional[Callable[[], 'psycopg2.connection']]], Dict[str, Any]] = get_walking,
+            use_alternative_public_transport: bool = False, use_alternative_personal_transport: bool = False,
+            connect: Optional[Callable[[], 'psycopg2.connection']] = None
         ):
-        self.conn = conn
+        self._conn = conn
+        self.connect = connect
         self.public_transport_endpoint = public_transport_endpoint
         self.personal_transport_endpoint = personal_transport_endpoint
         self.walking_endpoint = walking_endpoint
@@ -350,17 +366,26 @@ class CollectGeometry:
         else:
             self.personal_transport_internal = _get_personal_transport_internal # type: ignore
 
-    def get_walking(self, latitude: float, longitude: float, t: int, city: Optional[str] = None) -> Dict[str, Any]:
-        return self.get_walking_func(latitude, longitude, t, self.conn, self.walking_endpoint, city, self.timeout,
-                self.walking_endpoint_allow_multiple_times, self.raise_exceptions, self.download_geometry_after_timeout)
+    @property
+    def conn(self) -> 'psycopg2.connection':
+        if callable(self._conn):
+            return self._conn()
+        return self._conn
+
+    def get_walking(self, latitude: float, longitude: float, t: int, city: Optional[str] = None,
+            conn: Optional['psycopg2.connection'] = None) -> Dict[str, Any]:
+        return self.get_walking_func(latitude, longitude, t, conn or self.conn, self.walking_endpoint, city, self.timeout,
+                self.walking_endpoint_allow_multiple_times, self.raise_exceptions, self.download_geometry_after_timeout, self.connect)
 
-    def get_public_transport(self, latitude: float, longitude: float, t: int, city: Optional[str] = None) -> Dict[str, Any]:
-        return self.get_public_transport_func(latitude, longitude, t, self.conn, self.public_transport_endpoint,
-                city, self.timeout, self.raise_exceptions, self.public_transport_internal, self.download_geometry_after_timeout)
+    def get_public_transport(self, latitude: float, longitude: float, t: int, city: Optional[str] = None,
+            conn: Optional['psycopg2.connection'] = None) -> Dict[str, Any]:
+        return self.get_public_transport_func(latitude, longitude, t, conn or self.conn, self.public_transport_endpoint,
+                city, self.timeout, self.raise_exceptions, self.public_transport_internal, self.download_geometry_after_timeout, self.connect)
 
-    def get_personal_transport(self, latitude: float, longitude: float, t: int, city: Optional[str] = None) -> Dict[str, Any]:
-        return self.get_personal_transport_func(latitude, longitude, t, self.conn, self.personal_transport_endpoint,
-                city, self.timeout, self.raise_exceptions, self.personal_transport_internal, self.download_geometry_after_timeout)
+    def get_personal_transport(self, latitude: float, longitude: float, t: int, city: Optional[str] = None,
+            conn: Optional['psycopg2.connection'] = None) -> Dict[str, Any]:
+        return self.get_personal_transport_func(latitude, longitude, t, conn or self.conn, self.personal_transport_endpoint,
+                city, self.timeout, self.raise_exceptions, self.personal_transport_internal, self.download_geometry_after_timeout, self.connect)
 
 # walking_urbica = 'https://galton.urbica.co/api/foot/?lng={x}&lat={y}&radius=5&cellSize=0.1&intervals={t}'
 # walking_local = 'http://10.32.1.65:5000/mobility_analysis/isochrones?x_from={latitude}&y_from={longitude}&travel_type=walk&times={time}&city={city}'
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+from loguru import logger
+
+
+class PoolTimeout(Exception):
+    pass
+
+def gevent_wait_callback(conn: 'psycopg2.connection', timeout: Optional[float] = None) -> None:
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            break
+        elif state == psycopg2.extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f'Bad result from poll: {state!r}')
+
+def make_green() -> None:
+    psycopg2.extensions.set_wait_callback(gevent_wait_callback)
+
+class ConnectionPool:
+    def __init__(self, conn_string: str, max_size: int = 10, timeout: float = 10.0, check_interval: float = 30.0,
+            connect: Callable[[str], 'psycopg2.connection'] = psycopg2.connect):
+        if max_size < 1:
+            raise ValueError(f'max_size must be positive, but {max_size} is given')
+        self.conn_string = conn_string
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._connect = connect
+        self._idle: Deque[Tuple['psycopg2.connection', float]] = deque()
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def getconn(self, timeout: Optional[float] = None) -> 'psycopg2.connection':
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout('connection pool is closed')
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, 0.0
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f'no free database connection in {timeout}s (pool size is {self.max_size})')
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._close_quietly(conn)
+                with self._cond:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect(self.conn_string)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn: 'psycopg2.connection', discard: bool = False) -> None:
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error as ex:
+                    logger.warning(f'Rollback of a returned connection failed, discarding it: {ex!r}')
+                    discard = True
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._size -= 1
+                self._discarded += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator['psycopg2.connection']:
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            self.putconn(conn, discard=True)
+            raise
+        except Exception:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def _is_healthy(self, conn: 'psycopg2.connection', last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error as ex:
+            logger.warning(f'Pooled database connection failed health check: {ex!r}')
+            return False
+
+    @staticmethod
+    def _close_quietly(conn: 'psycopg2.connection') -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._size - len(self._idle),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'wait_time_total': round(self._wait_time_total, 6),
+                'wait_time_max': round(self._wait_time_max, 6),
+                'wait_time_mean': round(self._wait_time_total / self._checkouts, 6) if self._checkouts else 0.0
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
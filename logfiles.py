@@ -0,0 +1,101 @@
+import os
+import time
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+MAX_LINE_LENGTH = 1024 * 1024
+
+Part = Tuple[str, int, int]
+
+
+def read_parts(parts: List[Part], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    for path, start, end in parts:
+        with open(path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = file.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+def whole_parts(paths: List[str], sizes: List[int]) -> List[Part]:
+    return [(path, 0, size) for path, size in zip(paths, sizes)]
+
+def slice_parts(paths: List[str], sizes: List[int], start: int, stop: int) -> List[Part]:
+    parts: List[Part] = []
+    offset = 0
+    for path, size in zip(paths, sizes):
+        if offset + size > start and offset < stop:
+            parts.append((path, max(start - offset, 0), min(stop - offset, size)))
+        offset += size
+    return parts
+
+def tail_offset(path: str, lines: int, size: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Tuple[int, int]:
+    with open(path, 'rb') as file:
+        position = size if size is not None else file.seek(0, os.SEEK_END)
+        if position == 0 or lines <= 0:
+            return position, 0
+        file.seek(position - 1)
+        target = lines + (1 if file.read(1) == b'\n' else 0)
+        newlines = 0
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            file.seek(position)
+            chunk = file.read(read_size)
+            index = len(chunk)
+            while True:
+                index = chunk.rfind(b'\n', 0, index)
+                if index == -1:
+                    break
+                newlines += 1
+                if newlines == target:
+                    return position + index + 1, lines
+        return 0, newlines - target + lines + 1
+
+def tail_parts(paths: List[str], sizes: List[int], lines: int) -> List[Part]:
+    parts: List[Part] = []
+    for path, size in zip(reversed(paths), reversed(sizes)):
+        if lines <= 0:
+            break
+        offset, found = tail_offset(path, lines, size)
+        parts.insert(0, (path, offset, size))
+        lines -= found
+    return parts
+
+def _is_replaced(path: str, file: BinaryIO) -> bool:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return stat.st_ino != os.fstat(file.fileno()).st_ino or stat.st_size < file.tell()
+
+def follow(path: str, start: Optional[int] = None, poll_interval: float = 1.0, heartbeat: float = 15.0) -> Iterator[bytes]:
+    file = open(path, 'rb')
+    try:
+        file.seek(start if start is not None else 0, os.SEEK_SET if start is not None else os.SEEK_END)
+        pending = b''
+        last_sent = time.monotonic()
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if chunk:
+                *lines, pending = (pending + chunk).split(b'\n')
+                if len(pending) > MAX_LINE_LENGTH:
+                    lines.append(pending)
+                    pending = b''
+                for line in lines:
+                    yield b'data: ' + line.rstrip(b'\r') + b'\n\n'
+                last_sent = time.monotonic()
+                continue
+            if _is_replaced(path, file):
+                file.close()
+                file = open(path, 'rb')
+                continue
+            if time.monotonic() - last_sent >= heartbeat:
+                yield b': keep-alive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+    finally:
+        file.close()
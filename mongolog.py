@@ -1,16 +1,36 @@
 from pymongo import MongoClient, ASCENDING
-from typing import Dict, Any, Literal
+from pymongo.errors import BulkWriteError, InvalidDocument, OperationFailure
+from collections import deque
+from typing import Deque, Dict, Any, List, Literal
+import atexit
 import logging
 import datetime
+import threading
+import time
 
 class MongoHandler(logging.Handler):
-    def __init__(self, conn_string: str, component_name: str, level: Literal['CRITICAL', 'ERROR', 'WARNING', 'SUCCESS', 'INFO', 'DEBUG', 'TRACE']):
+    def __init__(self, conn_string: str, component_name: str, level: Literal['CRITICAL', 'ERROR', 'WARNING', 'SUCCESS', 'INFO', 'DEBUG', 'TRACE'],
+            queue_size: int = 10000, batch_size: int = 500, flush_interval: float = 1.0, retry_interval: float = 5.0):
         super().__init__(level)
         self.component = component_name
         self.client = MongoClient(conn_string)
         self.db = self.client.get_database('logs')
         self.logs = self.db.get_collection('logs')
-        # self.logs.ensure_index([("timestamp", ASCENDING)])
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._index_created = False
+        self.queued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+        self._writer = threading.Thread(target=self._write_loop, name='mongolog-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
 
     def emit(self, record: logging.LogRecord) -> None:
         entry: Dict[str, Any] = {
@@ -18,11 +38,89 @@ class MongoHandler(logging.Handler):
             'component': self.component,
             'level': record.levelname,
             'message': record.message,
-            'user': record.user,        # type: ignore 
+            'user': record.user,        # type: ignore
             'method': record.method,    # type: ignore
             'handler': record.handler,  # type: ignore
             'endpoint': record.endpoint # type: ignore
         }
         if isinstance(record.args, dict):
             entry.update(record.args)
-        self.logs.insert_one(entry)
\ No newline at end of file
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._queue) >= self.queue_size:
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(entry)
+            self.queued += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _ensure_index(self) -> None:
+        if not self._index_created:
+            try:
+                self.logs.create_index([('timestamp', ASCENDING)])
+            except OperationFailure:
+                pass
+            self._index_created = True
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            if len(self._queue) < self.batch_size and not self._closed:
+                self._cond.wait(self.flush_interval)
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _write_loop(self) -> None:
+        batch: List[Dict[str, Any]] = []
+        while True:
+            if not batch:
+                if self._closed and not self._queue:
+                    return
+                batch = self._take_batch()
+                if not batch:
+                    continue
+            try:
+                self._ensure_index()
+                self.logs.insert_many(batch, ordered=False)
+            except BulkWriteError as ex:
+                inserted = ex.details.get('nInserted', 0)
+                with self._cond:
+                    self.flushed += inserted
+                    self.dropped += len(batch) - inserted
+                batch = []
+            except InvalidDocument:
+                with self._cond:
+                    self.dropped += len(batch)
+                batch = []
+            except Exception:
+                with self._cond:
+                    self.failed_flushes += 1
+                    if self._closed:
+                        self.dropped += len(batch) + len(self._queue)
+                        self._queue.clear()
+                        return
+                time.sleep(self.retry_interval)
+            else:
+                with self._cond:
+                    self.flushed += len(batch)
+                batch = []
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'queue_length': len(self._queue),
+                'queued': self.queued,
+                'dropped': self.dropped,
+                'flushed': self.flushed,
+                'failed_flushes': self.failed_flushes
+            }
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._writer.join(timeout)
+        super().close()
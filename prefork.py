@@ -0,0 +1,156 @@
+import gc
+import os
+import signal
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import gevent
+import gevent.pywsgi
+from loguru import logger
+
+
+class PreforkServer:
+    def __init__(self, server: gevent.pywsgi.WSGIServer, workers: int, before_fork: Callable[[], None], after_fork: Callable[[], None],
+            reload: Callable[[], bool], message: Optional[Callable[[str], bool]] = None, stop_timeout: float = 30.0, check_interval: float = 0.5):
+        if workers < 1:
+            raise ValueError(f'workers must be positive, but {workers} is given')
+        self.server = server
+        self.workers = workers
+        self.stop_timeout = stop_timeout
+        self.check_interval = check_interval
+        self._before_fork = before_fork
+        self._after_fork = after_fork
+        self._reload = reload
+        self._message = message
+        self._reader = -1
+        self._writer = -1
+        self._received = b''
+        self.worker_number: Optional[int] = None
+        self._pids: Dict[int, int] = {}
+        self._retiring: Dict[int, float] = {}
+        self._watchers: List[Any] = []
+        self._reload_requested = False
+        self._stopping = False
+
+    def _spawn(self, number: int) -> None:
+        pid = os.fork()
+        if pid != 0:
+            self._pids[pid] = number
+            return
+        self.worker_number = number
+        os.close(self._reader)
+        for watcher in self._watchers:
+            watcher.cancel()
+        self._watchers = [gevent.signal_handler(signum, self.server.close) for signum in (signal.SIGTERM, signal.SIGINT)] \
+                + [gevent.signal_handler(signal.SIGHUP, lambda: None)]
+        self._after_fork()
+        logger.info(f'Worker {number} (pid {os.getpid()}) is serving requests')
+        self.server.serve_forever(self.stop_timeout)
+        logger.info(f'Worker {number} (pid {os.getpid()}) is stopped')
+        sys.exit(0)
+
+    def _spawn_all(self) -> None:
+        self._before_fork()
+        gc.collect()
+        gc.freeze()
+        for number in range(1, self.workers + 1):
+            self._spawn(number)
+
+    def restart(self) -> None:
+        previous = self._pids
+        self._pids = {}
+        gc.unfreeze()
+        self._spawn_all()
+        for pid in previous:
+            self._retiring[pid] = time.monotonic() + self.stop_timeout + 5
+            self._signal(pid, signal.SIGTERM)
+        logger.info(f'Workers are restarted with the current data (new pids: {", ".join(map(str, self._pids))})')
+
+    def _signal(self, pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._retiring.clear()
+                return
+            if pid == 0:
+                return
+            if pid in self._retiring:
+                del self._retiring[pid]
+            elif pid in self._pids:
+                number = self._pids.pop(pid)
+                if not self._stopping:
+                    logger.warning(f'Worker {number} (pid {pid}) exited with status {status}, starting a new one')
+                    self._before_fork()
+                    self._spawn(number)
+        for pid, deadline in list(self._retiring.items()):
+            if time.monotonic() > deadline:
+                logger.warning(f'Worker with pid {pid} did not stop in time, killing it')
+                self._signal(pid, signal.SIGKILL)
+
+    def notify(self, message: str) -> None:
+        try:
+            os.write(self._writer, message.encode() + b'\n')
+        except OSError as ex:
+            logger.warning(f'Worker {self.worker_number} could not send message "{message}" to the master: {ex!r}')
+
+    def _read_messages(self) -> bool:
+        while True:
+            try:
+                chunk = os.read(self._reader, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            self._received += chunk
+        *messages, self._received = self._received.split(b'\n')
+        restart_needed = False
+        for message in messages:
+            if self._message is not None and self._message(message.decode()):
+                restart_needed = True
+        return restart_needed
+
+    def _request_reload(self) -> None:
+        self._reload_requested = True
+
+    def _request_stop(self) -> None:
+        self._stopping = True
+
+    def serve(self, startup: Optional[Callable[[], bool]] = None) -> None:
+        self.server.init_socket()
+        self._reader, self._writer = os.pipe()
+        os.set_blocking(self._reader, False)
+        os.set_blocking(self._writer, False)
+        self._watchers = [gevent.signal_handler(signal.SIGHUP, self._request_reload), gevent.signal_handler(signal.SIGTERM, self._request_stop),
+                gevent.signal_handler(signal.SIGINT, self._request_stop)]
+        self._spawn_all()
+        logger.info(f'Started {self.workers} workers (pids: {", ".join(map(str, self._pids))}), send SIGHUP to pid {os.getpid()} to reload data')
+        if startup is not None and startup():
+            self.restart()
+        while not self._stopping:
+            if self._reload_requested:
+                self._reload_requested = False
+                if self._reload():
+                    self.restart()
+            if self._read_messages():
+                self.restart()
+            self._reap()
+            gevent.sleep(self.check_interval)
+        logger.info('Stopping workers')
+        self._retiring.update({pid: time.monotonic() + self.stop_timeout + 5 for pid in self._pids})
+        self._pids = {}
+        for pid in self._retiring:
+            self._signal(pid, signal.SIGTERM)
+        while self._retiring:
+            self._reap()
+            gevent.sleep(0.1)
+        self.server.close()
+        os.close(self._reader)
+        os.close(self._writer)
@@ -0,0 +1,118 @@
+import cProfile
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import greenlet
+
+TOP_FUNCTIONS = 40
+MAX_QUERIES = 500
+
+
+class RequestProfile:
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:16]
+        self.created_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.queries: List[Dict[str, Any]] = []
+        self.queries_count = 0
+        self.queries_time = 0.0
+        self._profiler = cProfile.Profile()
+        self._greenlet: Optional[greenlet.greenlet] = None
+        self._previous_tracer: Optional[Callable[[str, Tuple[greenlet.greenlet, greenlet.greenlet]], None]] = None
+        self._start_time = 0.0
+        self.duration = 0.0
+
+    def _trace(self, event: str, args: Tuple[greenlet.greenlet, greenlet.greenlet]) -> None:
+        if event in ('switch', 'throw'):
+            origin, target = args
+            if target is self._greenlet:
+                self._profiler.enable()
+            elif origin is self._greenlet:
+                self._profiler.disable()
+        if self._previous_tracer is not None:
+            self._previous_tracer(event, args)
+
+    def start(self) -> None:
+        self._greenlet = greenlet.getcurrent()
+        self._previous_tracer = greenlet.settrace(self._trace)
+        self._start_time = time.perf_counter()
+        self._profiler.enable()
+
+    def stop(self) -> None:
+        self._profiler.disable()
+        greenlet.settrace(self._previous_tracer)
+        self._greenlet = None
+        self.duration = time.perf_counter() - self._start_time
+
+    def add_query(self, query: Any, duration: float) -> None:
+        self.queries_count += 1
+        self.queries_time += duration
+        if len(self.queries) < MAX_QUERIES:
+            if isinstance(query, bytes):
+                query = query.decode(errors='replace')
+            self.queries.append({'query': str(query), 'duration': round(duration, 6)})
+
+    def functions(self, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self._profiler)
+        rows = []
+        for (filename, line, name), (primitive_calls, calls, total_time, cumulative_time, _) in stats.stats.items(): # type: ignore
+            rows.append({
+                'function': f'{filename}:{line}({name})',
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'total_time': round(total_time, 6),
+                'cumulative_time': round(cumulative_time, 6)
+            })
+        rows.sort(key=lambda row: row['cumulative_time'], reverse=True)
+        return rows[:limit]
+
+    def result(self, **request_info: Any) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'created_at': self.created_at,
+            **request_info,
+            'duration': round(self.duration, 6),
+            'queries_count': self.queries_count,
+            'queries_time': round(self.queries_time, 6),
+            'queries': sorted(self.queries, key=lambda query: query['duration'], reverse=True),
+            'functions': self.functions()
+        }
+
+class ProfileStore:
+    def __init__(self, max_size: int = 50):
+        self.max_size = max_size
+        self._profiles: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def begin(self) -> Optional[RequestProfile]:
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = RequestProfile()
+        profile.start()
+        return profile
+
+    def finish(self, profile: RequestProfile, **request_info: Any) -> Dict[str, Any]:
+        try:
+            profile.stop()
+        finally:
+            self._active.release()
+        result = profile.result(**request_info)
+        with self._lock:
+            self._profiles[profile.id] = result
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+        return result
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [{key: profile[key] for key in ('id', 'created_at', 'handler', 'path', 'status', 'duration', 'queries_count', 'queries_time')} \
+                for profile in reversed(profiles)]
@@ -0,0 +1,181 @@
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+AGGREGATION_TYPES = ('service_type', 'city_function', 'infrastructure')
+
+# cell columns are stored as sums, means are stored multiplied by their weight column, so every roll-up is a plain sum
+_SUM_COLUMNS = ('houses_count', 'services_count', 'services_load_sum', 'services_reserve_sum', 'houses_reserve_sum')
+_MEAN_COLUMNS = {
+    'services_load_mean': 'services_count',
+    'services_reserve_mean': 'services_count',
+    'services_evaluation': 'services_count',
+    'houses_reserve_mean': 'houses_count',
+    'houses_provision': 'houses_count'
+}
+_CELL_COLUMNS = _SUM_COLUMNS + tuple(_MEAN_COLUMNS)
+_SERVICES_COUNT = _CELL_COLUMNS.index('services_count')
+
+_RESULT_COLUMNS = ('houses_count', 'services_count', 'services_load_mean', 'services_load_sum', 'services_reserve_mean', 'services_reserve_sum',
+        'houses_reserve_mean', 'houses_reserve_sum', 'houses_provision', 'services_evaluation')
+
+ProsperityAggregation = NamedTuple('ProsperityAggregation', [
+    ('values', List[str]),
+    ('value_index', Dict[str, int]),
+    ('location_idx', np.ndarray),
+    ('value_idx', np.ndarray),
+    ('cells', np.ndarray),
+    ('significance', np.ndarray),
+    ('significance_mean', np.ndarray)
+])
+ProsperityCube = NamedTuple('ProsperityCube', [
+    ('location_column', str),
+    ('locations', List[Any]),
+    ('location_filters', Dict[str, Dict[Any, np.ndarray]]),
+    ('social_groups', List[str]),
+    ('social_group_index', Dict[str, int]),
+    ('aggregations', Dict[str, ProsperityAggregation])
+])
+
+empty_locations = np.array([], dtype=int)
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value != value
+
+def build_location_filters(location_column: str, locations: List[Any], blocks: pd.DataFrame,
+        city_hierarchy: pd.DataFrame) -> Dict[str, Dict[Any, np.ndarray]]:
+    index = {location: i for i, location in enumerate(locations)}
+    pairs: Dict[str, Iterable[Tuple[Any, Any]]]
+    if location_column == 'block':
+        pairs = {
+            'block': zip(blocks.index, blocks.index),
+            'municipality': zip(blocks['municipality'], blocks.index),
+            'district': zip(blocks['district'], blocks.index)
+        }
+    elif location_column == 'municipality':
+        pairs = {
+            'block': zip(blocks.index, blocks['municipality']),
+            'municipality': zip(locations, locations),
+            'district': zip(city_hierarchy['district'], city_hierarchy['municipality'])
+        }
+    else:
+        pairs = {
+            'block': zip(blocks.index, blocks['district']),
+            'municipality': zip(city_hierarchy['municipality'], city_hierarchy['district']),
+            'district': zip(locations, locations)
+        }
+    filters: Dict[str, Dict[Any, np.ndarray]] = {}
+    for filter_type, filter_pairs in pairs.items():
+        grouped: Dict[Any, List[int]] = {}
+        for key, location in filter_pairs:
+            if not _is_missing(key) and not _is_missing(location) and location in index:
+                grouped.setdefault(key, []).append(index[location])
+        filters[filter_type] = {key: np.unique(location_ids) for key, location_ids in grouped.items()}
+    return filters
+
+def build_prosperity_cube(provision: pd.DataFrame, location_column: str, infrastructure: pd.DataFrame, needs: pd.DataFrame,
+        blocks: pd.DataFrame, city_hierarchy: pd.DataFrame) -> ProsperityCube:
+    frame = provision.merge(infrastructure[['service_type', 'city_function', 'infrastructure']], how='inner', on='service_type')
+    frame = frame[frame[location_column].notna()].copy()
+    for column, weight in _MEAN_COLUMNS.items():
+        frame[column] = frame[column].astype(float) * frame[weight]
+    locations = sorted(frame[location_column].unique())
+    location_index = pd.Index(locations)
+
+    significances = needs[['service_type', 'social_group', 'significance']] \
+            .merge(infrastructure[['service_type', 'city_function', 'infrastructure']], how='inner', on='service_type')
+    significances['significance'] = significances['significance'].astype(float)
+    social_groups = sorted(significances['social_group'].unique())
+
+    aggregations: Dict[str, ProsperityAggregation] = {}
+    for aggregation_type in AGGREGATION_TYPES:
+        cells = frame.groupby([location_column, aggregation_type])[list(_CELL_COLUMNS)].sum()
+        values = sorted(frame[aggregation_type].unique())
+        value_index = pd.Index(values)
+        significance = significances.groupby([aggregation_type, 'social_group'])['significance'].mean().unstack() \
+                .reindex(index=values, columns=social_groups)
+        aggregations[aggregation_type] = ProsperityAggregation(
+            values,
+            {value: i for i, value in enumerate(values)},
+            location_index.get_indexer(cells.index.get_level_values(0)),
+            value_index.get_indexer(cells.index.get_level_values(1)),
+            cells.to_numpy(dtype=float),
+            significance.to_numpy(dtype=float),
+            significance.mean(axis=1).to_numpy(dtype=float)
+        )
+
+    return ProsperityCube(location_column, locations, build_location_filters(location_column, locations, blocks, city_hierarchy),
+            social_groups, {social_group: i for i, social_group in enumerate(social_groups)}, aggregations)
+
+def query_prosperity(cube: Optional[ProsperityCube], location_column: str, aggregation_type: str, locations: Optional[np.ndarray],
+        aggregation_value: Optional[str], social_group: Optional[str], provision_only: bool, location_mean: bool) -> pd.DataFrame:
+    keep_location = not location_mean
+    keep_value = aggregation_value != 'mean'
+    keep_social_group = not provision_only and social_group == 'all'
+    key_columns = [column for column, keep in ((location_column, keep_location), (aggregation_type, keep_value),
+            ('social_group', keep_social_group)) if keep]
+    result_columns = key_columns + list(_RESULT_COLUMNS) + ([] if provision_only else ['significance', 'prosperity'])
+    if cube is None:
+        return pd.DataFrame(columns=result_columns)
+    aggregation = cube.aggregations[aggregation_type]
+
+    mask = np.ones(aggregation.location_idx.shape[0], dtype=bool)
+    if locations is not None:
+        selected = np.zeros(len(cube.locations), dtype=bool)
+        selected[locations] = True
+        mask &= selected[aggregation.location_idx]
+    if aggregation_value not in ('all', 'mean'):
+        mask &= aggregation.value_idx == aggregation.value_index.get(aggregation_value, -1) # type: ignore
+    location_idx = aggregation.location_idx[mask]
+    value_idx = aggregation.value_idx[mask]
+    cells = aggregation.cells[mask]
+    social_group_idx = np.zeros(location_idx.shape[0], dtype=int)
+
+    if not provision_only:
+        if social_group == 'all':
+            cell_ids, social_group_idx = np.nonzero(~np.isnan(aggregation.significance[value_idx]))
+            significance = aggregation.significance[value_idx[cell_ids], social_group_idx]
+            location_idx, value_idx, cells = location_idx[cell_ids], value_idx[cell_ids], cells[cell_ids]
+        else:
+            if social_group == 'mean':
+                significance = aggregation.significance_mean[value_idx]
+            elif social_group in cube.social_group_index:
+                significance = aggregation.significance[value_idx, cube.social_group_index[social_group]] # type: ignore
+            else:
+                significance = np.full(value_idx.shape[0], np.nan)
+            defined = ~np.isnan(significance)
+            location_idx, value_idx, cells, significance = location_idx[defined], value_idx[defined], cells[defined], significance[defined]
+        cells = np.column_stack((cells, cells[:, _SERVICES_COUNT] * significance))
+
+    keys = np.zeros(location_idx.shape[0], dtype=np.int64)
+    sizes: List[int] = []
+    for idx, size, keep in ((location_idx, len(cube.locations), keep_location), (value_idx, len(aggregation.values), keep_value),
+            (social_group_idx, len(cube.social_groups), keep_social_group)):
+        if keep:
+            keys = keys * size + idx
+            sizes.append(size)
+    groups, inverse = np.unique(keys, return_inverse=True)
+    totals = np.zeros((groups.shape[0], cells.shape[1]))
+    np.add.at(totals, inverse, cells)
+
+    res = pd.DataFrame(totals[:, :len(_CELL_COLUMNS)], columns=_CELL_COLUMNS)
+    for column in _SUM_COLUMNS:
+        res[column] = res[column].round().astype(int)
+    for column, weight in _MEAN_COLUMNS.items():
+        res[column] = res[column] / res[weight].replace({0: 1})
+    if not provision_only:
+        res['significance'] = totals[:, -1] / res['services_count'].replace({0: 1})
+        res['prosperity'] = (10 + res['significance'] * (res['houses_provision'] - 10)).round(2)
+        res['significance'] = res['significance'].round(2)
+    for column in _MEAN_COLUMNS:
+        res[column] = res[column].round(2)
+
+    labels = {location_column: cube.locations, aggregation_type: aggregation.values, 'social_group': cube.social_groups}
+    key_values = []
+    for size in reversed(sizes):
+        groups, ids = np.divmod(groups, size)
+        key_values.append(ids)
+    for column, ids in zip(key_columns, reversed(key_values)):
+        res[column] = [labels[column][i] for i in ids]
+    return res[result_columns]
@@ -1,32 +1,130 @@
+from gevent import monkey
+
+monkey.patch_all()
+
+import hmac
 import itertools
 import os
+import signal
 import sys
+import threading
 import time
 import traceback
-from typing import Any, Callable, Dict, List, Literal, NamedTuple, Optional, Tuple, Union
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Literal, NamedTuple, Optional, Set, Tuple, Union
+from urllib.parse import urlencode
 
 import click
+import gevent.pool
 import numpy as np
 import pandas as pd
 import psycopg2
 import simplejson as json
-from flask import Flask, jsonify, make_response, request
+from flask import Flask, g, has_request_context, jsonify, make_response, request, stream_with_context
 from flask.wrappers import Response
 from flask_compress import Compress
 from loguru import logger
 
 import collect_geometry
+import db_pool
+import logfiles
+import metrics
+import prefork
+import profiling
+import prosperity
+import provision_engine
+import query_stream
+import snapshot
+import table_formats
 
 request_logger = logger.bind(request=True)
 
+metrics_registry = metrics.Registry()
+requests_total = metrics_registry.counter('provision_http_requests_total', 'Requests handled', ('handler', 'method', 'status'))
+requests_in_flight = metrics_registry.gauge('provision_http_requests_in_flight', 'Requests being handled at the moment', ('handler',))
+request_duration = metrics_registry.histogram('provision_http_request_duration_seconds',
+        'Time from the start of handling to the formed response (streamed bodies are not included)', ('handler',))
+request_stage_duration = metrics_registry.histogram('provision_http_request_stage_seconds',
+        'Time of a request spent in database queries, isochrone fetches and the rest of the handling (compute)', ('handler', 'stage'))
+request_db_queries = metrics_registry.histogram('provision_http_request_db_queries', 'Database queries executed by a request', ('handler',),
+        buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 1000))
+db_query_duration = metrics_registry.histogram('provision_db_query_duration_seconds', 'Database query execution time', ('handler',))
+isochrone_fetch_duration = metrics_registry.histogram('provision_isochrone_fetch_seconds', 'Public transport isochrone fetch time', ('handler',))
+cache_requests = metrics_registry.counter('provision_cache_requests_total', 'Lookups of lazily loaded data by result (hit or miss)',
+        ('cache', 'result'))
+
+def current_handler() -> str:
+    return g.get('handler', 'unknown') if has_request_context() else 'background'
+
+def record_db_query(duration: float, query: Any) -> None:
+    db_query_duration.observe(duration, current_handler())
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + duration
+        if g.get('profile') is not None:
+            g.profile.add_query(query, duration)
+
+db_cursor = metrics.cursor_factory(record_db_query)
+
+@contextmanager
+def isochrone_fetch() -> Iterator[None]:
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start_time
+        isochrone_fetch_duration.observe(duration, current_handler())
+        if has_request_context():
+            g.isochrones_time = g.get('isochrones_time', 0.0) + duration
+
+def record_request(handler: str, status_code: int, duration: float) -> None:
+    requests_total.inc(handler, request.method, str(status_code))
+    request_duration.observe(duration, handler)
+    request_db_queries.observe(g.get('db_queries', 0), handler)
+    db_time, isochrones_time = g.get('db_time', 0.0), g.get('isochrones_time', 0.0)
+    request_stage_duration.observe(db_time, handler, 'db')
+    request_stage_duration.observe(isochrones_time, handler, 'isochrones')
+    request_stage_duration.observe(max(duration - db_time - isochrones_time, 0.0), handler, 'compute')
+
+profile_store = profiling.ProfileStore()
+profile_token: Optional[str] = None
+profile_clients: List[str] = []
+
+def profiling_allowed() -> bool:
+    token = request.headers.get('X-Profile-Token')
+    if profile_token is not None and token is not None and hmac.compare_digest(token, profile_token):
+        return True
+    return request.remote_addr in profile_clients
+
+def profiling_requested() -> bool:
+    switch = request.args.get('_profile', request.headers.get('X-Profile', '0'))
+    return switch.lower() not in ('0', 'f', 'false', 'no') and profiling_allowed()
+
 def logged(func: Callable[..., Response]):
     def wrapper(*args, **nargs):
         with request_logger.contextualize(method=request.method, user=request.remote_addr, endpoint=request.path, handler=func.__name__):
             request_logger.info(f'query_params: {dict(request.args)}')
             start_time = time.time()
-            res: Response = func(*args, **nargs)
+            g.handler = func.__name__
+            requests_in_flight.inc(func.__name__)
+            profile = g.profile = profile_store.begin() if profiling_requested() else None
+            res: Optional[Response] = None
+            try:
+                res = func(*args, **nargs)
+            except Exception as ex:
+                res = app.make_response(app.handle_user_exception(ex))
+            finally:
+                requests_in_flight.dec(func.__name__)
+                if profile is not None:
+                    profile_store.finish(profile, handler=func.__name__, method=request.method, path=request.full_path,
+                            status=res.status_code if res is not None else 500)
             t = time.time() - start_time
-            if res.status_code != 200:
+            record_request(func.__name__, res.status_code, t)
+            if profile is not None:
+                res.headers['X-Profile-Location'] = f'/api/profiles/{profile.id}/'
+                request_logger.info(f'Request is profiled: /api/profiles/{profile.id}/')
+            if res.status_code not in (200, 202):
                 if res.status_code == 500:
                     request_logger.error(f'Fail({res.status_code}) - execution took {t * 1000:.3}ms')
                 elif 400 < res.status_code < 500:
@@ -49,32 +147,78 @@ class Properties:
         self.db_name = db_name
         self.db_user = db_user
         self.db_pass = db_pass
-        self._conn: Optional['psycopg2.connection'] = None
+        self._local = threading.local()
+        self.pool: Optional[db_pool.ConnectionPool] = None
 
     @property
     def conn_string(self) -> str:
         return f'host={self.db_addr} port={self.db_port} dbname={self.db_name}' \
                 f' user={self.db_user} password={self.db_pass} connect_timeout=5 application_name=provision_api'
 
+    def connect(self) -> 'psycopg2.connection':
+        return psycopg2.connect(self.conn_string, cursor_factory=db_cursor)
+
+    def init_pool(self, max_size: int, timeout: float) -> None:
+        self.pool = db_pool.ConnectionPool(self.conn_string, max_size, timeout, connect=lambda _: self.connect())
+
     @property
     def conn(self) -> 'psycopg2.connection':
-        if self._conn is None or self._conn.closed:
-            self._conn = psycopg2.connect(self.conn_string)
-        return self._conn
+        if self.pool is not None and has_request_context():
+            connections: Dict[Properties, 'psycopg2.connection'] = g.setdefault('db_connections', {})
+            if self not in connections:
+                connections[self] = self.pool.getconn()
+            return connections[self]
+        conn: Optional['psycopg2.connection'] = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    def reopen_pool(self) -> None:
+        if self.pool is not None:
+            self.init_pool(self.pool.max_size, self.pool.timeout)
+
+    def release_request_conn(self) -> None:
+        conn = g.get('db_connections', {}).pop(self, None)
+        if conn is not None:
+            self.pool.putconn(conn) # type: ignore
             
     def close(self):
-        if self._conn is not None:
-            self._conn.close()
+        if getattr(self._local, 'conn', None) is not None:
+            self._local.conn.close()
+        if self.pool is not None:
+            self.pool.close()
 
 houses_properties: Properties
 isochrones_properties: Properties
 
-needs: pd.DataFrame
-infrastructure: pd.DataFrame
-blocks: pd.DataFrame
-city_hierarchy: pd.DataFrame
-cities_service_types: Dict[str, Dict[str, int]]
-city_division_type: Dict[str, str]
+def db_pools_stats(*fields: str) -> Dict[Tuple[str, ...], float]:
+    stats: Dict[Tuple[str, ...], float] = {}
+    for pool_name, properties in (('houses', globals().get('houses_properties')), ('isochrones', globals().get('isochrones_properties'))):
+        if properties is not None and properties.pool is not None:
+            pool_stats = properties.pool.stats()
+            stats.update({(pool_name, field) if len(fields) > 1 else (pool_name,): pool_stats[field] for field in fields})
+    return stats
+
+metrics_registry.gauge('provision_db_pool_connections', 'Database pool connections by state', ('pool', 'state'),
+        collect=lambda: db_pools_stats('in_use', 'idle', 'waiting', 'max_size'))
+metrics_registry.counter('provision_db_pool_checkouts_total', 'Connections taken from the database pool', ('pool',),
+        collect=lambda: db_pools_stats('checkouts'))
+metrics_registry.counter('provision_db_pool_timeouts_total', 'Requests which did not get a database connection in time', ('pool',),
+        collect=lambda: db_pools_stats('timeouts'))
+metrics_registry.counter('provision_db_pool_wait_seconds_total', 'Time spent waiting for a database connection', ('pool',),
+        collect=lambda: db_pools_stats('wait_time_total'))
+
+mongo_handler: Optional[Any] = None
+
+def mongo_log_stats(*fields: str) -> Dict[Tuple[str, ...], float]:
+    if mongo_handler is None:
+        return {}
+    stats = mongo_handler.stats()
+    return {(field,) if len(fields) > 1 else (): stats[field] for field in fields}
+
+metrics_registry.counter('provision_mongo_log_records_total', 'Request log records written to MongoDB (flushed) or lost on overflow and errors (dropped)',
+        ('result',), collect=lambda: mongo_log_stats('flushed', 'dropped'))
+metrics_registry.gauge('provision_mongo_log_queue_length', 'Request log records waiting to be written to MongoDB', collect=lambda: mongo_log_stats('queue_length'))
 
 Listings = NamedTuple('Listings', [
     ('infrastructures', pd.DataFrame),
@@ -83,29 +227,394 @@ Listings = NamedTuple('Listings', [
     ('living_situations', pd.DataFrame),
     ('social_groups', pd.DataFrame)
 ])
-listings: Listings
 
-provision_administrative_units: Dict[str, pd.DataFrame] = {}
-provision_municipalities: Dict[str, pd.DataFrame] = {}
-provision_blocks: Dict[str, pd.DataFrame] = {}
+HierarchyTree = NamedTuple('HierarchyTree', [
+    ('districts', List[Dict[str, Any]]),
+    ('municipalities', List[Dict[str, Any]]),
+    ('districts_with_blocks', List[Dict[str, Any]]),
+    ('municipalities_with_blocks', List[Dict[str, Any]])
+])
+CityHierarchyIndex = NamedTuple('CityHierarchyIndex', [
+    ('full', HierarchyTree),
+    ('districts', Dict[str, HierarchyTree]),
+    ('municipalities', Dict[str, HierarchyTree])
+])
+empty_hierarchy_tree = HierarchyTree([], [], [], [])
+empty_city_hierarchy_index = CityHierarchyIndex(empty_hierarchy_tree, {}, {})
+HierarchyLookup = NamedTuple('HierarchyLookup', [
+    ('cities_by_id', Dict[int, str]),
+    ('city_ids', Dict[str, int]),
+    ('districts', Set[str]),
+    ('municipalities', Set[str])
+])
+
+CityData = NamedTuple('CityData', [
+    ('blocks', pd.DataFrame),
+    ('hierarchy_index', CityHierarchyIndex),
+    ('provision_administrative_units', pd.DataFrame),
+    ('provision_municipalities', pd.DataFrame),
+    ('provision_blocks', pd.DataFrame),
+    ('prosperity_cubes', Dict[str, prosperity.ProsperityCube])
+])
+snapshot_city_frames = ('blocks', 'provision_administrative_units', 'provision_municipalities', 'provision_blocks')
+
+class CitiesData:
+    def __init__(self, cities: List[str], loader: Callable[[str], CityData], on_load: Optional[Callable[[str], None]] = None):
+        self._loader = loader
+        self.on_load = on_load
+        self._data: Dict[str, CityData] = {}
+        self._locks = {city: threading.Lock() for city in cities}
+
+    def __contains__(self, city: str) -> bool:
+        return city in self._locks
+
+    def get(self, city: str) -> Optional[CityData]:
+        if city not in self._locks:
+            return None
+        cache_requests.inc('city_data', 'hit' if city in self._data else 'miss')
+        if city not in self._data:
+            with self._locks[city]:
+                if city not in self._data:
+                    start_time = time.time()
+                    self._data[city] = self._loader(city)
+                    logger.info(f'Data of city "{city}" is loaded in {time.time() - start_time:.2f}s')
+                    if self.on_load is not None:
+                        self.on_load(city)
+        return self._data[city]
+
+    def replace(self, city: str, city_data: CityData) -> None:
+        with self._locks[city]:
+            self._data[city] = city_data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._locks)
+
+    def loaded(self) -> List[str]:
+        return sorted(self._data)
+
+ServiceTypeData = NamedTuple('ServiceTypeData', [
+    ('accessibility', provision_engine.Accessibility),
+    ('normative', Dict[str, Any]),
+    ('baseline', provision_engine.Evaluation)
+])
+
+Calculation = NamedTuple('Calculation', [
+    ('normative', Dict[str, Any]),
+    ('houses', pd.DataFrame),
+    ('services', pd.DataFrame)
+])
+
+class AccessibilityData:
+    def __init__(self, houses_loader: Callable[[str], pd.DataFrame],
+            loader: Callable[[str, str, pd.DataFrame], Optional[ServiceTypeData]]):
+        self._houses_loader = houses_loader
+        self._loader = loader
+        self._houses: Dict[str, pd.DataFrame] = {}
+        self._data: Dict[Tuple[str, str], Optional[ServiceTypeData]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._calculations: 'OrderedDict[Tuple[Any, ...], Calculation]' = OrderedDict()
+        self._radius_accessibility: 'OrderedDict[Tuple[str, str, float], provision_engine.Accessibility]' = OrderedDict()
+        self._calculations_lock = threading.Lock()
+
+    def get(self, city: str, service_type: str) -> Optional[ServiceTypeData]:
+        key = (city, service_type)
+        cache_requests.inc('accessibility', 'hit' if key in self._data else 'miss')
+        if key not in self._data:
+            with self._lock:
+                lock = self._locks.setdefault(city, threading.Lock())
+            with lock:
+                if key not in self._data:
+                    start_time = time.time()
+                    if city not in self._houses:
+                        self._houses[city] = self._houses_loader(city)
+                    self._data[key] = self._loader(city, service_type, self._houses[city])
+                    logger.info(f'Accessibility of service type "{service_type}" in city "{city}" is loaded in {time.time() - start_time:.2f}s')
+        return self._data[key]
+
+    def loaded(self) -> List[str]:
+        return sorted(f'{city}: {service_type}' for city, service_type in self._data)
+
+    def _accessibility_of(self, city: str, service_type: str, service_type_data: ServiceTypeData,
+            normative: Dict[str, Any]) -> provision_engine.Accessibility:
+        if normative['public_transport_time'] or normative['radius_meters'] == service_type_data.normative['radius_meters']:
+            return service_type_data.accessibility
+        key = (city, service_type, normative['radius_meters'])
+        with self._calculations_lock:
+            accessibility = self._radius_accessibility.get(key)
+            if accessibility is not None:
+                self._radius_accessibility.move_to_end(key)
+                return accessibility
+        accessibility = provision_engine.accessibility_by_radius(service_type_data.accessibility, normative['radius_meters'])
+        with self._calculations_lock:
+            self._radius_accessibility[key] = accessibility
+            while len(self._radius_accessibility) > engine_cache_size:
+                self._radius_accessibility.popitem(last=False)
+        return accessibility
+
+    def calculate(self, city: str, service_type: str, overrides: Dict[str, Any]) -> Optional[Tuple[Calculation, bool]]:
+        service_type_data = self.get(city, service_type)
+        if service_type_data is None:
+            return None
+        normative = {**service_type_data.normative, **overrides}
+        if 'radius_meters' in overrides:
+            normative['public_transport_time'] = None
+        key = (city, service_type) + tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in sorted(normative.items()))
+        with self._calculations_lock:
+            calculation = self._calculations.get(key)
+            if calculation is not None:
+                self._calculations.move_to_end(key)
+        cache_requests.inc('provision_engine', 'hit' if calculation is not None else 'miss')
+        if calculation is not None:
+            return calculation, True
+        start_time = time.time()
+        accessibility = self._accessibility_of(city, service_type, service_type_data, normative)
+        evaluation = provision_engine.evaluate(accessibility, normative)
+        calculation = Calculation(normative,
+                accessibility.houses[['district', 'municipality', 'block', 'population', 'longitude', 'latitude']]
+                        .join(provision_engine.houses_frame(accessibility, evaluation, normative)),
+                accessibility.services[['district', 'municipality', 'block', 'longitude', 'latitude']]
+                        .join(provision_engine.services_frame(accessibility, evaluation, normative)))
+        with self._calculations_lock:
+            self._calculations[key] = calculation
+            while len(self._calculations) > engine_cache_size:
+                self._calculations.popitem(last=False)
+        logger.debug(f'Provision of service type "{service_type}" in city "{city}" is calculated in {time.time() - start_time:.2f}s')
+        return calculation, False
+
+GlobalData = NamedTuple('GlobalData', [
+    ('generation', int),
+    ('default_city', str),
+    ('needs', pd.DataFrame),
+    ('infrastructure', pd.DataFrame),
+    ('listings', Listings),
+    ('city_hierarchy', pd.DataFrame),
+    ('hierarchy_lookup', HierarchyLookup),
+    ('cities_service_types', Dict[str, Dict[str, int]]),
+    ('city_division_type', Dict[str, str]),
+    ('cities', CitiesData),
+    ('accessibility', AccessibilityData),
+    ('cities_codes', Dict[str, str]),
+    ('source', str)
+])
+global_data: GlobalData
+preload_default_city: bool = False
+db_json: bool = False
+max_batch_size = 1000
+zones_concurrency = 4
+engine_cache_size = 32
+snapshot_path: Optional[str] = None
+master_pid: Optional[int] = None
+snapshot_lock = threading.Lock()
+prefork_server: Optional[prefork.PreforkServer] = None
+deferred_city_loads: Optional[List[Tuple[GlobalData, str, Optional[snapshot.Snapshot]]]] = None
+reload_jobs: Dict[int, Dict[str, Any]] = {}
+reload_jobs_lock = threading.Lock()
 
-default_city: str = ''
 collect_geom: collect_geometry.CollectGeometry
-cities_codes: Dict[str, str]
-
-def update_global_data() -> None:
-    global needs
-    global infrastructure
-    global listings
-    global blocks
-    global city_hierarchy
-    global provision_administrative_units
-    global provision_municipalities
-    global provision_blocks
-    global cities_service_types
-    global city_division_type
-    global cities_codes
 
+def _is_missing(value: Any) -> bool:
+    return value is None or value != value
+
+def _hierarchy_units(rows: List[Tuple[Any, ...]], columns: Tuple[int, int, int], unique: bool) -> List[Dict[str, Any]]:
+    units: List[Dict[str, Any]] = []
+    seen = set()
+    for row in rows:
+        unit = (row[columns[0]], row[columns[1]], row[columns[2]])
+        if unique:
+            if any(map(_is_missing, unit)) or unit in seen:
+                continue
+            seen.add(unit)
+        units.append({'id': unit[0], 'name': unit[1], 'population': unit[2]})
+    return units
+
+def _build_hierarchy_tree(rows: List[Tuple[Any, ...]], division_type: Optional[str], blocks_by_municipality: Dict[str, List[Dict[str, Any]]],
+        blocks_by_district: Dict[str, List[Dict[str, Any]]], include_blocks: bool) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    # rows are (municipality_id, municipality, municipality_population, district_id, district, district_population)
+    municipality_columns, district_columns = (0, 1, 2), (3, 4, 5)
+    if division_type == 'ADMIN_UNIT_PARENT':
+        districts = _hierarchy_units(rows, district_columns, True)
+        for district in districts:
+            district['municipalities'] = _hierarchy_units([row for row in rows if row[3] == district['id']], municipality_columns, False)
+        municipalities = _hierarchy_units([row for row in rows if _is_missing(row[3])], municipality_columns, True)
+        if include_blocks:
+            for municipality in itertools.chain(itertools.chain.from_iterable(district['municipalities'] for district in districts), municipalities):
+                municipality['blocks'] = blocks_by_municipality.get(municipality['name'], [])
+    elif division_type == 'MUNICIPALITY_PARENT':
+        municipalities = _hierarchy_units(rows, municipality_columns, True)
+        for municipality in municipalities:
+            municipality['districts'] = _hierarchy_units([row for row in rows if row[0] == municipality['id']], district_columns, False)
+        districts = _hierarchy_units([row for row in rows if _is_missing(row[0])], district_columns, True)
+        if include_blocks:
+            for district in itertools.chain(itertools.chain.from_iterable(municipality['districts'] for municipality in municipalities), districts):
+                district['blocks'] = blocks_by_district.get(district['name'], [])
+    else:
+        districts = _hierarchy_units([row for row in rows if _is_missing(row[0])], district_columns, True)
+        municipalities = _hierarchy_units([row for row in rows if _is_missing(row[3])], municipality_columns, True)
+        if include_blocks:
+            for municipality in municipalities:
+                municipality['blocks'] = blocks_by_municipality.get(municipality['name'], [])
+            for district in districts:
+                district['blocks'] = blocks_by_district.get(district['name'], [])
+    return districts, municipalities
+
+def build_city_hierarchy_index(city_hierarchy: pd.DataFrame, blocks: pd.DataFrame, city_division_type: Dict[str, str]) -> Dict[str, CityHierarchyIndex]:
+    blocks_by_municipality: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    blocks_by_district: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for block_id, population, municipality, district, city in blocks[['population', 'municipality', 'district', 'city']].itertuples():
+        block = {'id': block_id, 'population': population}
+        if not _is_missing(municipality):
+            blocks_by_municipality.setdefault(city, {}).setdefault(municipality, []).append(block)
+        if not _is_missing(district):
+            blocks_by_district.setdefault(city, {}).setdefault(district, []).append(block)
+
+    rows_by_city: Dict[str, List[Tuple[Any, ...]]] = {}
+    for city, *row in city_hierarchy[['city', 'municipality_id', 'municipality', 'municipality_population',
+            'district_id', 'district', 'district_population']].itertuples(index=False):
+        rows_by_city.setdefault(city, []).append(tuple(row))
+
+    def build_tree(rows: List[Tuple[Any, ...]], city: str) -> HierarchyTree:
+        args = (rows, city_division_type.get(city), blocks_by_municipality.get(city, {}), blocks_by_district.get(city, {}))
+        return HierarchyTree(*_build_hierarchy_tree(*args, include_blocks=False), *_build_hierarchy_tree(*args, include_blocks=True))
+
+    index: Dict[str, CityHierarchyIndex] = {}
+    for city, rows in rows_by_city.items():
+        rows_by_district: Dict[str, List[Tuple[Any, ...]]] = {}
+        rows_by_municipality: Dict[str, List[Tuple[Any, ...]]] = {}
+        for row in rows:
+            if not _is_missing(row[4]):
+                rows_by_district.setdefault(row[4], []).append(row)
+            if not _is_missing(row[1]):
+                rows_by_municipality.setdefault(row[1], []).append(row)
+        index[city] = CityHierarchyIndex(
+            build_tree(rows, city),
+            {district: build_tree(district_rows, city) for district, district_rows in rows_by_district.items()},
+            {municipality: build_tree(municipality_rows, city) for municipality, municipality_rows in rows_by_municipality.items()}
+        )
+    return index
+
+def build_hierarchy_lookup(city_hierarchy: pd.DataFrame) -> HierarchyLookup:
+    cities = city_hierarchy[['city_id', 'city']].drop_duplicates('city')
+    return HierarchyLookup(
+        {int(city_id): city for city_id, city in cities.itertuples(index=False)},
+        {city: int(city_id) for city_id, city in cities.itertuples(index=False)},
+        {district for district in city_hierarchy['district'].unique() if not _is_missing(district)},
+        {municipality for municipality in city_hierarchy['municipality'].unique() if not _is_missing(municipality)}
+    )
+
+def load_city_data(city: str, needs: pd.DataFrame, infrastructure: pd.DataFrame, city_hierarchy: pd.DataFrame,
+        city_division_type: Dict[str, str], snapshot_file: Optional[snapshot.Snapshot] = None) -> CityData:
+    if snapshot_file is not None and f'cities/{city}/blocks' in snapshot_file:
+        blocks, provision_administrative_units, provision_municipalities, provision_blocks = \
+                (snapshot_file.frame(f'cities/{city}/{name}') for name in snapshot_city_frames)
+        return build_city_data(city, blocks, provision_administrative_units, provision_municipalities, provision_blocks,
+                needs, infrastructure, city_hierarchy, city_division_type)
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT b.id, b.population, m.name as municipality, au.name as district, c.name as city FROM blocks b'
+                '   LEFT JOIN municipalities m ON st_within(b.center, m.geometry)'
+                '   LEFT JOIN administrative_units au ON au.id = m.admin_unit_parent_id'
+                '   JOIN cities c ON b.city_id = c.id'
+                ' WHERE c.name = %s'
+                ' ORDER BY 4, 3, 1',
+                (city,))
+        blocks = pd.DataFrame(cur.fetchall(), columns=('id', 'population', 'municipality', 'district', 'city')).set_index('id')
+        blocks['population'] = blocks['population'].replace({np.nan: None})
+
+        cur.execute('SELECT loc.name, st.name, houses.count, prov.count, prov.service_load_mean, prov.service_load_sum,'
+                '   houses.provision_mean, prov.evaluation_mean, prov.reserve_resources_mean, prov.reserve_resources_sum,'
+                '   houses.reserve_resources_mean, houses.reserve_resources_sum'
+                ' FROM provision.services_administrative_units prov'
+                '   JOIN provision.houses_administrative_units houses ON'
+                '       houses.city_service_type_id = prov.city_service_type_id and houses.administrative_unit_id = prov.administrative_unit_id'
+                '   JOIN administrative_units loc ON prov.administrative_unit_id = loc.id'
+                '   JOIN city_service_types st ON prov.city_service_type_id = st.id'
+                ' WHERE loc.city_id = (SELECT id from cities WHERE name = %s)'
+                ' ORDER BY 1, 2',
+                (city,)
+        )
+        provision_administrative_units = pd.DataFrame(cur.fetchall(), columns=('district', 'service_type', 'houses_count', 'services_count',
+                'services_load_mean', 'services_load_sum', 'houses_provision', 'services_evaluation', 'services_reserve_mean', 'services_reserve_sum',
+                'houses_reserve_mean', 'houses_reserve_sum'))
+
+        cur.execute('SELECT loc.name, st.name, houses.count, eval.count, eval.service_load_mean, eval.service_load_sum,'
+                '   houses.provision_mean, eval.evaluation_mean, eval.reserve_resources_mean, eval.reserve_resources_sum,'
+                '   houses.reserve_resources_mean, houses.reserve_resources_sum'
+                ' FROM provision.services_municipalities eval'
+                '   JOIN provision.houses_municipalities houses ON'
+                '       houses.city_service_type_id = eval.city_service_type_id and houses.municipality_id = eval.municipality_id'
+                '   JOIN municipalities loc ON eval.municipality_id = loc.id'
+                '   JOIN city_service_types st ON eval.city_service_type_id = st.id'
+                ' WHERE loc.city_id = (SELECT id from cities WHERE name = %s)'
+                ' ORDER BY 1, 2',
+                (city,)
+        )
+        provision_municipalities = pd.DataFrame(cur.fetchall(), columns=('municipality', 'service_type', 'houses_count', 'services_count',
+                'services_load_mean', 'services_load_sum', 'houses_provision', 'services_evaluation', 'services_reserve_mean',
+                'services_reserve_sum', 'houses_reserve_mean', 'houses_reserve_sum'))
+
+        cur.execute('SELECT eval.block_id, s.name, houses.count, eval.count, eval.service_load_mean, eval.service_load_sum,'
+                '   houses.provision_mean, eval.evaluation_mean, eval.reserve_resources_mean, eval.reserve_resources_sum,'
+                '   houses.reserve_resources_mean, houses.reserve_resources_sum'
+                ' FROM provision.services_blocks eval'
+                '   JOIN blocks b ON eval.block_id = b.id'
+                '   JOIN provision.houses_blocks houses ON houses.city_service_type_id = eval.city_service_type_id and houses.block_id = eval.block_id'
+                '   JOIN city_service_types s ON eval.city_service_type_id = s.id'
+                ' WHERE b.city_id = (SELECT id from cities WHERE name = %s)'
+                ' ORDER BY 1, 2',
+                (city,)
+        )
+        provision_blocks = pd.DataFrame(cur.fetchall(), columns=('block', 'service_type', 'houses_count', 'services_count', 'services_load_mean',
+                'services_load_sum', 'houses_provision', 'services_evaluation', 'services_reserve_mean', 'services_reserve_sum',
+                'houses_reserve_mean', 'houses_reserve_sum'))
+    return build_city_data(city, blocks, provision_administrative_units, provision_municipalities, provision_blocks,
+            needs, infrastructure, city_hierarchy, city_division_type)
+
+def build_city_data(city: str, blocks: pd.DataFrame, provision_administrative_units: pd.DataFrame, provision_municipalities: pd.DataFrame,
+        provision_blocks: pd.DataFrame, needs: pd.DataFrame, infrastructure: pd.DataFrame, city_hierarchy: pd.DataFrame,
+        city_division_type: Dict[str, str]) -> CityData:
+    hierarchy_index = build_city_hierarchy_index(city_hierarchy, blocks, city_division_type).get(city, empty_city_hierarchy_index)
+    prosperity_cubes = {
+        location_type: prosperity.build_prosperity_cube(provision, location_column, infrastructure, needs, blocks, city_hierarchy)
+        for location_type, location_column, provision in (('districts', 'district', provision_administrative_units),
+                ('municipalities', 'municipality', provision_municipalities), ('blocks', 'block', provision_blocks))
+    }
+    return CityData(blocks, hierarchy_index, provision_administrative_units, provision_municipalities, provision_blocks, prosperity_cubes)
+
+def load_city_houses(city: str) -> pd.DataFrame:
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT functional_object_id, administrative_unit, municipality, block_id, coalesce(resident_number, 0),'
+                '   ST_X(center), ST_Y(center)'
+                ' FROM houses WHERE city = %s ORDER BY 1', (city,))
+        houses = pd.DataFrame(cur.fetchall(), columns=('house_id', 'district', 'municipality', 'block', 'population', 'longitude', 'latitude')) \
+                .set_index('house_id')
+    houses['block'] = houses['block'].astype('Int64')
+    return houses
+
+def load_service_type_data(city: str, service_type: str, houses: pd.DataFrame) -> Optional[ServiceTypeData]:
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT n.normative, n.max_load, n.radius_meters, n.public_transport_time, n.service_evaluation, n.house_evaluation'
+                ' FROM provision.normatives n'
+                '   JOIN city_service_types st ON n.city_service_type_id = st.id'
+                ' WHERE st.name = %s', (service_type,))
+        res = cur.fetchone()
+        if res is None:
+            return None
+        normative = dict(zip(('normative', 'max_load', 'radius_meters', 'public_transport_time', 'service_evaluation', 'house_evaluation'), res))
+        normative['service_evaluation'] = normative['service_evaluation'] or []
+        normative['house_evaluation'] = normative['house_evaluation'] or []
+        cur.execute('SELECT functional_object_id, administrative_unit, municipality, block_id, ST_X(center), ST_Y(center) FROM all_services'
+                ' WHERE city = %s AND city_service_type = %s ORDER BY 1', (city, service_type))
+        services = pd.DataFrame(cur.fetchall(), columns=('service_id', 'district', 'municipality', 'block', 'longitude', 'latitude')) \
+                .set_index('service_id')
+        services['block'] = services['block'].astype('Int64')
+        cur.execute('SELECT hs.house_id, hs.service_id FROM provision.houses_services hs'
+                '   JOIN all_services a ON hs.service_id = a.functional_object_id'
+                ' WHERE a.city = %s AND a.city_service_type = %s', (city, service_type))
+        pairs = pd.DataFrame(cur.fetchall(), columns=('house_id', 'service_id'))
+    accessibility = provision_engine.build_accessibility(houses, services, pairs)
+    return ServiceTypeData(accessibility, normative, provision_engine.evaluate(accessibility, normative))
+
+def load_global_data(generation: int, default_city: str) -> GlobalData:
     cities_codes = {
         'Санкт-Петербург': 'Saint_Petersburg',
         'Краснодар': 'Krasnodar',
@@ -134,7 +643,7 @@ def update_global_data() -> None:
         needs = needs.merge(tmp, on=['social_group', 'service_type'], how='inner')
 
         cur.execute('SELECT city, city_service_type, count(*) FROM all_services GROUP BY city, city_service_type')
-        cities_service_types = {}
+        cities_service_types: Dict[str, Dict[str, int]] = {}
         for city, service_type, count in cur.fetchall():
             if city not in cities_service_types:
                 cities_service_types[city] = {}
@@ -162,62 +671,6 @@ def update_global_data() -> None:
                 'municipality_population', 'district_id', 'district', 'district_population'))
         city_hierarchy = city_hierarchy.replace({np.nan: None})
 
-        cur.execute('SELECT b.id, b.population, m.name as municipality, au.name as district, c.name as city FROM blocks b'
-                '   LEFT JOIN municipalities m ON st_within(b.center, m.geometry)'
-                '   LEFT JOIN administrative_units au ON au.id = m.admin_unit_parent_id'
-                '   JOIN cities c ON b.city_id = c.id'
-                ' ORDER BY 4, 3, 1')
-        blocks = pd.DataFrame(cur.fetchall(), columns=('id', 'population', 'municipality', 'district', 'city')).set_index('id')
-        blocks['population'] = blocks['population'].replace({np.nan: None})
-
-        for city in city_hierarchy['city'].unique():
-            cur.execute('SELECT loc.name, st.name, houses.count, prov.count, prov.service_load_mean, prov.service_load_sum,'
-                    '   houses.provision_mean, prov.evaluation_mean, prov.reserve_resources_mean, prov.reserve_resources_sum,'
-                    '   houses.reserve_resources_mean, houses.reserve_resources_sum'
-                    ' FROM provision.services_administrative_units prov'
-                    '   JOIN provision.houses_administrative_units houses ON'
-                    '       houses.city_service_type_id = prov.city_service_type_id and houses.administrative_unit_id = prov.administrative_unit_id'
-                    '   JOIN administrative_units loc ON prov.administrative_unit_id = loc.id'
-                    '   JOIN city_service_types st ON prov.city_service_type_id = st.id'
-                    ' WHERE loc.city_id = (SELECT id from cities WHERE name = %s)'
-                    ' ORDER BY 1, 2',
-                    (city,)
-            )
-            provision_administrative_units[city] = pd.DataFrame(cur.fetchall(), columns=('district', 'service_type', 'houses_count', 'services_count',
-                    'services_load_mean', 'services_load_sum', 'houses_provision', 'services_evaluation', 'services_reserve_mean', 'services_reserve_sum',
-                    'houses_reserve_mean', 'houses_reserve_sum'))
-
-            cur.execute('SELECT loc.name, st.name, houses.count, eval.count, eval.service_load_mean, eval.service_load_sum,'
-                    '   houses.provision_mean, eval.evaluation_mean, eval.reserve_resources_mean, eval.reserve_resources_sum,'
-                    '   houses.reserve_resources_mean, houses.reserve_resources_sum'
-                    ' FROM provision.services_municipalities eval'
-                    '   JOIN provision.houses_municipalities houses ON'
-                    '       houses.city_service_type_id = eval.city_service_type_id and houses.municipality_id = eval.municipality_id'
-                    '   JOIN municipalities loc ON eval.municipality_id = loc.id'
-                    '   JOIN city_service_types st ON eval.city_service_type_id = st.id'
-                    ' WHERE loc.city_id = (SELECT id from cities WHERE name = %s)'
-                    ' ORDER BY 1, 2',
-                    (city,)
-            )
-            provision_municipalities[city] = pd.DataFrame(cur.fetchall(), columns=('municipality', 'service_type', 'houses_count', 'services_count',
-                    'services_load_mean', 'services_load_sum', 'houses_provision', 'services_evaluation', 'services_reserve_mean',
-                    'services_reserve_sum', 'houses_reserve_mean', 'houses_reserve_sum'))
-
-            cur.execute('SELECT eval.block_id, s.name, houses.count, eval.count, eval.service_load_mean, eval.service_load_sum,'
-                    '   houses.provision_mean, eval.evaluation_mean, eval.reserve_resources_mean, eval.reserve_resources_sum,'
-                    '   houses.reserve_resources_mean, houses.reserve_resources_sum'
-                    ' FROM provision.services_blocks eval'
-                    '   JOIN blocks b ON eval.block_id = b.id'
-                    '   JOIN provision.houses_blocks houses ON houses.city_service_type_id = eval.city_service_type_id and houses.block_id = eval.block_id'
-                    '   JOIN city_service_types s ON eval.city_service_type_id = s.id'
-                    ' WHERE b.city_id = (SELECT id from cities WHERE name = %s)'
-                    ' ORDER BY 1, 2',
-                    (city,)
-            )
-            provision_blocks[city] = pd.DataFrame(cur.fetchall(), columns=('block', 'service_type', 'houses_count', 'services_count', 'services_load_mean',
-                    'services_load_sum', 'houses_provision', 'services_evaluation', 'services_reserve_mean', 'services_reserve_sum',
-                    'houses_reserve_mean', 'houses_reserve_sum'))
-
         cur.execute('SELECT name, city_division_type FROM cities')
         city_division_type = {city_name: division_type for city_name, division_type in cur.fetchall()}
 
@@ -232,7 +685,143 @@ def update_global_data() -> None:
         cur.execute('SELECT id, name, code FROM city_service_types ORDER BY name')
         service_types = pd.DataFrame(cur.fetchall(), columns=('id', 'name', 'code'))
         listings = Listings(infrastructures, city_functions, service_types, living_situations, social_groups)
-    # blocks['population'] = blocks['population'].fillna(-1).astype(int)
+    cities = CitiesData(list(city_hierarchy['city'].unique()),
+            lambda city: load_city_data(city, needs, infrastructure, city_hierarchy[city_hierarchy['city'] == city], city_division_type))
+    data = GlobalData(generation, default_city, needs, infrastructure, listings, city_hierarchy, build_hierarchy_lookup(city_hierarchy),
+            cities_service_types, city_division_type, cities, AccessibilityData(load_city_houses, load_service_type_data), cities_codes, 'database')
+    cities.on_load = lambda city: city_loaded(data, city)
+    return data
+
+def load_global_data_from_snapshot(snapshot_file: snapshot.Snapshot, generation: int, default_city: str) -> GlobalData:
+    needs, infrastructure, city_hierarchy = (snapshot_file.frame(name) for name in ('needs', 'infrastructure', 'city_hierarchy'))
+    listings = Listings(*(snapshot_file.frame(f'listings/{name}') for name in Listings._fields))
+    city_division_type: Dict[str, str] = snapshot_file.values['city_division_type']
+    cities = CitiesData(list(city_hierarchy['city'].unique()),
+            lambda city: load_city_data(city, needs, infrastructure, city_hierarchy[city_hierarchy['city'] == city], city_division_type, snapshot_file))
+    data = GlobalData(generation, default_city, needs, infrastructure, listings, city_hierarchy, build_hierarchy_lookup(city_hierarchy),
+            snapshot_file.values['cities_service_types'],
+            city_division_type, cities, AccessibilityData(load_city_houses, load_service_type_data),
+            snapshot_file.values['cities_codes'], f'snapshot {snapshot_file.path} ({snapshot_file.created_at})')
+    cities.on_load = lambda city: city_loaded(data, city, snapshot_file)
+    return data
+
+def city_loaded(data: GlobalData, city: str, snapshot_file: Optional[snapshot.Snapshot] = None) -> None:
+    if prefork_server is not None and prefork_server.worker_number is not None:
+        if global_data is data:
+            prefork_server.notify(city)
+    elif deferred_city_loads is not None:
+        deferred_city_loads.append((data, city, snapshot_file))
+    elif snapshot_file is not None and f'cities/{city}/blocks' in snapshot_file:
+        threading.Thread(target=revalidate_city, args=(snapshot_file, data, city), daemon=True).start()
+    elif snapshot_path is not None and city != data.default_city and global_data is data:
+        threading.Thread(target=save_snapshot, args=(snapshot_path, data), daemon=True).start()
+
+def process_deferred_city_loads() -> bool:
+    changed = False
+    while deferred_city_loads:
+        data, city, snapshot_file = deferred_city_loads.pop(0)
+        if data is not global_data:
+            continue
+        if snapshot_file is not None and f'cities/{city}/blocks' in snapshot_file:
+            changed = revalidate_city(snapshot_file, data, city) or changed
+        elif snapshot_path is not None and city != data.default_city:
+            save_snapshot(snapshot_path, data)
+    return changed
+
+def load_worker_city(city: str) -> bool:
+    if city in global_data.cities:
+        global_data.cities.get(city)
+    return process_deferred_city_loads()
+
+def global_snapshot_contents(data: GlobalData) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]:
+    frames = {'needs': data.needs, 'infrastructure': data.infrastructure, 'city_hierarchy': data.city_hierarchy}
+    frames.update({f'listings/{name}': frame for name, frame in data.listings._asdict().items()})
+    values = {'cities_service_types': data.cities_service_types, 'city_division_type': data.city_division_type, 'cities_codes': data.cities_codes}
+    return frames, values
+
+def city_snapshot_frames(city_data: CityData) -> Dict[str, pd.DataFrame]:
+    return {name: getattr(city_data, name) for name in snapshot_city_frames}
+
+def snapshot_contents(data: GlobalData, previous: Optional[snapshot.Snapshot] = None) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Any], str]:
+    frames, values = global_snapshot_contents(data)
+    fingerprint = snapshot.fingerprint(frames, values)
+    previous_fingerprints: Dict[str, str] = previous.values.get('cities_fingerprints', {}) if previous is not None else {}
+    cities_fingerprints: Dict[str, str] = {}
+    loaded = set(data.cities.loaded()) | {data.default_city}
+    for city in data.cities:
+        if city in loaded:
+            city_frames = city_snapshot_frames(data.cities.get(city)) # type: ignore
+            cities_fingerprints[city] = snapshot.fingerprint(city_frames, {})
+        elif city in previous_fingerprints and f'cities/{city}/blocks' in previous: # type: ignore
+            city_frames = {name: previous.frame(f'cities/{city}/{name}') for name in snapshot_city_frames} # type: ignore
+            cities_fingerprints[city] = previous_fingerprints[city]
+        else:
+            continue
+        frames.update({f'cities/{city}/{name}': frame for name, frame in city_frames.items()})
+    values['cities_fingerprints'] = cities_fingerprints
+    return frames, values, fingerprint
+
+def save_snapshot(path: str, data: GlobalData) -> None:
+    start_time = time.time()
+    with snapshot_lock:
+        try:
+            previous = snapshot.open_snapshot(path)
+        except snapshot.SnapshotError:
+            previous = None
+        try:
+            frames, values, fingerprint = snapshot_contents(data, previous)
+            snapshot.write(path, frames, values, fingerprint)
+        finally:
+            if previous is not None:
+                previous.close()
+    logger.info(f'Data generation {data.generation} is saved to snapshot {path} in {time.time() - start_time:.2f}s'
+            f' (cities: {", ".join(values["cities_fingerprints"])})')
+
+def revalidate_snapshot(snapshot_file: snapshot.Snapshot) -> None:
+    global global_data
+    try:
+        current = global_data
+        fresh = load_global_data(current.generation + 1, current.default_city)
+        if snapshot.fingerprint(*global_snapshot_contents(fresh)) == snapshot_file.fingerprint:
+            logger.info(f'Snapshot {snapshot_file.path} matches the database')
+            return
+        if global_data is current:
+            global_data = fresh
+            logger.info(f'Snapshot {snapshot_file.path} is outdated, data generation {fresh.generation} is loaded from the database')
+        save_snapshot(snapshot_file.path, fresh)
+    except Exception as ex:
+        logger.error(f'Snapshot {snapshot_file.path} revalidation failed: {ex!r}')
+
+def revalidate_city(snapshot_file: snapshot.Snapshot, data: GlobalData, city: str) -> bool:
+    try:
+        fresh = load_city_data(city, data.needs, data.infrastructure, data.city_hierarchy[data.city_hierarchy['city'] == city], data.city_division_type)
+        if snapshot.fingerprint(city_snapshot_frames(fresh), {}) == snapshot_file.values.get('cities_fingerprints', {}).get(city):
+            logger.info(f'Snapshot {snapshot_file.path} data of city "{city}" matches the database')
+            return False
+        data.cities.replace(city, fresh)
+        logger.info(f'Snapshot {snapshot_file.path} data of city "{city}" is outdated, it is replaced by the database one')
+        if global_data is data:
+            save_snapshot(snapshot_file.path, data)
+        return True
+    except Exception as ex:
+        logger.error(f'Snapshot {snapshot_file.path} revalidation of city "{city}" failed: {ex!r}')
+        return False
+
+def update_global_data(default_city: str, preload: bool = False) -> GlobalData:
+    global global_data
+    previous: Optional[GlobalData] = globals().get('global_data')
+    data = load_global_data(previous.generation + 1 if previous is not None else 1, default_city)
+    if preload:
+        data.cities.get(default_city)
+    global_data = data
+    return data
+
+def current_data() -> GlobalData:
+    if has_request_context():
+        if 'global_data' not in g:
+            g.global_data = global_data
+        return g.global_data
+    return global_data
 
 
 def get_parameter_of_request(
@@ -240,6 +829,7 @@ def get_parameter_of_request(
         type_of_input: Literal['service_type', 'city_function', 'infrastructure', 'living_situation', 'social_group', 'city'],
         what_to_get: Literal['name', 'code', 'id'] = 'name',
         raise_errors: bool = False) -> Optional[Union[int, str]]:
+    data = current_data()
     if input_value is None:
         return None
     if type_of_input in ('service_type', 'city_function', 'infrastructure', 'social_group', 'living_situation'):
@@ -249,8 +839,8 @@ def get_parameter_of_request(
                 raise ValueError(f'"{what_to_get}" could not be get from {type_of_input}')
             else:
                 return None
-        source = {'service_type': listings.service_types, 'city_function': listings.city_functions, 'infrastructure': listings.infrastructures,
-                'social_group': listings.social_groups, 'living_situation': listings.living_situations}[type_of_input]
+        source = {'service_type': data.listings.service_types, 'city_function': data.listings.city_functions, 'infrastructure': data.listings.infrastructures,
+                'social_group': data.listings.social_groups, 'living_situation': data.listings.living_situations}[type_of_input]
         res = None
         if isinstance(input_value, int) or input_value.isnumeric():
             if int(input_value) not in source['id'].unique():
@@ -279,21 +869,17 @@ def get_parameter_of_request(
                 raise ValueError(f'"{what_to_get}" could not be get from {type_of_input}')
             else:
                 return None
-        if what_to_get == 'name':
-            what_to_get_really = 'city'
-        elif what_to_get == 'id':
-            what_to_get_really = 'city_id'
-        else:
-            what_to_get_really = what_to_get
+        lookup = data.hierarchy_lookup
         if isinstance(input_value, int) or input_value.isnumeric():
-            if int(input_value) not in city_hierarchy['city_id'].unique():
+            if int(input_value) not in lookup.cities_by_id:
                 if raise_errors:
                     raise ValueError(f'id={input_value} is given for {type_of_input}, but it is out of bounds')
                 else:
                     return None
-            res = city_hierarchy[city_hierarchy['city_id'] == int(input_value)].iloc[0][what_to_get_really]
-        elif input_value in city_hierarchy['city'].unique():
-            res = city_hierarchy[city_hierarchy['city'] == input_value].iloc[0][what_to_get_really]
+            city = lookup.cities_by_id[int(input_value)]
+            res = city if what_to_get == 'name' else lookup.city_ids[city]
+        elif input_value in lookup.city_ids:
+            res = input_value if what_to_get == 'name' else lookup.city_ids[input_value]
         else:
             if raise_errors:
                 raise ValueError(f'"{what_to_get}" could not be get from {type_of_input}')
@@ -320,26 +906,185 @@ def after_request(response) -> Response:
     response.headers['Access-Control-Allow-Headers'] = '*'
     return response
 
+class WrongParameter(ValueError):
+    pass
+
+def page_parameters() -> Tuple[Optional[int], Optional[int]]:
+    limit: Optional[int] = None
+    after: Optional[int] = None
+    if 'limit' in request.args:
+        if not request.args['limit'].isnumeric() or int(request.args['limit']) == 0:
+            raise WrongParameter(f"limit must be a positive integer, but '{request.args['limit']}' is given")
+        limit = int(request.args['limit'])
+    if 'after' in request.args:
+        if not request.args['after'].lstrip('-').isnumeric():
+            raise WrongParameter(f"after must be an integer identifier, but '{request.args['after']}' is given")
+        after = int(request.args['after'])
+    return limit, after
+
+def bbox_parameter() -> Optional[Tuple[float, float, float, float]]:
+    if 'bbox' not in request.args:
+        return None
+    try:
+        bbox = tuple(float(value) for value in request.args['bbox'].split(','))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or not all(np.isfinite(value) for value in bbox) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise WrongParameter(f"bbox must be 'minx,miny,maxx,maxy' in degrees with min values not greater than max ones, but '{request.args['bbox']}' is given")
+    return bbox # type: ignore
+
+def next_page_link(limit: Optional[int], count: int, last_id: Any) -> Optional[str]:
+    if limit is None or count < limit:
+        return None
+    return f'{request.path}?{urlencode({**request.args, "after": last_id})}'
+
+def response_format() -> str:
+    return table_formats.requested_format(request.args.get('format'), request.accept_mimetypes)
+
+def table_response(df: pd.DataFrame, format: str, name: str, parameters: Dict[str, Any], next_link: Optional[str] = None) -> Response:
+    response = make_response(table_formats.serialize(df, format, parameters))
+    response.headers['Content-Type'] = table_formats.MIME_TYPES[format]
+    response.headers['Content-Disposition'] = f'filename={name}.{table_formats.EXTENSIONS[format]}'
+    response.headers['Vary'] = 'Accept'
+    if next_link is not None:
+        response.headers['Link'] = f'<{next_link}>; rel="next"'
+    return response
+
+def log_files_response(paths: List[str], download_name: Optional[str] = None) -> Response:
+    tail: Optional[int] = None
+    if 'tail' in request.args:
+        if not request.args['tail'].isnumeric():
+            raise WrongParameter(f"tail must be a non-negative integer, but '{request.args['tail']}' is given")
+        tail = int(request.args['tail'])
+    if request.args.get('follow', '0').lower() not in ('0', 'f', 'false', 'no'):
+        start = logfiles.tail_offset(paths[-1], tail)[0] if tail is not None else None
+        response = app.response_class(logfiles.follow(paths[-1], start), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    sizes = [os.path.getsize(path) for path in paths]
+    total = sum(sizes)
+    status = 200
+    if tail is not None:
+        parts = logfiles.tail_parts(paths, sizes, tail)
+    elif request.range is not None and len(request.range.ranges) == 1:
+        byte_range = request.range.range_for_length(total)
+        if byte_range is None:
+            response = make_response('', 416)
+            response.headers['Content-Range'] = f'bytes */{total}'
+            return response
+        parts = logfiles.slice_parts(paths, sizes, *byte_range)
+        status = 206
+    else:
+        parts = logfiles.whole_parts(paths, sizes)
+    response = app.response_class(logfiles.read_parts(parts), status=status, content_type='text/plain; charset=utf-8')
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {byte_range[0]}-{byte_range[1] - 1}/{total}'
+    if download_name is not None:
+        response.headers['Content-Disposition'] = f'filename={download_name}'
+    return response
+
+@app.teardown_request
+def release_db_connections(_) -> None:
+    houses_properties.release_request_conn()
+    isochrones_properties.release_request_conn()
+
+def run_reload_job(job: Dict[str, Any]) -> None:
+    job['status'] = 'running'
+    try:
+        data = update_global_data(job['default_city'], preload_default_city)
+    except Exception as ex:
+        logger.error(f'Data reload job {job["id"]} failed: {ex!r}')
+        job.update(status='failed', error=repr(ex), finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    else:
+        logger.info(f'Data reload job {job["id"]} finished, generation {data.generation} is active now')
+        job.update(status='finished', generation=data.generation, finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+        if snapshot_path is not None:
+            try:
+                save_snapshot(snapshot_path, data)
+            except Exception as ex:
+                logger.error(f'Saving snapshot {snapshot_path} after data reload job {job["id"]} failed: {ex!r}')
+
+def new_reload_job(default_city: str) -> Dict[str, Any]:
+    job: Dict[str, Any] = {
+        'id': max(reload_jobs, default=0) + 1,
+        'status': 'pending',
+        'default_city': default_city,
+        'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': None,
+        'generation': None,
+        'error': None
+    }
+    reload_jobs[job['id']] = job
+    while len(reload_jobs) > 20:
+        del reload_jobs[min(reload_jobs)]
+    return job
+
+def reload_workers_data() -> bool:
+    job = new_reload_job(global_data.default_city)
+    run_reload_job(job)
+    return job['status'] == 'finished'
+
+@app.route('/api/reload_data', methods=['POST'])
 @app.route('/api/reload_data/', methods=['POST'])
 @logged
 def reload_data() -> Response:
-    global default_city
-    if 'city' in request.args:
-        default_city = request.args['city']
-    update_global_data()
-    return make_response('OK\n')
+    if master_pid is not None:
+        os.kill(master_pid, signal.SIGHUP)
+        return make_response(jsonify({
+            '_links': {
+                'self': {'href': request.full_path},
+                'status': {'href': '/api/status/'}
+            },
+            '_embedded': {
+                'status': 'signalled',
+                'active_generation': current_data().generation,
+                'message': 'data is reloaded by the master process, workers are restarted with the new data generation after it is loaded'
+            }
+        }), 202)
+    with reload_jobs_lock:
+        running = [job for job in reload_jobs.values() if job['status'] in ('pending', 'running')]
+        if len(running) != 0:
+            return make_response(jsonify({
+                'error': f'Data reload job {running[0]["id"]} is already in progress',
+                '_links': {'job': {'href': f'/api/reload_data/{running[0]["id"]}/'}}
+            }), 409)
+        job = new_reload_job(request.args.get('city', current_data().default_city))
+    threading.Thread(target=run_reload_job, args=(job,), daemon=True).start()
+    res = make_response(jsonify({
+        '_links': {
+            'self': {'href': request.full_path},
+            'job': {'href': f'/api/reload_data/{job["id"]}/'}
+        },
+        '_embedded': job
+    }), 202)
+    res.headers['Location'] = f'/api/reload_data/{job["id"]}/'
+    return res
+
+@app.route('/api/reload_data/<int:job_id>', methods=['GET'])
+@app.route('/api/reload_data/<int:job_id>/', methods=['GET'])
+@logged
+def reload_data_job(job_id: int) -> Response:
+    if job_id not in reload_jobs:
+        return make_response(jsonify({'error': f'Data reload job {job_id} is not found'}), 404)
+    return make_response(jsonify({
+        '_links': {'self': {'href': request.full_path}},
+        '_embedded': dict(reload_jobs[job_id], active_generation=global_data.generation)
+    }))
 
 def get_social_groups(service_type: Optional[Union[str, int]] = None, living_situation: Optional[Union[str, int]] = None,
         to_list: bool = False) -> Union[List[str], pd.DataFrame]:
+    data = current_data()
     service_type = get_parameter_of_request(service_type, 'service_type', 'name')
     living_situation = get_parameter_of_request(living_situation, 'living_situation', 'name')
-    res = needs[(needs['significance'] > 0) & (needs['intensity'] > 0)]
+    res = data.needs[(data.needs['significance'] > 0) & (data.needs['intensity'] > 0)]
     if living_situation is None:
         res = res.drop(['living_situation', 'intensity', 'walking', 'transport', 'car'], axis=1).drop_duplicates()
     else:
         res = res[res['living_situation'] == living_situation].drop('living_situation', axis=1)
     res = res[res['social_group'].apply(lambda name: name[-1] == ')')] \
-        .merge(listings.social_groups, left_on='social_group', right_on='name') \
+        .merge(data.listings.social_groups, left_on='social_group', right_on='name') \
         .sort_values('id') \
         .drop(['id', 'name', 'code'], axis=1)
     if service_type is None:
@@ -355,8 +1100,9 @@ def get_social_groups(service_type: Optional[Union[str, int]] = None, living_sit
 @app.route('/api/relevance/social_groups/', methods=['GET'])
 @logged
 def relevant_social_groups() -> Response:
+    data = current_data()
     res: pd.DataFrame = get_social_groups(request.args.get('service_type'), request.args.get('living_situation'))
-    res = res.merge(listings.social_groups.set_index('name'), how='inner', left_on='social_group', right_index=True)
+    res = res.merge(data.listings.social_groups.set_index('name'), how='inner', left_on='social_group', right_index=True)
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -372,9 +1118,10 @@ def relevant_social_groups() -> Response:
 @app.route('/api/list/social_groups/', methods=['GET'])
 @logged
 def list_social_groups() -> Response:
+    data = current_data()
     res: List[str] = get_social_groups(request.args.get('service_type'), request.args.get('living_situation'), to_list=True)
-    ids = list(listings.social_groups.set_index('name').loc[list(res)]['id'])
-    codes = list(listings.social_groups.set_index('name').loc[list(res)]['code'])
+    ids = list(data.listings.social_groups.set_index('name').loc[list(res)]['id'])
+    codes = list(data.listings.social_groups.set_index('name').loc[list(res)]['code'])
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -391,9 +1138,10 @@ def list_social_groups() -> Response:
 
 def get_city_functions(social_group: Optional[Union[str, int]] = None, living_situation: Optional[Union[str, int]] = None,
         to_list: bool = False) -> Union[List[str], pd.DataFrame]:
+    data = current_data()
     social_group = get_parameter_of_request(social_group, 'social_group', 'name')
     living_situation = get_parameter_of_request(living_situation, 'living_situation', 'name')
-    res = needs[(needs['significance'] > 0) & (needs['intensity'] > 0) & needs['service_type'].isin(infrastructure['service_type'].dropna().unique())]
+    res = data.needs[(data.needs['significance'] > 0) & (data.needs['intensity'] > 0) & data.needs['service_type'].isin(data.infrastructure['service_type'].dropna().unique())]
     if social_group is None:
         res = res.drop(['social_group', 'significance'], axis=1)
     else:
@@ -403,17 +1151,18 @@ def get_city_functions(social_group: Optional[Union[str, int]] = None, living_si
     else:
         res = res[res['living_situation'] == living_situation].drop('living_situation', axis=1)
     if to_list:
-        return list(infrastructure[infrastructure['service_type'].isin(res['service_type'].unique())]['city_function'].unique())
+        return list(data.infrastructure[data.infrastructure['service_type'].isin(res['service_type'].unique())]['city_function'].unique())
     else:
-        return res.join(infrastructure[['city_function', 'service_type']].set_index('service_type'), on='service_type', how='inner') \
+        return res.join(data.infrastructure[['city_function', 'service_type']].set_index('service_type'), on='service_type', how='inner') \
                 .drop('service_type', axis=1).drop_duplicates()
 
 @app.route('/api/relevance/city_functions', methods=['GET'])
 @app.route('/api/relevance/city_functions/', methods=['GET'])
 @logged
 def relevant_city_functions() -> Response:
+    data = current_data()
     res: pd.DataFrame = get_city_functions(request.args.get('social_group'), request.args.get('living_situation'))
-    res = res.merge(listings.city_functions.set_index('name'), how='inner', left_on='city_function', right_index=True)
+    res = res.merge(data.listings.city_functions.set_index('name'), how='inner', left_on='city_function', right_index=True)
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -429,9 +1178,10 @@ def relevant_city_functions() -> Response:
 @app.route('/api/list/city_functions/', methods=['GET'])
 @logged
 def list_city_functions() -> Response:
+    data = current_data()
     res: List[str] = sorted(get_city_functions(request.args.get('social_group'), request.args.get('living_situation'), to_list=True))
-    ids = list(listings.city_functions.set_index('name').loc[list(res)]['id'])
-    codes = list(listings.city_functions.set_index('name').loc[list(res)]['code'])
+    ids = list(data.listings.city_functions.set_index('name').loc[list(res)]['id'])
+    codes = list(data.listings.city_functions.set_index('name').loc[list(res)]['code'])
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -446,13 +1196,15 @@ def list_city_functions() -> Response:
     }))
 
 def get_service_types(social_group: Optional[Union[str, int]] = None, living_situation: Optional[Union[str, int]] = None,
-        city_name: str = default_city, to_list: bool = False) -> Union[List[str], pd.DataFrame]:
-    if city_name not in cities_service_types:
-        return [] if to_list else pd.DataFrame(columns = tuple(needs.columns) + ('count',))
+        city_name: Optional[str] = None, to_list: bool = False) -> Union[List[str], pd.DataFrame]:
+    data = current_data()
+    city_name = city_name or data.default_city
+    if city_name not in data.cities_service_types:
+        return [] if to_list else pd.DataFrame(columns = tuple(data.needs.columns) + ('count',))
     social_group = get_parameter_of_request(social_group, 'social_group', 'name')
     living_situation = get_parameter_of_request(living_situation, 'living_situation', 'name')
-    res = needs[(needs['significance'] > 0) & (needs['intensity'] > 0) & needs['service_type'].isin(infrastructure['service_type'].dropna().unique())]
-    res = res[res['service_type'].isin(cities_service_types[city_name])]
+    res = data.needs[(data.needs['significance'] > 0) & (data.needs['intensity'] > 0) & data.needs['service_type'].isin(data.infrastructure['service_type'].dropna().unique())]
+    res = res[res['service_type'].isin(data.cities_service_types[city_name])]
     if social_group is None:
         res = res.drop(['social_group', 'significance'], axis=1)
     else:
@@ -464,16 +1216,17 @@ def get_service_types(social_group: Optional[Union[str, int]] = None, living_sit
     if to_list:
         return list(res['service_type'].unique())
     else:
-        res = res.drop_duplicates().join(pd.Series([cities_service_types[city_name][service_type] for service_type in res['service_type']], name='count'))
+        res = res.drop_duplicates().join(pd.Series([data.cities_service_types[city_name][service_type] for service_type in res['service_type']], name='count'))
         return res
 
 @app.route('/api/relevance/service_types', methods=['GET'])
 @app.route('/api/relevance/service_types/', methods=['GET'])
 @logged
 def relevant_service_types() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
     res: pd.DataFrame = get_service_types(request.args.get('social_group'), request.args.get('living_situation'), city_name)
-    res = res.merge(listings.service_types.set_index('name'), how='inner', left_on='service_type', right_index=True)
+    res = res.merge(data.listings.service_types.set_index('name'), how='inner', left_on='service_type', right_index=True)
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -489,10 +1242,11 @@ def relevant_service_types() -> Response:
 @app.route('/api/list/service_types/', methods=['GET'])
 @logged
 def list_service_types() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
     res: List[str] = sorted(get_service_types(request.args.get('social_group'), request.args.get('living_situation'), city_name, to_list=True))
-    ids = list(listings.service_types.set_index('name').loc[list(res)]['id'])
-    codes = list(listings.service_types.set_index('name').loc[list(res)]['code'])
+    ids = list(data.listings.service_types.set_index('name').loc[list(res)]['id'])
+    codes = list(data.listings.service_types.set_index('name').loc[list(res)]['code'])
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -508,9 +1262,10 @@ def list_service_types() -> Response:
 
 def get_living_situations(social_group: Optional[Union[str, int]] = None, service_type: Optional[Union[str, int]] = None,
         to_list: bool = False) -> Union[List[str], pd.DataFrame]:
+    data = current_data()
     social_group = get_parameter_of_request(social_group, 'social_group', 'name')
     service_type = get_parameter_of_request(service_type, 'service_type', 'name')
-    res = needs[(needs['significance'] > 0) & (needs['intensity'] > 0)]
+    res = data.needs[(data.needs['significance'] > 0) & (data.needs['intensity'] > 0)]
     if social_group is not None and service_type is not None:
         res = res[(res['social_group'] == social_group) & (res['service_type'] == service_type)].drop(['service_type', 'social_group'], axis=1)
     elif social_group is not None:
@@ -528,8 +1283,9 @@ def get_living_situations(social_group: Optional[Union[str, int]] = None, servic
 @app.route('/api/relevance/living_situations/', methods=['GET'])
 @logged
 def relevant_living_situations() -> Response:
+    data = current_data()
     res: pd.DataFrame = get_living_situations(request.args.get('social_group'), request.args.get('service_type'))
-    res = res.merge(listings.living_situations.set_index('name'), how='inner', left_on='living_situation', right_index=True)
+    res = res.merge(data.listings.living_situations.set_index('name'), how='inner', left_on='living_situation', right_index=True)
     significance: Optional[int] = None
     if 'significance' in res.columns:
         if res.shape[0] > 0:
@@ -551,8 +1307,9 @@ def relevant_living_situations() -> Response:
 @app.route('/api/list/living_situations/', methods=['GET'])
 @logged
 def list_living_situations() -> Response:
+    data = current_data()
     res: List[str] = get_living_situations(request.args.get('social_group'), request.args.get('service_type'), to_list=True)
-    ids = list(listings.living_situations.set_index('name').loc[list(res)]['id'])
+    ids = list(data.listings.living_situations.set_index('name').loc[list(res)]['id'])
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -569,6 +1326,7 @@ def list_living_situations() -> Response:
 @app.route('/api/list/infrastructures/', methods=['GET'])
 @logged
 def list_infrastructures() -> Response:
+    data = current_data()
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -585,12 +1343,12 @@ def list_infrastructures() -> Response:
                         'name': service_type,
                         'code': service_type_code
                     } for _, (service_type_id, service_type, service_type_code) in \
-                            infrastructure[infrastructure['city_function_id'] == city_function_id].dropna() \
+                            data.infrastructure[data.infrastructure['city_function_id'] == city_function_id].dropna() \
                                     [['service_type_id', 'service_type', 'service_type_code']].iterrows()]
                 } for _, (city_function_id, city_function, city_function_code) in \
-                        infrastructure[infrastructure['infrastructure_id'] == infra_id].dropna() \
+                        data.infrastructure[data.infrastructure['infrastructure_id'] == infra_id].dropna() \
                                 [['city_function_id', 'city_function', 'city_function_code']].drop_duplicates().iterrows()]
-            } for _, (infra_id, infra, infra_code) in infrastructure[['infrastructure_id', 'infrastructure', 'infrastructure_code']].drop_duplicates().iterrows()]
+            } for _, (infra_id, infra, infra_code) in data.infrastructure[['infrastructure_id', 'infrastructure', 'infrastructure_code']].drop_duplicates().iterrows()]
         }
     }))
 
@@ -598,8 +1356,9 @@ def list_infrastructures() -> Response:
 @app.route('/api/list/districts/', methods=['GET'])
 @logged
 def list_districts() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
-    districts = city_hierarchy[city_hierarchy['city'] == city_name][['district_id', 'district']].dropna().drop_duplicates().sort_values('district')
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
+    districts = data.city_hierarchy[data.city_hierarchy['city'] == city_name][['district_id', 'district']].dropna().drop_duplicates().sort_values('district')
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -612,8 +1371,9 @@ def list_districts() -> Response:
 @app.route('/api/list/municipalities/', methods=['GET'])
 @logged
 def list_municipalities() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
-    municipalities = city_hierarchy[city_hierarchy['city'] == city_name][['municipality_id', 'municipality']].dropna().drop_duplicates().sort_values('municipality')
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
+    municipalities = data.city_hierarchy[data.city_hierarchy['city'] == city_name][['municipality_id', 'municipality']].dropna().drop_duplicates().sort_values('municipality')
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -622,94 +1382,106 @@ def list_municipalities() -> Response:
         }
     }))
 
+def block_exists(block_id: int) -> bool:
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT 1 FROM blocks WHERE id = %s', (block_id,))
+        return cur.fetchone() is not None
+
 @app.route('/api/list/city_hierarchy', methods=['GET'])
 @app.route('/api/list/city_hierarchy/', methods=['GET'])
 @logged
 def list_city_hierarchy() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
-    local_hierarchy = city_hierarchy[city_hierarchy['city'] == city_name]
-    blocks_local = blocks[blocks['city'] == city_name]
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
+    city_data = data.cities.get(city_name)
+    index = city_data.hierarchy_index if city_data is not None else empty_city_hierarchy_index
+    tree = index.full
     if 'location' in request.args:
-        if request.args['location'] in city_hierarchy['district'].unique():
-            local_hierarchy = local_hierarchy[local_hierarchy['district'] == request.args['location']]
-        elif request.args['location'] in city_hierarchy['municipality'].unique():
-            local_hierarchy = local_hierarchy[local_hierarchy['municipality'] == request.args['location']]
-        elif request.args['location'].isnumeric():
-            local_hierarchy = local_hierarchy[local_hierarchy['municipality'] == blocks.loc[int(request.args['location'])]['municipality']]
+        location = request.args['location']
+        if location in data.hierarchy_lookup.districts:
+            tree = index.districts.get(location, empty_hierarchy_tree)
+        elif location in data.hierarchy_lookup.municipalities:
+            tree = index.municipalities.get(location, empty_hierarchy_tree)
+        elif location.isnumeric() and city_data is not None and int(location) in city_data.blocks.index:
+            municipality = city_data.blocks['municipality'].get(int(location))
+            tree = index.municipalities.get(municipality, empty_hierarchy_tree)
+        elif location.isnumeric() and block_exists(int(location)):
+            tree = empty_hierarchy_tree
         else:
             return make_response(jsonify({'error': f"location '{request.args['location']}' is not found in any of districts, municipalities or blocks"}), 400)
-    
-    if city_name in city_division_type and city_division_type[city_name] == 'ADMIN_UNIT_PARENT':
-        districts = [{'id': id, 'name': name, 'population': population}
-                for _, (id, name, population) in
-                        local_hierarchy[['district_id', 'district', 'district_population']].dropna().drop_duplicates().iterrows()]
-        for district in districts:
-            district['municipalities'] = [{'id': id, 'name': name, 'population': population}
-                    for _, (id, name, population) in
-                            local_hierarchy[local_hierarchy['district_id'] == district['id']][['municipality_id', 'municipality',
-                                    'municipality_population']].iterrows()]
-        municipalities = [{'id': id, 'name': name, 'population': population}
-                for _, (id, name, population) in
-                        local_hierarchy[local_hierarchy['district_id'].isna()] \
-                                [['municipality_id', 'municipality', 'municipality_population']].dropna().drop_duplicates().iterrows()]
-        if 'include_blocks' in request.args:
-            for district in districts:
-                for municipality in district['municipalities']:
-                    municipality['blocks'] = [{'id': id, 'population': population} for id, population in
-                            blocks_local[blocks_local['municipality'] == municipality['name']]['population'].items()]
-            for municipality in municipalities:
-                municipality['blocks'] = [{'id': id, 'population': population} for id, population in
-                        blocks_local[blocks_local['municipality'] == municipality['name']]['population'].items()]
-    elif city_name in city_division_type and city_division_type[city_name] == 'MUNICIPALITY_PARENT':
-        municipalities = [{'id': id, 'name': name, 'population': population}
-                for _, (id, name, population) in
-                        local_hierarchy[['municipality_id', 'municipality', 'municipality_population']].dropna().drop_duplicates().iterrows()]
-        for municipality in municipalities:
-            municipality['districts'] = [{'id': id, 'name': name, 'population': population}
-                    for _, (id, name, population) in
-                            local_hierarchy[local_hierarchy['municipality_id'] == municipality['id']][['district_id', 'district',
-                                    'district_population']].iterrows()]
-        districts = [{'id': id, 'name': name, 'population': population}
-                for _, (id, name, population) in
-                        local_hierarchy[local_hierarchy['municipality_id'].isna()] \
-                                [['district_id', 'district', 'district_population']].dropna().drop_duplicates().iterrows()]
-        if 'include_blocks' in request.args:
-            for municipality in municipalities:
-                for district in municipality['districts']:
-                    district['blocks'] = [{'id': id, 'population': population} for id, population in
-                            blocks_local[blocks_local['district'] == district['name']]['population'].items()]
-            for district in districts:
-                district['blocks'] = [{'id': id, 'population': population} for id, population in
-                        blocks_local[blocks_local['district'] == district['name']]['population'].items()]
-    else:
-        districts = [{'id': id, 'name': name, 'population': population}
-                for _, (id, name, population) in
-                        local_hierarchy[local_hierarchy['municipality_id'].isna()] \
-                                [['district_id', 'district', 'district_population']].dropna().drop_duplicates().iterrows()]
-        municipalities = [{'id': id, 'name': name, 'population': population}
-                for _, (id, name, population) in
-                        local_hierarchy[local_hierarchy['district_id'].isna()] \
-                                [['municipality_id', 'municipality', 'municipality_population']].dropna().drop_duplicates().iterrows()]
-        if 'include_blocks' in request.args:
-            for municipality in municipalities:
-                municipality['blocks'] = [{'id': id, 'population': population} for id, population in
-                        blocks_local[blocks_local['municipality'] == municipality['name']]['population'].items()]
-            for district in districts:
-                district['blocks'] = [{'id': id, 'population': population} for id, population in
-                        blocks_local[blocks_local['district'] == district['name']]['population'].items()]
 
+    include_blocks = 'include_blocks' in request.args
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
-            'districts': districts,
-            'municipalities': municipalities,
+            'districts': tree.districts_with_blocks if include_blocks else tree.districts,
+            'municipalities': tree.municipalities_with_blocks if include_blocks else tree.municipalities,
             'parameters': {
-                'include_blocks': 'include_blocks' in request.args,
+                'include_blocks': include_blocks,
                 'location': request.args.get('location')
             }
         }
     }))
 
+@app.route('/api/status', methods=['GET'])
+@app.route('/api/status/', methods=['GET'])
+@logged
+def status() -> Response:
+    return make_response(jsonify({
+        '_links': {'self': {'href': request.full_path}},
+        '_embedded': {
+            'data_generation': current_data().generation,
+            'data_source': current_data().source,
+            'loaded_cities': current_data().cities.loaded(),
+            'loaded_accessibility': current_data().accessibility.loaded(),
+            'pid': os.getpid(),
+            'houses_db_pool': houses_properties.pool.stats() if houses_properties.pool is not None else None,
+            'isochrones_db_pool': isochrones_properties.pool.stats() if isochrones_properties.pool is not None else None
+        }
+    }))
+
+@app.route('/api/metrics', methods=['GET'])
+@app.route('/api/metrics/', methods=['GET'])
+def metrics_endpoint() -> Response:
+    return app.response_class(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/profiles', methods=['GET'])
+@app.route('/api/profiles/', methods=['GET'])
+@logged
+def profiles() -> Response:
+    if not profiling_allowed():
+        return make_response(jsonify({
+            '_links': {'self': {'href': request.full_path}},
+            '_embedded': {
+                'error': 'profiles are available only with the admin token or from the allowed clients'
+            }
+        }), 403)
+    return make_response(jsonify({
+        '_links': {'self': {'href': request.full_path}},
+        '_embedded': {
+            'profiles': [{**profile, '_links': {'self': {'href': f'/api/profiles/{profile["id"]}/'}}} for profile in profile_store.list()]
+        }
+    }))
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+@app.route('/api/profiles/<profile_id>/', methods=['GET'])
+@logged
+def profile_info(profile_id: str) -> Response:
+    profile = profile_store.get(profile_id) if profiling_allowed() else None
+    if profile is None:
+        return make_response(jsonify({
+            '_links': {'self': {'href': request.full_path}},
+            '_embedded': {
+                'error': f'profile "{profile_id}" is not found'
+            }
+        }), 404)
+    return make_response(jsonify({
+        '_links': {'self': {'href': request.full_path}, 'profiles': {'href': '/api/profiles/'}},
+        '_embedded': {
+            'profile': profile
+        }
+    }))
+
 @app.route('/', methods=['GET'])
 @app.route('/api/', methods=['GET'])
 @logged
@@ -767,6 +1539,12 @@ def api_help() -> Response:
                 'href': '/api/list/municipalities/{?city}',
                 'templated': True
             },
+            'status': {
+                'href': '/api/status/'
+            },
+            'metrics': {
+                'href': '/api/metrics/'
+            },
             'provision_v3_ready': {
                 'href': '/api/provision_v3/ready/{?city,service_type,include_evaluation_scale}',
                 'templated': True
@@ -776,7 +1554,7 @@ def api_help() -> Response:
                 'templated': True
             },
             'provision_v3_services': {
-                'href': '/api/provision_v3/services/{?city,service_type,location}',
+                'href': '/api/provision_v3/services/{?city,service_type,location,bbox,limit,after,format}',
                 'templated': True
             },
             'provision_v3_service': {
@@ -784,9 +1562,23 @@ def api_help() -> Response:
                 'templated': True
             },
             'provision_v3_houses' : {
-                'href': '/api/provision_v3/houses/{?city,service_type,location,everything}',
+                'href': '/api/provision_v3/houses/{?city,service_type,location,bbox,everything,limit,after,format}',
                 'templated': True
             },
+            'provision_v3_houses_batch' : {
+                'href': '/api/provision_v3/houses/batch/{?service_type,social_group}',
+                'templated': True
+            },
+            'provision_v3_services_batch': {
+                'href': '/api/provision_v3/services/batch/'
+            },
+            'provision_v3_houses_availability_zones': {
+                'href': '/api/provision_v3/houses/availability_zones/{?service_type}',
+                'templated': True
+            },
+            'provision_v3_services_availability_zones': {
+                'href': '/api/provision_v3/services/availability_zones/'
+            },
             'provision_v3_house_normative_load' : {
                 'href': '/api/provision_v3/house/{house_id}/normative_load/{?service_type,no_round}',
                 'templated': True
@@ -803,6 +1595,13 @@ def api_help() -> Response:
                 'href': '/api/provision_v3/house/{house_id}/services/{?service_type}',
                 'templated': True
             },
+            'provision_v3_what_if': {
+                'href': '/api/provision_v3/what_if/'
+            },
+            'provision_v3_calculation': {
+                'href': '/api/provision_v3/calculation/{object_type}/{?city,service_type,normative,max_load,radius_meters,service_evaluation,house_evaluation,bbox,limit,after,format}',
+                'templated': True
+            },
             'provision_v3_service_houses': {
                 'href': '/api/provision_v3/service/{service_id}/houses/',
                 'templated': True
@@ -812,17 +1611,17 @@ def api_help() -> Response:
             },
             'provision_v3_prosperity_districts': {
                 'href': '/api/provision_v3/prosperity/districts/'
-                        '{?city,district,municipality,block,service_type,city_function,infrastructure,social_group,provision_only}',
+                        '{?city,district,municipality,block,service_type,city_function,infrastructure,social_group,provision_only,format}',
                 'templated': True
             },
             'provision_v3_prosperity_municipalities': {
                 'href': '/api/provision_v3/prosperity/municipalities/'
-                        '{?city,district,municipality,block,service_type,city_function,infrastructure,social_group,provision_only}',
+                        '{?city,district,municipality,block,service_type,city_function,infrastructure,social_group,provision_only,format}',
                 'templated': True
             },
             'provision_v3_prosperity_blocks': {
                 'href': '/api/provision_v3/prosperity/blocks/'
-                        '{?city,district,municipality,block,service_type,city_function,infrastructure,social_group,provision_only}',
+                        '{?city,district,municipality,block,service_type,city_function,infrastructure,social_group,provision_only,format}',
                 'templated': True
             }
         }
@@ -832,48 +1631,98 @@ def api_help() -> Response:
 @app.route('/api/provision_v3/services/', methods=['GET'])
 @logged
 def provision_v3_services() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
     service_type = request.args.get('service_type')
     if service_type and service_type.isnumeric():
-        service_type = infrastructure[infrastructure['service_type_id'] == int(service_type)]['service_type'].iloc[0] \
-                if int(service_type) in infrastructure['service_type_id'] else f'{service_type} (not found)'
+        service_type = data.infrastructure[data.infrastructure['service_type_id'] == int(service_type)]['service_type'].iloc[0] \
+                if int(service_type) in data.infrastructure['service_type_id'] else f'{service_type} (not found)'
     location = request.args.get('location')
+    bbox = bbox_parameter()
+    format = response_format()
+    limit, after = page_parameters()
+    location_column: Optional[str] = None
+    if location is not None:
+        if location in data.city_hierarchy['district'].unique():
+            location_column = 'administrative_unit'
+        elif location in data.city_hierarchy['municipality'].unique():
+            location_column = 'municipality'
+    columns = ('center', 'service_type', 'service_name', 'district', 'municipality', 'block', 'address',
+            'houses_in_access', 'people_in_access', 'service_load', 'needed_capacity', 'reserve_resource', 'provision', 'service_id')
+            # TODO: 'provision' -> 'evaluation'
+    query = 'SELECT ST_AsGeoJSON(a.center) AS center, a.city_service_type AS service_type, a.service_name, a.administrative_unit AS district,' \
+            '    a.municipality, a.block_id AS block, a.address, ps.houses_in_radius AS houses_in_access, ps.people_in_radius AS people_in_access,' \
+            '    ps.service_load, ps.needed_capacity, ps.reserve_resource, ps.evaluation AS provision, ps.service_id' \
+            ' FROM all_services a JOIN provision.services ps ON a.functional_object_id = ps.service_id' \
+            ' WHERE a.city = %s' + \
+            (' AND a.city_service_type = %s' if 'service_type' in request.args else '') + \
+            (f' AND a.{location_column} = %s' if location_column is not None else '') + \
+            (' AND a.center && ST_MakeEnvelope(%s, %s, %s, %s, 4326)' if bbox is not None else '') + \
+            (' AND ps.service_id > %s' if after is not None else '') + \
+            ' ORDER BY ps.service_id' + \
+            (' LIMIT %s' if limit is not None else '')
+    query_params = (city_name,) + ((service_type,) if 'service_type' in request.args else ()) + \
+            ((location,) if location_column is not None else ()) + (bbox or ()) + tuple(v for v in (after, limit) if v is not None)
+    parameters: Dict[str, Any] = {
+        'service_type': service_type,
+        'location': location
+    }
+    if bbox is not None:
+        parameters['bbox'] = list(bbox)
+    if limit is not None:
+        parameters.update(limit=limit, after=after)
+    if db_json and format == 'json' and (location is None or location_column is not None):
+        columns = tuple(column for column in columns if not (column == 'service_type' and 'service_type' in request.args
+                or column == 'district' and location_column is not None or column == 'municipality' and location_column == 'municipality'))
+        with houses_properties.conn, houses_properties.conn.cursor() as cur:
+            cur.execute('SELECT coalesce(json_agg(json_build_object(' +
+                    ', '.join(f"'{column}', s.{column}" + ('::json' if column == 'center' else '') for column in columns) +
+                    ') ORDER BY s.service_id), \'[]\')::text, count(*), max(s.service_id) FROM (' + query + ') s', query_params)
+            services, count, last_id = cur.fetchone()
+        next_link = next_page_link(limit, count, last_id)
+        return make_response(jsonify({
+            '_links': {
+                'self': {'href': request.full_path},
+                **({'next': {'href': next_link}} if next_link is not None else {}),
+                'service_info': {'href': '/api/provision_v3/service/{service_id}/', 'templated': True},
+                'houses': {'href': '/api/provision_v3/service_houses/{service_id}/', 'templated': True}
+            },
+            '_embedded': {
+                'services': json.RawJSON(services),
+                'parameters': parameters
+            }
+        }))
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
-        cur.execute('SELECT ST_AsGeoJSON(a.center), a.city_service_type, a.service_name, a.administrative_unit, a.municipality, a.block_id, a.address,'
-                '    ps.houses_in_radius, ps.people_in_radius, ps.service_load, ps.needed_capacity, ps.reserve_resource, ps.evaluation,'
-                '    ps.service_id'
-                ' FROM all_services a JOIN provision.services ps ON a.functional_object_id = ps.service_id' 
-                ' WHERE a.city = %s' +
-                (' AND a.city_service_type = %s' if 'service_type' in request.args else ''),
-                ((city_name, service_type) if 'service_type' in request.args else (city_name,)))
-        df = pd.DataFrame(cur.fetchall(), columns=('center', 'service_type', 'service_name', 'district', 'municipality', 'block', 'address',
-                'houses_in_access', 'people_in_access', 'service_load', 'needed_capacity', 'reserve_resource', 'provision', 'service_id'))
-                # TODO: 'provision' -> 'evaluation'
-    df['center'] = df['center'].apply(json.loads)
+        cur.execute(query, query_params)
+        df = pd.DataFrame(cur.fetchall(), columns=columns)
+    if format == 'json':
+        df['center'] = df['center'].apply(json.loads)
     df['block'] = df['block'].replace({np.nan: None})
     df['address'] = df['address'].replace({np.nan: None})
+    next_link = next_page_link(limit, df.shape[0], df['service_id'].iloc[-1] if df.shape[0] > 0 else None)
     if location is not None:
-        if location in city_hierarchy['district'].unique():
-            df = df[df['district'] == location].drop('district', axis=1)
-        elif location in city_hierarchy['municipality'].unique():
-            df = df[df['municipality'] == location].drop(['district', 'municipality'], axis=1)
+        if location_column == 'administrative_unit':
+            df = df.drop('district', axis=1)
+        elif location_column == 'municipality':
+            df = df.drop(['district', 'municipality'], axis=1)
         else:
             location = f'Not found ({location})'
             df = df.drop(df.index)
+            next_link = None
     if 'service_type' in request.args:
         df = df.drop('service_type', axis=1)
+    if format != 'json':
+        return table_response(df, format, 'services', parameters, next_link)
     return make_response(jsonify({
         '_links': {
             'self': {'href': request.full_path},
+            **({'next': {'href': next_link}} if next_link is not None else {}),
             'service_info': {'href': '/api/provision_v3/service/{service_id}/', 'templated': True},
             'houses': {'href': '/api/provision_v3/service_houses/{service_id}/', 'templated': True}
         },
         '_embedded': {
             'services': list(df.transpose().to_dict().values()),
-            'parameters': {
-                'service_type': service_type,
-                'location': location
-            }
+            'parameters': parameters
         }
     }))
 
@@ -914,10 +1763,70 @@ def provision_v3_service_info(service_id: int) -> Response:
         }
     }), 404 if service_info['service_name'] == 'Not found' else 200)
 
+def batch_ids() -> List[int]:
+    body = request.get_json(silent=True)
+    ids = body.get('ids') if isinstance(body, dict) else body
+    if not isinstance(ids, list) or not all(isinstance(object_id, int) and not isinstance(object_id, bool) for object_id in ids):
+        raise WrongParameter("request body must be a JSON list of integer ids or an object with 'ids' list")
+    if len(ids) > max_batch_size:
+        raise WrongParameter(f'at most {max_batch_size} ids can be requested at once, but {len(ids)} are given')
+    return list(dict.fromkeys(ids))
+
+def batch_parameter(name: str) -> Optional[Union[str, int]]:
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and body.get(name) is not None:
+        return body[name]
+    return request.args.get(name)
+
+@app.route('/api/provision_v3/services/batch', methods=['POST'])
+@app.route('/api/provision_v3/services/batch/', methods=['POST'])
+@logged
+def provision_v3_services_batch() -> Response:
+    ids = batch_ids()
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT a.functional_object_id, ST_AsGeoJSON(a.center), a.city_service_type, a.service_name, a.administrative_unit,'
+                '    a.municipality, a.block_id, a.address, v.houses_in_radius, v.people_in_radius, v.service_load, v.needed_capacity,'
+                '    v.reserve_resource, v.evaluation as provision'
+                ' FROM all_services a'
+                '   JOIN provision.services v ON a.functional_object_id = v.service_id'
+                ' WHERE a.functional_object_id = ANY(%s)', (ids,))
+        services = {
+            service_id: {
+                'center': json.loads(center),
+                'service_type': service_type,
+                'service_name': service_name,
+                'district': district,
+                'municipality': municipality,
+                'block': block,
+                'address': address,
+                'houses_in_access': houses_in_access,
+                'people_in_access': people_in_access,
+                'service_load': service_load,
+                'needed_capacity': needed_capacity,
+                'reserve_resource': reserve_resource,
+                'provision': provision # TODO: 'provision' -> 'evaluation'
+            } for service_id, center, service_type, service_name, district, municipality, block, address, houses_in_access, people_in_access,
+                    service_load, needed_capacity, reserve_resource, provision in cur.fetchall()
+        }
+    return make_response(jsonify({
+        '_links': {
+            'self': {'href': request.full_path},
+            'service_info': {'href': '/api/provision_v3/service/{service_id}/', 'templated': True}
+        },
+        '_embedded': {
+            'services': {str(service_id): services[service_id] for service_id in ids if service_id in services},
+            'not_found': [service_id for service_id in ids if service_id not in services],
+            'parameters': {
+                'ids_count': len(ids)
+            }
+        }
+    }))
+
 @app.route('/api/provision_v3/service/<int:service_id>/availability_zone', methods=['GET'])
 @app.route('/api/provision_v3/service/<int:service_id>/availability_zone/', methods=['GET'])
 @logged
 def service_availability_zone(service_id: int) -> Response:
+    data = current_data()
     error: Optional[str] = None
     status = 200
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
@@ -940,7 +1849,8 @@ def service_availability_zone(service_id: int) -> Response:
                     geometry = json.loads(cur.fetchone()[0]) # type: ignore
                 else:
                     try:
-                        geometry = collect_geom.get_public_transport(lat, lng, transport, cities_codes.get(city))
+                        with isochrone_fetch():
+                            geometry = collect_geom.get_public_transport(lat, lng, transport, data.cities_codes.get(city))
                     except TimeoutError:
                         error = f'Timeout on public_transport_service, try later'
                         status = 408
@@ -967,10 +1877,48 @@ def service_availability_zone(service_id: int) -> Response:
         }
     }))
     
+@app.route('/api/provision_v3/services/availability_zones', methods=['POST'])
+@app.route('/api/provision_v3/services/availability_zones/', methods=['POST'])
+@logged
+def services_availability_zones() -> Response:
+    ids = batch_ids()
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT a.functional_object_id, ST_X(a.center), ST_Y(a.center), a.city_service_type, a.city,'
+                '    n.city_service_type_id IS NOT NULL, n.radius_meters, n.public_transport_time,'
+                '    CASE WHEN n.public_transport_time IS NULL THEN'
+                '        ST_AsGeoJSON(ST_Buffer(ST_SetSRID(ST_MakePoint(ST_X(a.center), ST_Y(a.center)), 4326)::geography, n.radius_meters), 6)'
+                '    END'
+                ' FROM all_services a'
+                '   LEFT JOIN provision.normatives n ON n.city_service_type_id = a.city_service_type_id'
+                ' WHERE a.functional_object_id = ANY(%s)', (ids,))
+        rows = cur.fetchall()
+    return availability_zones_response(ids, rows, 'service')
+
+@app.route('/api/provision_v3/houses/availability_zones', methods=['POST'])
+@app.route('/api/provision_v3/houses/availability_zones/', methods=['POST'])
+@logged
+def houses_availability_zones() -> Response:
+    ids = batch_ids()
+    if batch_parameter('service_type') is None:
+        raise WrongParameter('service_type is missing in request. It is required to set this parameter')
+    service_type_id = get_parameter_of_request(batch_parameter('service_type'), 'service_type', 'id')
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT h.functional_object_id, ST_X(h.center), ST_Y(h.center), %s, h.city,'
+                '    n.city_service_type_id IS NOT NULL, n.radius_meters, n.public_transport_time,'
+                '    CASE WHEN n.public_transport_time IS NULL THEN'
+                '        ST_AsGeoJSON(ST_Buffer(ST_SetSRID(ST_MakePoint(ST_X(h.center), ST_Y(h.center)), 4326)::geography, n.radius_meters), 6)'
+                '    END'
+                ' FROM all_houses h'
+                '   LEFT JOIN provision.normatives n ON n.city_service_type_id = %s'
+                ' WHERE h.functional_object_id = ANY(%s)', (batch_parameter('service_type'), service_type_id, ids))
+        rows = cur.fetchall()
+    return availability_zones_response(ids, rows, 'house')
+
 @app.route('/api/provision_v3/house/<int:house_id>/availability_zone', methods=['GET'])
 @app.route('/api/provision_v3/house/<int:house_id>/availability_zone/', methods=['GET'])
 @logged
 def house_availability_zone(house_id: int) -> Response:
+    data = current_data()
     error: Optional[str] = None
     status = 200
     if 'service_type' not in request.args:
@@ -998,7 +1946,8 @@ def house_availability_zone(house_id: int) -> Response:
                         geometry = json.loads(cur.fetchone()[0]) # type: ignore
                     else:
                         try:
-                            geometry = collect_geom.get_public_transport(lat, lng, transport, cities_codes.get(city))
+                            with isochrone_fetch():
+                                geometry = collect_geom.get_public_transport(lat, lng, transport, data.cities_codes.get(city))
                         except TimeoutError:
                             error = f'Timeout on public_transport_service, try later'
                             status = 408
@@ -1026,33 +1975,115 @@ def house_availability_zone(house_id: int) -> Response:
     }))
     
 
+def public_transport_zone(latitude: float, longitude: float, transport: int, city_code: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        with isochrones_properties.pool.connection() as conn, isochrone_fetch(): # type: ignore
+            return collect_geom.get_public_transport(latitude, longitude, transport, city_code, conn=conn), None
+    except TimeoutError:
+        return None, 'Timeout on public_transport_service, try later'
+    except db_pool.PoolTimeout as ex:
+        logger.warning(f'Getting public_transport geometry failed: {ex!r}')
+        return None, f'No free isochrones database connection, try later: {ex}'
+    except Exception as ex:
+        logger.error(f'Getting public_transport geometry failed: {ex!r}')
+        return None, f'Error on public_transport_service: {ex}'
+
+def availability_zones_response(ids: List[int], rows: List[Tuple[Any, ...]], object_name: str) -> Response:
+    data = current_data()
+    found = {row[0]: row for row in rows}
+    def feature(object_id: int, geometry: Optional[Union[Dict[str, Any], json.RawJSON]], properties: Dict[str, Any]) -> str:
+        return json.dumps({'type': 'Feature', 'id': object_id, 'geometry': geometry, 'properties': properties}, ensure_ascii=False)
+    def generate() -> Iterator[str]:
+        yield '{"type": "FeatureCollection", "features": ['
+        separator = ''
+        transport_zones: Dict[Tuple[float, float, int, Optional[str]], List[Tuple[int, Dict[str, Any]]]] = {}
+        for object_id in ids:
+            if object_id not in found:
+                yield separator + feature(object_id, None, {'error': f'{object_name} with id = {object_id} is not found'})
+                separator = ', '
+                continue
+            _, lat, lng, service_type, city, has_normative, radius, transport, buffer = found[object_id]
+            properties = {'service_type': service_type, 'radius_meters': radius, 'public_transport_time': transport}
+            if not has_normative:
+                yield separator + feature(object_id, None, {**properties, 'error': f'Normative for service_type = {service_type} is not found'})
+            elif transport is None:
+                yield separator + feature(object_id, json.RawJSON(buffer), properties)
+            else:
+                transport_zones.setdefault((lat, lng, transport, data.cities_codes.get(city)), []).append((object_id, properties))
+                continue
+            separator = ', '
+        pool = gevent.pool.Pool(zones_concurrency)
+        for key, (geometry, error) in pool.imap_unordered(lambda key: (key, public_transport_zone(*key)), list(transport_zones)):
+            for object_id, properties in transport_zones[key]:
+                yield separator + feature(object_id, geometry, properties if error is None else {**properties, 'error': error})
+                separator = ', '
+        yield ']}'
+    return app.response_class(stream_with_context(generate()), mimetype='application/geo+json')
+
+def get_significances(city_name: str, social_group: str) -> Dict[str, float]:
+    data = current_data()
+    if social_group == 'mean':
+        return {service_type: data.needs[data.needs['service_type'] == service_type]['significance'].mean() for \
+                service_type in get_service_types(city_name=city_name, to_list=True)}
+    significances = {service_type: data.needs[(data.needs['service_type'] == service_type) & (data.needs['social_group'] == social_group)]['significance'].mean() \
+            for service_type in get_service_types(city_name=city_name, to_list=True)}
+    return {key: val for key, val in filter(lambda x: x[1] == x[1], significances.items())}
+
+def houses_provision_table(city_name: str, location_tuple: Optional[Tuple[Literal['district', 'municipality'], int]],
+        service_type: Optional[int], significances: Optional[Dict[str, float]], limit: Optional[int] = None,
+        after: Optional[int] = None, bbox: Optional[Tuple[float, float, float, float]] = None) -> pd.DataFrame:
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT h.functional_object_id, h.address, ST_AsGeoJSON(h.center), h.resident_number,'
+                '   h.administrative_unit, h.municipality, h.block_id, st.name, ph.reserve_resource, ph.provision FROM'
+                '   (SELECT functional_object_id, address, center, resident_number, administrative_unit, municipality, block_id FROM houses'
+                '    WHERE city_id = (SELECT id FROM cities WHERE name = %s)' +
+                (' AND administrative_unit_id = %s' if location_tuple and location_tuple[0] == 'district' else ' AND municipality_id = %s' \
+                        if location_tuple else '') +
+                (' AND center && ST_MakeEnvelope(%s, %s, %s, %s, 4326)' if bbox is not None else '') +
+                (' AND functional_object_id > %s' if after is not None else '') +
+                '    ORDER BY 1' +
+                (' LIMIT %s' if limit is not None else '') +
+                '   ) h'
+                '   LEFT JOIN provision.houses ph ON ph.house_id = h.functional_object_id' +
+                (' AND ph.city_service_type_id = %s' if service_type else '') +
+                '   LEFT JOIN city_service_types st ON ph.city_service_type_id = st.id'
+                ' ORDER BY 1, 8',
+                (city_name,) + ((location_tuple[1],) if location_tuple else ()) + (bbox or ()) + tuple(v for v in (after, limit) if v is not None) +
+                        ((service_type,) if service_type else ())
+        )
+        houses = pd.DataFrame(cur.fetchall(), columns=('id', 'address', 'center', 'population', 'district', 'municipality', 'block',
+                'service_type', 'reserve_resources', 'provision'))
+    houses['block'] = houses['block'].astype('Int64')
+    if significances is not None:
+        houses['prosperity'] = 10 + (houses['service_type'].map(significances).astype(float) * (houses['provision'].astype(float) - 10)).round(2)
+    return houses
+
 @app.route('/api/provision_v3/houses', methods=['GET'])
 @app.route('/api/provision_v3/houses/', methods=['GET'])
 @logged
 def provision_v3_houses() -> Response:
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
+    data = current_data()
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
     service_type = get_parameter_of_request(request.args.get('service_type'), 'service_type', 'id')
     location = request.args.get('location')
     location_tuple: Optional[Tuple[Literal['district', 'municipality'], int]] = None
     social_group: Optional[str] = request.args.get('social_group')
     significances = {}
     if social_group:
-        if social_group == 'mean':
-            significances = {service_type: needs[needs['service_type'] == service_type]['significance'].mean() for \
-                    service_type in get_service_types(city_name=city_name, to_list=True)}
-        else:
+        if social_group != 'mean':
             social_group = get_parameter_of_request(social_group, 'social_group', 'name') # type: ignore
-            significances = {service_type: needs[(needs['service_type'] == service_type) & (needs['social_group'] == social_group)]['significance'].mean() \
-                    for service_type in get_service_types(city_name=city_name, to_list=True)}
-            significances = {key: val for key, val in filter(lambda x: x[1] == x[1], significances.items())}
+        significances = get_significances(city_name, social_group) # type: ignore
     if location is not None:
-        if location in city_hierarchy['district'].unique():
-            location_tuple = 'district', int(city_hierarchy[city_hierarchy['district'] == location]['district_id'].iloc[0])
-        elif location in city_hierarchy['municipality'].unique():
-            location_tuple = 'municipality', int(city_hierarchy[city_hierarchy['municipality'] == location]['municipality_id'].iloc[0])
+        if location in data.city_hierarchy['district'].unique():
+            location_tuple = 'district', int(data.city_hierarchy[data.city_hierarchy['district'] == location]['district_id'].iloc[0])
+        elif location in data.city_hierarchy['municipality'].unique():
+            location_tuple = 'municipality', int(data.city_hierarchy[data.city_hierarchy['municipality'] == location]['municipality_id'].iloc[0])
         else:
             location = f'{location} (not found)'
-    if not location_tuple and not service_type and not 'everything' in request.args:
+    bbox = bbox_parameter()
+    format = response_format()
+    limit, after = page_parameters()
+    if not location_tuple and not service_type and bbox is None and not 'everything' in request.args:
         return make_response(jsonify({
             '_links': {'self': {'href': request.full_path}},
             '_embedded': {
@@ -1061,9 +2092,22 @@ def provision_v3_houses() -> Response:
                     'location': location,
                     'service_type': None
                 },
-                'error': "at least one of the 'service_type' and 'location' must be set in request. To avoid this error use ?everything parameter"
+                'error': "at least one of the 'service_type', 'location' and 'bbox' must be set in request. To avoid this error use ?everything parameter"
             }
         }), 400)
+    parameters: Dict[str, Any] = {
+        'service_type': service_type,
+        'location': location,
+        'social_group': social_group
+    }
+    if bbox is not None:
+        parameters['bbox'] = list(bbox)
+    if limit is not None:
+        parameters.update(limit=limit, after=after)
+    if format != 'json':
+        table = houses_provision_table(city_name, location_tuple, service_type, significances if social_group else None, limit, after, bbox)
+        return table_response(table, format, 'houses', parameters,
+                next_page_link(limit, table['id'].nunique(), table['id'].iloc[-1] if table.shape[0] > 0 else None))
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
         cur.execute('SELECT h.functional_object_id, h.address, ST_AsGeoJSON(h.center), h.resident_number,'
                 '   h.administrative_unit, h.municipality, h.block_id FROM houses h'
@@ -1071,8 +2115,11 @@ def provision_v3_houses() -> Response:
                 (' AND' if location_tuple else '') +
                 (' h.administrative_unit_id = %s ' if location_tuple and location_tuple[0] == 'district' else ' h.municipality_id = %s' \
                         if location_tuple and location_tuple[0] == 'municipality' else '') +
-                ' ORDER BY 1',
-                (city_name, location_tuple[1]) if location_tuple else (city_name,)
+                (' AND h.center && ST_MakeEnvelope(%s, %s, %s, %s, 4326)' if bbox is not None else '') +
+                (' AND h.functional_object_id > %s' if after is not None else '') +
+                ' ORDER BY 1' +
+                (' LIMIT %s' if limit is not None else ''),
+                ((city_name, location_tuple[1]) if location_tuple else (city_name,)) + (bbox or ()) + tuple(v for v in (after, limit) if v is not None)
         )
         houses = pd.DataFrame(cur.fetchall(),
                 columns=('id', 'address', 'center', 'population', 'district', 'municipality', 'block')).set_index('id') # 'service_type', 'reserve_resource', 'provision'
@@ -1083,7 +2130,7 @@ def provision_v3_houses() -> Response:
             cur.execute('SELECT st.name, reserve_resource, provision FROM provision.houses ph'
                     '   JOIN city_service_types st ON ph.city_service_type_id = st.id'
                     ' WHERE house_id = %s' +
-                    ('AND st.id = %s' if service_type else ''),
+                    (' AND st.id = %s' if service_type else ''),
                     (house_id, service_type,) if service_type else (house_id,)
             )
             if social_group is None:
@@ -1108,18 +2155,16 @@ def provision_v3_houses() -> Response:
                 'block': int(block) if block == block else None,
                 'service_types': service_types
             })
+    next_link = next_page_link(limit, len(result), result[-1]['id'] if len(result) > 0 else None)
     return make_response(jsonify({
         '_links': {
             'self': {'href': request.full_path},
+            **({'next': {'href': next_link}} if next_link is not None else {}),
             'services': {'href': '/api/provision_v3/house/{house_id}/services/{?service_type}', 'templated': True},
             'house_info': {'href': '/api/provision_v3/house/{house_id}/{?service_type,social_group}', 'templated': True}
         },
         '_embedded': {
-            'parameters': {
-                'service_type': service_type,
-                'location': location,
-                'social_group': social_group
-            },
+            'parameters': parameters,
             'houses': result
         }
     }))
@@ -1167,6 +2212,7 @@ def provision_v3_house_normative_loads(house_id: int) -> Response:
 @app.route('/api/provision_v3/house/<int:house_id>/', methods=['GET'])
 @logged
 def provision_v3_house(house_id: int) -> Response:
+    data = current_data()
     service_type = get_parameter_of_request(request.args.get('service_type'), 'service_type', 'id')
     social_group: Optional[str] = request.args.get('social_group')
     house_info: Dict[str, Any] = {}
@@ -1174,16 +2220,38 @@ def provision_v3_house(house_id: int) -> Response:
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
         cur.execute('SELECT city FROM houses WHERE functional_object_id = %s', (house_id,))
         city_name = cur.fetchone()
-        city_name = city_name[0] if city_name is not None else default_city
+        city_name = city_name[0] if city_name is not None else data.default_city
         if social_group:
-            if social_group == 'mean':
-                significances = {service_type: needs[needs['service_type'] == service_type]['significance'].mean() for \
-                        service_type in get_service_types(city_name=city_name, to_list=True)}
-            else:
+            if social_group != 'mean':
                 social_group = get_parameter_of_request(social_group, 'social_group', 'name') # type: ignore
-                significances = {service_type: needs[(needs['service_type'] == service_type) & (needs['social_group'] == social_group)]['significance'].mean() \
-                        for service_type in get_service_types(city_name=city_name, to_list=True)}
-                significances = {key: val for key, val in filter(lambda x: x[1] == x[1], significances.items())}
+            significances = get_significances(city_name, social_group) # type: ignore
+        if db_json:
+            cur.execute("SELECT json_build_object('address', h.address, 'center', ST_AsGeoJSON(h.center)::json,"
+                    "      'district', h.administrative_unit, 'municipality', h.municipality, 'block', h.block_id, 'population', h.resident_number,"
+                    "      'service_types', (SELECT coalesce(json_agg(json_build_object('service_type', st.name, 'reserve_resources', ph.reserve_resource,"
+                    "          'provision', ph.provision" +
+                    (", 'prosperity', 10 + round((%s::jsonb ->> st.name)::numeric * (ph.provision - 10), 2)" if social_group else '') +
+                    "      )), '[]') FROM provision.houses ph"
+                    '          JOIN city_service_types st ON ph.city_service_type_id = st.id'
+                    '        WHERE ph.house_id = h.functional_object_id' +
+                    (' AND st.id = %s' if service_type else '') +
+                    '   ))::text FROM houses h'
+                    ' WHERE h.functional_object_id = %s',
+                    ((json.dumps({key: float(val) for key, val in significances.items() if val == val}),) if social_group else ()) +
+                            ((service_type,) if service_type else ()) + (house_id,))
+            res = cur.fetchone()
+            if res is not None:
+                return make_response(jsonify({
+                    '_links': {'self': {'href': request.full_path}},
+                    '_embedded': {
+                        'house': json.RawJSON(res[0]),
+                        'parameters': {
+                            'house_id': house_id,
+                            'service_type': request.args.get('service_type'),
+                            'social_group': social_group
+                        }
+                    }
+                }))
         cur.execute('SELECT address, ST_AsGeoJSON(center), administrative_unit, municipality, block_id, resident_number FROM houses'
                 ' WHERE functional_object_id = %s',
                 (house_id,))
@@ -1198,7 +2266,7 @@ def provision_v3_house(house_id: int) -> Response:
             cur.execute('SELECT st.name, ph.reserve_resource, ph.provision FROM provision.houses ph'
                     '   JOIN city_service_types st ON ph.city_service_type_id = st.id' + 
                     ' WHERE ph.house_id  = %s' + 
-                    ('AND st.id = %s' if service_type else ''),
+                    (' AND st.id = %s' if service_type else ''),
                     (house_id, service_type,) if service_type else (house_id,)
             )
             house_service_types = pd.DataFrame(cur.fetchall(),
@@ -1228,23 +2296,94 @@ def provision_v3_house(house_id: int) -> Response:
         }
     }), 404 if house_info['address'] == 'Not found' else 200)
 
+@app.route('/api/provision_v3/houses/batch', methods=['POST'])
+@app.route('/api/provision_v3/houses/batch/', methods=['POST'])
+@logged
+def provision_v3_houses_batch() -> Response:
+    ids = batch_ids()
+    service_type = get_parameter_of_request(batch_parameter('service_type'), 'service_type', 'id') # type: ignore
+    social_group: Optional[str] = batch_parameter('social_group') # type: ignore
+    if social_group and social_group != 'mean':
+        social_group = get_parameter_of_request(social_group, 'social_group', 'name') # type: ignore
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT functional_object_id, city, address, ST_AsGeoJSON(center), administrative_unit, municipality, block_id, resident_number'
+                ' FROM houses WHERE functional_object_id = ANY(%s)', (ids,))
+        houses: Dict[int, Dict[str, Any]] = {}
+        cities: Dict[int, str] = {}
+        for house_id, city_name, address, center, district, municipality, block, population in cur.fetchall():
+            cities[house_id] = city_name
+            houses[house_id] = {
+                'address': address,
+                'center': json.loads(center),
+                'district': district,
+                'municipality': municipality,
+                'block': int(block) if block is not None else None,
+                'population': population,
+                'service_types': []
+            }
+        cur.execute('SELECT ph.house_id, st.name, ph.reserve_resource, ph.provision FROM provision.houses ph'
+                '   JOIN city_service_types st ON ph.city_service_type_id = st.id'
+                ' WHERE ph.house_id = ANY(%s)' +
+                (' AND st.id = %s' if service_type else ''),
+                (list(houses), service_type) if service_type else (list(houses),))
+        service_types = cur.fetchall()
+    significances: Dict[str, Dict[str, float]] = {}
+    if social_group:
+        significances = {city_name: get_significances(city_name, social_group) for city_name in set(cities.values())}
+    for house_id, service_type_name, reserve, provision in service_types:
+        house_service_type = {'service_type': service_type_name, 'reserve_resources': reserve, 'provision': provision}
+        if social_group:
+            city_significances = significances[cities[house_id]]
+            house_service_type['prosperity'] = 10 + round(float(city_significances[service_type_name] * (provision - 10)), 2) \
+                    if service_type_name in city_significances and provision is not None else None
+        houses[house_id]['service_types'].append(house_service_type)
+    return make_response(jsonify({
+        '_links': {
+            'self': {'href': request.full_path},
+            'house_info': {'href': '/api/provision_v3/house/{house_id}/{?service_type,social_group}', 'templated': True}
+        },
+        '_embedded': {
+            'houses': {str(house_id): houses[house_id] for house_id in ids if house_id in houses},
+            'not_found': [house_id for house_id in ids if house_id not in houses],
+            'parameters': {
+                'ids_count': len(ids),
+                'service_type': batch_parameter('service_type'),
+                'social_group': social_group
+            }
+        }
+    }))
+
 @app.route('/api/provision_v3/house/<int:house_id>/services', methods=['GET'])
 @app.route('/api/provision_v3/house/<int:house_id>/services/', methods=['GET'])
 @logged
 def house_services(house_id: int) -> Response:
     service_type = get_parameter_of_request(request.args.get('service_type'), 'service_type', 'name')
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
-        if 'service_type' in request.args:
+        if db_json:
+            cur.execute("SELECT coalesce(json_agg(json_build_object('id', hs.service_id, 'name', a.service_name, 'center', ST_AsGeoJSON(a.center)::json," +
+                    ("" if 'service_type' in request.args else " 'service_type', a.city_service_type,") +
+                    "      'load_part', hs.load,"
+                    "      'load_service', round(coalesce(s.load_total, (SELECT sum(load) FROM provision.houses_services WHERE service_id = hs.service_id))::numeric, 2))), '[]')::text"
+                    ' FROM provision.houses_services hs'
+                    '   JOIN all_services a ON hs.service_id = a.functional_object_id'
+                    '   LEFT JOIN provision.services s ON hs.service_id = s.service_id'
+                    ' WHERE hs.house_id = %s' +
+                    (' AND a.city_service_type = %s' if 'service_type' in request.args else ''),
+                    (house_id, service_type) if 'service_type' in request.args else (house_id,))
+            services = json.RawJSON(cur.fetchone()[0])
+        elif 'service_type' in request.args:
             cur.execute('SELECT hs.service_id, a.service_name, ST_AsGeoJSON(a.center), hs.load,'
-                    '      (SELECT sum(load) FROM provision.houses_services WHERE service_id = hs.service_id) FROM provision.houses_services hs'
+                    '      coalesce(s.load_total, (SELECT sum(load) FROM provision.houses_services WHERE service_id = hs.service_id)) FROM provision.houses_services hs'
                     '   JOIN all_services a ON hs.service_id = a.functional_object_id'
+                    '   LEFT JOIN provision.services s ON hs.service_id = s.service_id'
                     ' WHERE hs.house_id = %s AND a.city_service_type = %s', (house_id, service_type))
             services = [{'id': func_id, 'name': name, 'center': json.loads(center), 'load_part': load_part, 'load_service': round(load_service, 2)} for \
                      func_id, name, center, load_part, load_service in cur.fetchall()]
         else:
             cur.execute('SELECT hs.service_id, a.service_name, ST_AsGeoJSON(a.center), a.city_service_type, hs.load,'
-                    '      (SELECT sum(load) FROM provision.houses_services WHERE service_id = hs.service_id) FROM provision.houses_services hs'
+                    '      coalesce(s.load_total, (SELECT sum(load) FROM provision.houses_services WHERE service_id = hs.service_id)) FROM provision.houses_services hs'
                     '   JOIN all_services a ON hs.service_id = a.functional_object_id'
+                    '   LEFT JOIN provision.services s ON hs.service_id = s.service_id'
                     ' WHERE hs.house_id = %s', (house_id,))
             services = [{'id': func_id, 'name': name, 'center': json.loads(center), 'service_type': service_type, 'load_part': load_part,
                             'load_service': round(load_service, 2)} for func_id, name, center, service_type, load_part, load_service in cur.fetchall()]
@@ -1270,11 +2409,25 @@ def service_houses(service_id: int) -> Response:
             normative = 0
         else:
             normative = res[0]
-        cur.execute('SELECT hs.house_id, h.resident_number, ST_AsGeoJSON(h.center), hs.load FROM provision.houses_services hs'
-                '   JOIN houses h ON hs.house_id = h.functional_object_id'
-                ' WHERE hs.service_id = %s', (service_id,))
-        houses = [{'id': func_id, 'population': population, 'center': json.loads(center), 'load_part': load_part,
-                        'load_house': round(population * normative / 1000, 2)} for func_id, population, center, load_part in cur.fetchall()]
+        if db_json:
+            cur.execute("SELECT coalesce(json_agg(json_build_object('id', hs.house_id, 'population', h.resident_number,"
+                    "      'center', ST_AsGeoJSON(h.center)::json, 'load_part', hs.load,"
+                    "      'load_house', round(coalesce(ph.load, h.resident_number * %s / 1000.0)::numeric, 2))), '[]')::text"
+                    ' FROM provision.houses_services hs'
+                    '   JOIN houses h ON hs.house_id = h.functional_object_id'
+                    '   LEFT JOIN provision.houses ph ON hs.house_id = ph.house_id'
+                    '     AND ph.city_service_type_id = (SELECT city_service_type_id FROM all_services WHERE functional_object_id = %s)'
+                    ' WHERE hs.service_id = %s', (normative, service_id, service_id))
+            houses = json.RawJSON(cur.fetchone()[0])
+        else:
+            cur.execute('SELECT hs.house_id, h.resident_number, ST_AsGeoJSON(h.center), hs.load, coalesce(ph.load, h.resident_number * %s / 1000.0)'
+                    ' FROM provision.houses_services hs'
+                    '   JOIN houses h ON hs.house_id = h.functional_object_id'
+                    '   LEFT JOIN provision.houses ph ON hs.house_id = ph.house_id'
+                    '     AND ph.city_service_type_id = (SELECT city_service_type_id FROM all_services WHERE functional_object_id = %s)'
+                    ' WHERE hs.service_id = %s', (normative, service_id, service_id))
+            houses = [{'id': func_id, 'population': population, 'center': json.loads(center), 'load_part': load_part,
+                            'load_house': round(load_house, 2)} for func_id, population, center, load_part, load_house in cur.fetchall()]
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
@@ -1282,19 +2435,231 @@ def service_houses(service_id: int) -> Response:
         }
     }))
 
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+def what_if_added(services: Any, max_load: float) -> List[Tuple[float, float, float]]:
+    if not isinstance(services, list):
+        raise WrongParameter("'add' must be a list of objects with 'longitude', 'latitude' and optional 'capacity'")
+    added = []
+    for service in services:
+        if not isinstance(service, dict) or not is_number(service.get('longitude')) or not is_number(service.get('latitude')) \
+                or service.get('capacity') is not None and (not is_number(service['capacity']) or service['capacity'] < 0):
+            raise WrongParameter(f"service to add must have numeric 'longitude', 'latitude' and optional non-negative 'capacity', but {service} is given")
+        added.append((float(service['longitude']), float(service['latitude']),
+                float(service['capacity']) if service.get('capacity') is not None else max_load))
+    return added
+
+def what_if_reach(city_name: str, service_type_data: ServiceTypeData, longitude: float, latitude: float) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    accessibility, normative = service_type_data.accessibility, service_type_data.normative
+    if not normative['public_transport_time']:
+        return provision_engine.houses_within(accessibility, longitude, latitude, normative['radius_meters']), None
+    geometry, error = public_transport_zone(longitude, latitude, normative['public_transport_time'], current_data().cities_codes.get(city_name))
+    if error is not None:
+        return None, error
+    with houses_properties.conn, houses_properties.conn.cursor() as cur:
+        cur.execute('SELECT functional_object_id FROM houses'
+                ' WHERE city = %s AND ST_Within(center, ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326))', (city_name, json.dumps(geometry)))
+        return provision_engine.house_positions(accessibility, [house_id for house_id, in cur.fetchall()]), None
+
+def records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+@app.route('/api/provision_v3/what_if', methods=['POST'])
+@app.route('/api/provision_v3/what_if/', methods=['POST'])
+@logged
+def provision_v3_what_if() -> Response:
+    data = current_data()
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise WrongParameter("request body must be a JSON object with 'service_type' and 'add' and/or 'remove' lists")
+    city_name: Optional[str] = get_parameter_of_request(body.get('city', data.default_city), 'city', 'name') # type: ignore
+    if city_name is None:
+        raise WrongParameter(f'city "{body.get("city")}" is not found')
+    service_type: Optional[str] = get_parameter_of_request(body.get('service_type'), 'service_type', 'name') # type: ignore
+    if service_type is None:
+        raise WrongParameter(f'service_type "{body.get("service_type")}" is not found')
+    removed = body.get('remove', [])
+    if not isinstance(removed, list) or not all(isinstance(service_id, int) and not isinstance(service_id, bool) for service_id in removed):
+        raise WrongParameter("'remove' must be a list of integer service ids")
+    service_type_data = data.accessibility.get(city_name, service_type)
+    if service_type_data is None:
+        return make_response(jsonify({
+            '_links': {'self': {'href': request.full_path}},
+            '_embedded': {
+                'error': f'Normative for service_type = {service_type} is not found'
+            }
+        }), 404)
+    accessibility, normative = service_type_data.accessibility, service_type_data.normative
+    added = what_if_added(body.get('add', []), normative['max_load'])
+    if len(added) + len(removed) == 0:
+        raise WrongParameter("at least one service must be given in 'add' or 'remove'")
+    if len(added) + len(removed) > max_batch_size:
+        raise WrongParameter(f'at most {max_batch_size} services can be added and removed at once, but {len(added) + len(removed)} are given')
+    new_services: List[provision_engine.NewService] = []
+    for longitude, latitude, max_load in added:
+        reach, error = what_if_reach(city_name, service_type_data, longitude, latitude)
+        if error is not None:
+            return make_response(jsonify({
+                '_links': {'self': {'href': request.full_path}},
+                '_embedded': {
+                    'error': error
+                }
+            }), 503)
+        new_services.append(provision_engine.NewService(longitude, latitude, max_load, reach)) # type: ignore
+    removed_positions = accessibility.services.index.get_indexer(removed)
+    houses, services = provision_engine.what_if(accessibility, normative, service_type_data.baseline, new_services,
+            removed_positions[removed_positions != -1])
+    return make_response(jsonify({
+        '_links': {
+            'self': {'href': request.full_path},
+            'house_info': {'href': '/api/provision_v3/house/{house_id}/', 'templated': True},
+            'service_info': {'href': '/api/provision_v3/service/{service_id}/', 'templated': True}
+        },
+        '_embedded': {
+            'summary': {
+                'houses_changed': houses.shape[0],
+                'population_changed': int(houses['population'].sum()),
+                'houses_improved': int((houses['provision_after'] > houses['provision_before']).sum()),
+                'houses_worsened': int((houses['provision_after'] < houses['provision_before']).sum()),
+                'reserve_resources_delta': round(float((houses['reserve_resources_after'] - houses['reserve_resources_before']).sum()), 2),
+                'services_changed': int((services['status'] == 'changed').sum())
+            },
+            'houses': records(houses.reset_index().rename(columns={'house_id': 'id'})),
+            'services': records(services.rename(columns={'service_id': 'id'})),
+            'not_found': [service_id for service_id, position in zip(removed, removed_positions) if position == -1],
+            'parameters': {
+                'city': city_name,
+                'service_type': service_type,
+                'normative': {key: normative[key] for key in ('normative', 'max_load', 'radius_meters', 'public_transport_time')},
+                'added': len(added),
+                'removed': removed
+            }
+        }
+    }))
+
+def calculation_overrides() -> Dict[str, Any]:
+    overrides: Dict[str, Any] = {}
+    for name in ('normative', 'max_load', 'radius_meters'):
+        if name in request.args:
+            try:
+                value = float(request.args[name])
+            except ValueError:
+                value = float('nan')
+            if not np.isfinite(value) or value < 0 or name == 'radius_meters' and value == 0:
+                raise WrongParameter(f"{name} must be a {'positive' if name == 'radius_meters' else 'non-negative'} number,"
+                        f" but '{request.args[name]}' is given")
+            overrides[name] = value
+    for name in ('service_evaluation', 'house_evaluation'):
+        if name in request.args:
+            try:
+                scale = [float(value) for value in request.args[name].split(',') if value.strip() != '']
+            except ValueError:
+                scale = [float('nan')]
+            if not all(np.isfinite(value) for value in scale) or scale != sorted(scale):
+                raise WrongParameter(f"{name} must be a comma-separated ascending list of numbers, but '{request.args[name]}' is given")
+            overrides[name] = scale
+    return overrides
+
+@app.route('/api/provision_v3/calculation/<object_type>', methods=['GET'])
+@app.route('/api/provision_v3/calculation/<object_type>/', methods=['GET'])
+@logged
+def provision_v3_calculation(object_type: str) -> Response:
+    data = current_data()
+    if object_type not in ('houses', 'services'):
+        return make_response(jsonify({
+            '_links': {'self': {'href': request.full_path}},
+            '_embedded': {
+                'error': f"object_type must be 'houses' or 'services', but '{object_type}' is given"
+            }
+        }), 400)
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
+    service_type: Optional[str] = get_parameter_of_request(request.args.get('service_type'), 'service_type', 'name') # type: ignore
+    if service_type is None:
+        raise WrongParameter(f'service_type "{request.args.get("service_type")}" is not found')
+    overrides = calculation_overrides()
+    bbox = bbox_parameter()
+    format = response_format()
+    limit, after = page_parameters()
+    result = data.accessibility.calculate(city_name, service_type, overrides)
+    if result is None:
+        return make_response(jsonify({
+            '_links': {'self': {'href': request.full_path}},
+            '_embedded': {
+                'error': f'Normative for service_type = {service_type} is not found'
+            }
+        }), 404)
+    calculation, cached = result
+    table = (calculation.houses if object_type == 'houses' else calculation.services).rename_axis('id').reset_index()
+    if bbox is not None:
+        table = table[table['longitude'].between(bbox[0], bbox[2]) & table['latitude'].between(bbox[1], bbox[3])]
+    if object_type == 'houses':
+        summary = {
+            'houses': table.shape[0],
+            'population': int(table['population'].sum()),
+            'reserve_resources': round(float(table['reserve_resources'].sum()), 2),
+            'mean_provision': round(float(table['provision'].mean()), 2) if table.shape[0] != 0 else None
+        }
+    else:
+        summary = {
+            'services': table.shape[0],
+            'service_load': int(table['service_load'].sum()),
+            'reserve_resource': round(float(table['reserve_resource'].sum()), 2),
+            'mean_provision': round(float(table['provision'].mean()), 2) if table.shape[0] != 0 else None
+        }
+    if after is not None:
+        table = table[table['id'] > after]
+    if limit is not None:
+        table = table.iloc[:limit]
+    parameters: Dict[str, Any] = {
+        'city': city_name,
+        'service_type': service_type,
+        'normative': {key: calculation.normative[key] for key in
+                ('normative', 'max_load', 'radius_meters', 'public_transport_time', 'service_evaluation', 'house_evaluation')},
+        'overridden': sorted(overrides)
+    }
+    if bbox is not None:
+        parameters['bbox'] = list(bbox)
+    if limit is not None:
+        parameters.update(limit=limit, after=after)
+    next_link = next_page_link(limit, table.shape[0], int(table['id'].iloc[-1]) if table.shape[0] > 0 else None)
+    if format != 'json':
+        return table_response(table, format, f'calculation_{object_type}', parameters, next_link)
+    return make_response(jsonify({
+        '_links': {
+            'self': {'href': request.full_path},
+            **({'next': {'href': next_link}} if next_link is not None else {})
+        },
+        '_embedded': {
+            object_type: records(table),
+            'summary': summary,
+            'parameters': {**parameters, 'cached': cached}
+        }
+    }))
+
+def has_readiness_statistics(cur: 'psycopg2.cursor', city_name: str) -> bool:
+    cur.execute("SELECT to_regclass('provision.services_readiness') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return False
+    cur.execute('SELECT EXISTS (SELECT 1 FROM provision.services_readiness WHERE city = %s)', (city_name,))
+    return cur.fetchone()[0]
+
 @app.route('/api/provision_v3/ready', methods=['GET'])
 @app.route('/api/provision_v3/ready/', methods=['GET'])
 @logged
 def provision_v3_ready() -> Response:
+    data = current_data()
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
-        city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
+        city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
         cur.execute('SELECT (SELECT name FROM city_service_types WHERE id = n.city_service_type_id),'
                 '   c.count, n.normative, n.max_load, n.radius_meters,'
-                '   n.public_transport_time, n.service_evaluation, n.house_evaluation'
+                '   n.public_transport_time, n.service_evaluation, n.house_evaluation' +
+                (' FROM (SELECT city_service_type_id, evaluated AS count FROM provision.services_readiness'
+                '       WHERE city = %s AND evaluated > 0) as c' if has_readiness_statistics(cur, city_name) else
                 ' FROM (SELECT a.city_service_type_id, count(*) FROM all_services a'
                 '           JOIN provision.services ps ON a.functional_object_id = ps.service_id'
                 '       WHERE city = %s'
-                '       GROUP BY a.city_service_type_id) as c'
+                '       GROUP BY a.city_service_type_id) as c') +
                 '   RIGHT JOIN provision.normatives n ON n.city_service_type_id = c.city_service_type_id',
                 (city_name,))
         df = pd.DataFrame(cur.fetchall(), columns=('service_type', 'count', 'normative', 'max_load', 'radius_meters',
@@ -1315,17 +2680,26 @@ def provision_v3_ready() -> Response:
 @app.route('/api/provision_v3/not_ready/', methods=['GET'])
 @logged
 def provision_v3_not_ready() -> Response:
+    data = current_data()
     with houses_properties.conn, houses_properties.conn.cursor() as cur:
-        city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
-        cur.execute('SELECT st.name as service_type, s.count AS unevaluated, c.count AS total'
-                ' FROM (SELECT city_service_type_id, count(*) FROM all_services WHERE functional_object_id NOT IN'
-                '       (SELECT service_id FROM provision.services) AND city = %s'
-                '    GROUP BY city_service_type_id ORDER BY 1) AS s'
-                ' JOIN city_service_types st ON s.city_service_type_id = st.id'
-                ' JOIN (SELECT city_service_type_id, count(*) FROM all_services WHERE city = %s'
-                '       GROUP BY city_service_type_id) AS c ON c.city_service_type_id = st.id'
-                ' ORDER BY 1',
-                (city_name,) * 2)
+        city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
+        if has_readiness_statistics(cur, city_name):
+            cur.execute('SELECT st.name as service_type, r.total - r.evaluated AS unevaluated, r.total'
+                    ' FROM provision.services_readiness r'
+                    '   JOIN city_service_types st ON r.city_service_type_id = st.id'
+                    ' WHERE r.city = %s AND r.evaluated < r.total'
+                    ' ORDER BY 1',
+                    (city_name,))
+        else:
+            cur.execute('SELECT st.name as service_type, s.count AS unevaluated, c.count AS total'
+                    ' FROM (SELECT city_service_type_id, count(*) FROM all_services WHERE functional_object_id NOT IN'
+                    '       (SELECT service_id FROM provision.services) AND city = %s'
+                    '    GROUP BY city_service_type_id ORDER BY 1) AS s'
+                    ' JOIN city_service_types st ON s.city_service_type_id = st.id'
+                    ' JOIN (SELECT city_service_type_id, count(*) FROM all_services WHERE city = %s'
+                    '       GROUP BY city_service_type_id) AS c ON c.city_service_type_id = st.id'
+                    ' ORDER BY 1',
+                    (city_name,) * 2)
         return make_response(jsonify({
             '_links': {'self': {'href': request.full_path}},
             '_embedded': {
@@ -1338,6 +2712,7 @@ def provision_v3_not_ready() -> Response:
 @app.route('/api/provision_v3/prosperity/<location_type>/', methods=['GET'])
 @logged
 def provision_v3_prosperity(location_type: str) -> Response:
+    data = current_data()
     if location_type not in ('districts', 'municipalities', 'blocks'):
         return make_response(jsonify({
             '_links': {'self': {'href': request.full_path}},
@@ -1354,7 +2729,7 @@ def provision_v3_prosperity(location_type: str) -> Response:
     city_function: Optional[str] = request.args.get('city_function')
     if city_function and city_function not in ('all', 'mean'):
         city_function = get_parameter_of_request(city_function, 'city_function', 'name') # type: ignore
-    city_name: str = get_parameter_of_request(request.args.get('city', default_city), 'city', 'name', False) or default_city # type: ignore
+    city_name: str = get_parameter_of_request(request.args.get('city', data.default_city), 'city', 'name', False) or data.default_city # type: ignore
     infra: Optional[str] = request.args.get('infrastructure')
     if infra and infra not in ('all', 'mean'):
         infra = get_parameter_of_request(infra, 'infrastructure', 'name') # type: ignore
@@ -1381,13 +2756,13 @@ def provision_v3_prosperity(location_type: str) -> Response:
     district: Optional[str] = request.args.get('district', 'all')
     if district:
         if district.isnumeric():
-            district = city_hierarchy[city_hierarchy['district_id'] == int(district)]['district'].iloc[0] \
-                    if int(district) in city_hierarchy['district_id'] else 'None'
+            district = data.city_hierarchy[data.city_hierarchy['district_id'] == int(district)]['district'].iloc[0] \
+                    if int(district) in data.city_hierarchy['district_id'].values else 'None'
     municipality: Optional[str] = request.args.get('municipality', 'all')
     if municipality:
         if municipality.isnumeric():
-            municipality = city_hierarchy[city_hierarchy['municipality_id'] == int(municipality)]['municipality'].iloc[0] \
-                    if int(municipality) in city_hierarchy['municipality_id'] else 'None'
+            municipality = data.city_hierarchy[data.city_hierarchy['municipality_id'] == int(municipality)]['municipality'].iloc[0] \
+                    if int(municipality) in data.city_hierarchy['municipality_id'].values else 'None'
     block: Optional[Union[str, int]] = request.args.get('block', 'all')
     if block and block != 'all':
         if block.isnumeric(): # type: ignore
@@ -1398,124 +2773,35 @@ def provision_v3_prosperity(location_type: str) -> Response:
     location_type_single = 'district' if location_type == 'districts' else 'municipality' if location_type == 'municipalities' else 'block'
 
     if location_type == 'districts':
-        res = provision_administrative_units[city_name]
         if municipality == 'mean':
             municipality = None
         if block == 'mean':
             block = None
     elif location_type == 'municipalities':
-        res = provision_municipalities[city_name]
         if district == 'all' or district == 'mean':
             district = None
         if block == 'mean':
             block = None
     else:
-        res = provision_blocks[city_name]
         if district == 'all' or district == 'mean':
             district = None
         if municipality == 'all' or municipality == 'mean':
             municipality = None
 
-    if location_type == 'blocks':
-        if block and block not in ('all', 'mean'):
-            res = res[res['block'] == block]
-        elif municipality and municipality not in ('all', 'mean'):
-            res = res[res['block'].isin(blocks[blocks['municipality'] == municipality].index)]
-        elif district and district not in ('all', 'mean'):
-            res = res[res['block'].isin(blocks[blocks['district'] == district].index)]
-    elif location_type == 'municipalities':
+    city_data = data.cities.get(city_name)
+    cube = city_data.prosperity_cubes.get(location_type) if city_data is not None else None
+    locations: Optional[np.ndarray] = None
+    if cube is not None:
         if block and block not in ('all', 'mean'):
-            res = res[res['municipality'] == blocks[blocks['municipality'].loc[block]]]
+            locations = cube.location_filters['block'].get(block, prosperity.empty_locations)
         elif municipality and municipality not in ('all', 'mean'):
-            res = res[res['municipality'] == municipality]
+            locations = cube.location_filters['municipality'].get(municipality, prosperity.empty_locations)
         elif district and district not in ('all', 'mean'):
-            res = res[res['municipality'].isin(city_hierarchy[city_hierarchy['district'] == district]['municipality'])]
-    else:
-        if block and block not in ('all', 'mean'):
-            res = res[res['district'] == blocks[blocks['district'].loc[block]]]
-        elif municipality and municipality not in ('all', 'mean'):
-            res = res[res['district'] == city_hierarchy[city_hierarchy['municipality'] == municipality]['district'].iloc[0]]
-        elif district and district not in ('all', 'mean'):
-            res = res[res['district'] == district]
-    
-    if not provision_only:
-        n: pd.DataFrame = needs[['service_type', 'social_group', 'significance']].merge(
-                infrastructure[['service_type', 'city_function', 'infrastructure']], how='inner', on='service_type') \
-                        [[aggregation_type, 'social_group', 'significance']]
-        n = n.groupby([aggregation_type, 'social_group']).mean().reset_index()
-        if social_group not in ('all', 'mean'):
-            n = n[n['social_group'] == social_group][[aggregation_type, 'significance']]
-
-        res = res.merge(infrastructure[['service_type', 'city_function', 'infrastructure']], how='inner', on='service_type') \
-                [[location_type_single, aggregation_type, 'houses_count', 'services_count', 'services_load_mean', 'services_load_sum',
-                        'houses_reserve_mean', 'houses_reserve_sum', 'services_reserve_mean', 'services_reserve_sum', 'houses_provision', 'services_evaluation']]
-        res = res.merge(n, how='inner', on=aggregation_type)
-    else:
-        res = res.merge(infrastructure[['service_type', 'city_function', 'infrastructure']], how='inner', on='service_type') \
-                [[location_type_single, aggregation_type, 'houses_count', 'services_count', 'services_load_mean', 'services_load_sum',
-                        'houses_reserve_mean', 'houses_reserve_sum', 'services_reserve_mean', 'services_reserve_sum', 'houses_provision', 'services_evaluation']]
-
-    if aggregation_value not in ('all', 'mean'):
-        res = res[res[aggregation_type] == aggregation_value]
-
-    aggregation_labels: List[str] = []
-    if aggregation_value == 'mean':
-        aggregation_labels.append(aggregation_type)
-    if social_group == 'mean' and not provision_only:
-        aggregation_labels.append('social_group')
-    if district == 'mean' or municipality == 'mean' or block == 'mean':
-        aggregation_labels.append(location_type_single)
-
-    if res[[location_type_single, aggregation_type]].drop_duplicates().shape[0] != res.shape[0]:
-        for column in ('services_load_mean', 'services_reserve_mean', 'services_evaluation'):
-            res[column] *= res['services_count']
-        for column in ('houses_reserve_mean', 'houses_provision'):
-            res[column] *= res['houses_count']
-        if not provision_only:
-            res['significance'] *= res['services_count']
-            gr = res.groupby([location_type_single, aggregation_type, 'social_group'])
-        else:
-            gr = res.groupby([location_type_single, aggregation_type])
-        res = gr.sum()[['houses_count', 'services_count', 'services_load_mean', 'services_load_sum', 'services_reserve_mean', 'services_reserve_sum',
-                'houses_reserve_mean', 'houses_reserve_sum', 'houses_provision', 'services_evaluation']]
-        if not provision_only:
-            res = res.join(gr.sum()['significance'])
-            res['significance'] /= res['services_count'].replace({0: 1})
-        res = res.reset_index()
-        for column in ('services_load_mean', 'services_reserve_mean', 'services_evaluation'):
-            res[column] /= res['services_count'].replace({0 : 1})
-        for column in ('houses_reserve_mean', 'houses_provision'):
-            res[column] /= res['houses_count'].replace({0 : 1})
-
-    if len(aggregation_labels) != 0:
-        res = res.drop(aggregation_labels, axis=1)
-        aggr = set(res.columns) - {'houses_provision', 'services_evaluation', 'significance', 'houses_count', 'services_count',
-                'services_load_mean', 'services_load_sum', 'houses_reserve_mean', 'houses_reserve_sum', 'services_reserve_mean',
-                'services_reserve_sum'} - set(aggregation_labels)
-        for column in ('services_load_mean', 'services_reserve_mean', 'services_evaluation'):
-            res[column] *= res['services_count']
-        for column in ('houses_reserve_mean', 'houses_provision'):
-            res[column] *= res['houses_count'].replace({0 : 1})
-        if not provision_only:
-            res['significance'] *= res['services_count']
-        if len(aggr) == 0:
-            res = pd.DataFrame(res.sum()).transpose()
-        else:
-            res = res.groupby(list(aggr)).sum().reset_index()
-        for column in ('services_load_mean', 'services_reserve_mean', 'services_evaluation'):
-            res[column] /= res['services_count']
-        for column in ('houses_reserve_mean', 'houses_provision'):
-            res[column] /= res['houses_count'].replace({0 : 1})
-        if not provision_only:
-            res['significance'] /= res['services_count'].replace({0: 1})
+            locations = cube.location_filters['district'].get(district, prosperity.empty_locations)
+
+    res = prosperity.query_prosperity(cube, location_type_single, aggregation_type, locations, aggregation_value, social_group, provision_only,
+            district == 'mean' or municipality == 'mean' or block == 'mean')
 
-    if not provision_only:
-        res['prosperity'] = (10 + res['significance'] * (res['houses_provision'] - 10)).apply(lambda x: round(x, 2))
-        res['significance'] = res['significance'].apply(lambda x: round(x, 2))
-    for column in ('services_load_mean', 'houses_reserve_mean', 'houses_reserve_sum', 'services_reserve_mean', 'services_reserve_sum',
-            'houses_provision', 'services_evaluation'):
-        res[column] = res[column].apply(lambda x: round(x, 2))
-    
     parameters: Dict[str, Any] = {
         'aggregation_type': aggregation_type,
         'aggregation_value': aggregation_value,
@@ -1529,10 +2815,13 @@ def provision_v3_prosperity(location_type: str) -> Response:
     if not provision_only:
         parameters['social_group'] = social_group
 
+    format = response_format()
+    if format != 'json':
+        return table_response(res, format, f'prosperity_{location_type}', parameters)
     return make_response(jsonify({
         '_links': {'self': {'href': request.full_path}},
         '_embedded': {
-            'prosperity': list(res.transpose().replace({np.nan: None}).to_dict().values()),
+            'prosperity': res.replace({np.nan: None}).to_dict('records'),
             'parameters': parameters
         }
     }))
@@ -1541,9 +2830,26 @@ def provision_v3_prosperity(location_type: str) -> Response:
 def not_found(_):
     return make_response(jsonify({'error': 'Not found'}), 404)
 
+@app.errorhandler(db_pool.PoolTimeout)
+def pool_timeout(error: db_pool.PoolTimeout):
+    logger.warning(f'Request {request.full_path} was not served: {error}')
+    return make_response(jsonify({
+        'error': str(error),
+        'path': request.path
+    }), 503)
+
+@app.errorhandler(WrongParameter)
+@app.errorhandler(table_formats.UnsupportedFormat)
+def wrong_parameter(error: ValueError):
+    return make_response(jsonify({
+        '_links': {'self': {'href': request.full_path}},
+        '_embedded': {
+            'error': str(error)
+        }
+    }), 400)
+
 @app.errorhandler(Exception)
 def any_error(error: Exception):
-    houses_properties.conn.rollback()
     with logger.contextualize(method=request.method, user=request.remote_addr, endpoint=request.full_path, handler='error'):
         logger.error(f'error {error!r}')
         logger.warning('Traceback:' + '\n'.join(traceback.format_tb(error.__traceback__)))
@@ -1552,7 +2858,8 @@ def any_error(error: Exception):
         'error_type': str(type(error)),
         'path': request.path,
         'params': '&'.join(map(lambda x: f'{x[0]}={x[1]}', request.args.items())),
-        'trace': list(itertools.chain.from_iterable(map(lambda x: x.split('\n'), traceback.format_tb(error.__traceback__))))
+        'trace': list(itertools.chain.from_iterable(map(lambda x: x.split('\n'), traceback.format_tb(error.__traceback__)))),
+        **({'profile': f'/api/profiles/{g.profile.id}/'} if g.get('profile') is not None else {})
     }), 500)
 
 
@@ -1591,17 +2898,47 @@ def any_error(error: Exception):
         help='endpoint for getting personal transport polygons')
 @click.option('-D', '--debug', envvar='PROVISION_ENABLE_DEBUG', is_flag=True, help='enable debug')
 @click.option('-nDE', '--no_db_endpoints', envvar='PROVISION_DISABLE_DB_ENDPOINTS', is_flag=True, help='disable select endpoint (due to security or other reasons)')
+@click.option('-dRL', '--db_rows_limit', envvar='PROVISION_DB_ROWS_LIMIT', type=int, default=100000,
+        help='maximum number of rows returned by /api/db query endpoint')
+@click.option('-dBL', '--db_bytes_limit', envvar='PROVISION_DB_BYTES_LIMIT', type=int, default=100 * 1024 * 1024,
+        help='maximum size of /api/db query endpoint response in bytes (csv, json and geojson formats)')
+@click.option('-dST', '--db_statement_timeout', envvar='PROVISION_DB_STATEMENT_TIMEOUT', type=float, default=60.0,
+        help='seconds for a /api/db query statement to run before it is cancelled')
+@click.option('-dPS', '--db_pool_size', envvar='PROVISION_DB_POOL_SIZE', type=int, default=10,
+        help='maximum number of connections to the main database used by requests at the same time')
+@click.option('-dPT', '--db_pool_timeout', envvar='PROVISION_DB_POOL_TIMEOUT', type=float, default=10.0,
+        help='seconds for a request to wait for a free database connection before failing with 503')
+@click.option('-pDC', '--preload_default_city', envvar='PROVISION_PRELOAD_DEFAULT_CITY', is_flag=True,
+        help='load data of the default city in the background right after the start instead of the first request to it')
+@click.option('-dJ', '--db_json', envvar='PROVISION_DB_JSON', is_flag=True,
+        help='assemble JSON of geometry-heavy endpoints in the database instead of parsing and serializing it row by row')
+@click.option('-zC', '--zones_concurrency', envvar='PROVISION_ZONES_CONCURRENCY', type=int, default=4,
+        help='number of public transport availability zones resolved at the same time by the bulk availability zones endpoints')
+@click.option('-eCS', '--engine_cache_size', envvar='PROVISION_ENGINE_CACHE_SIZE', type=int, default=32,
+        help='number of provision calculations with overridden normatives kept in memory by the calculation endpoint')
+@click.option('-w', '--workers', envvar='PROVISION_WORKERS', type=int, default=1,
+        help='number of worker processes sharing the data loaded before they are forked (copy-on-write)')
+@click.option('-sF', '--snapshot_file', envvar='PROVISION_SNAPSHOT_FILE', type=click.Path(dir_okay=False), default=None,
+        help='file to start from without waiting for the database and to save loaded data to')
+@click.option('-prT', '--profile_token', envvar='PROVISION_PROFILE_TOKEN', default=None,
+        help='admin token which enables profiling of a request sent with X-Profile-Token header')
+@click.option('-prC', '--profile_clients', envvar='PROVISION_PROFILE_CLIENTS', default='',
+        help='comma-separated addresses of clients allowed to profile requests with ?_profile=1')
 def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: str, houses_db_user: str, houses_db_pass: str,
         provision_db_addr: str, provision_db_port: int, provision_db_name: str, provision_db_user: str, provision_db_pass: str,
         default_city: str, mongo_url: Optional[str], public_transport_endpoint: str, personal_transport_endpoint: str, walking_endpoint: str,
-        debug: bool, no_db_endpoints: bool):
+        debug: bool, no_db_endpoints: bool, db_rows_limit: int, db_bytes_limit: int, db_statement_timeout: float,
+        db_pool_size: int, db_pool_timeout: float, preload_default_city: bool,
+        db_json: bool, zones_concurrency: int, engine_cache_size: int, workers: int, snapshot_file: Optional[str], profile_token: Optional[str], profile_clients: str):
     global collect_geom
     global houses_properties
     global isochrones_properties
-    globals()['default_city'] = default_city
 
     houses_properties = Properties(houses_db_addr, houses_db_port, houses_db_name, houses_db_user, houses_db_pass)
+    houses_properties.init_pool(db_pool_size, db_pool_timeout)
     isochrones_properties = Properties(provision_db_addr, provision_db_port, provision_db_name, provision_db_user, provision_db_pass)
+    isochrones_properties.init_pool(db_pool_size, db_pool_timeout)
+    db_pool.make_green()
 
     logger.remove()
     logger.add(sys.stderr, format='api <level>[{level}]</level> - <blue>{time:YY-MM-DD HH:mm:ss}</blue>: {message}', level='INFO' if not debug else 'DEBUG',
@@ -1612,7 +2949,9 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
                     ' <yellow>{extra[user]} {extra[method]}</yellow> {extra[endpoint]} <cyan>({extra[handler]})</cyan>: <blue>{message}</blue>',
             level='INFO' if not debug else 'DEBUG', filter=lambda record: 'request' in record['extra'], colorize=True)
 
-    if mongo_url is not None:
+    def attach_mongo_logger() -> None:
+        if mongo_url is None:
+            return
         if ':' not in mongo_url or '@' not in mongo_url:
             public_mongo_url = mongo_url
         else:
@@ -1621,10 +2960,14 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
             from mongolog import MongoHandler
             mongo_handler = MongoHandler(mongo_url, "provision_api", level='INFO' if not debug else 'DEBUG')
             logger.add(mongo_handler, filter=lambda record: 'request' in record['extra'])
+            globals()['mongo_handler'] = mongo_handler
             logger.info(f'Attached mongo logger at {public_mongo_url}')
         except Exception as ex:
             logger.error(f'Could not attach required mongo database (url: {public_mongo_url}) for logging: {ex!r}')
 
+    if workers == 1:
+        attach_mongo_logger()
+
     if not no_db_endpoints:
         try:
             from io import BytesIO, StringIO
@@ -1643,10 +2986,43 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
                 if format != 'geojson':
                     geometry_column = None
                 execute_as_is = request.args.get('execute_as_is', '').lower() in ('t', '1', 'true', 'on')
-                df = saver.Query.select(houses_properties.conn, request.args['query'], execute_as_is)
-                buffer = StringIO() if format != 'xlsx' else BytesIO()
-                saver.Save.to_buffer(df, buffer, format, geometry_column)
-                response = make_response(buffer.getvalue()) # type: ignore
+                rows_limit = db_rows_limit
+                if 'limit' in request.args:
+                    if not request.args['limit'].isnumeric() or int(request.args['limit']) == 0:
+                        raise WrongParameter(f"limit must be a positive integer, but '{request.args['limit']}' is given")
+                    rows_limit = min(int(request.args['limit']), db_rows_limit)
+                limits = query_stream.Limits(rows_limit, db_bytes_limit)
+                conn = houses_properties.conn
+                try:
+                    result = query_stream.execute(conn, request.args['query'], db_statement_timeout, None if execute_as_is else geometry_column)
+                except Exception:
+                    conn.rollback()
+                    raise
+                def on_truncated(reason: str) -> None:
+                    logger.warning(f'Query result is truncated: {reason}')
+                def on_error(ex: Exception) -> None:
+                    logger.error(f'Query result streaming is interrupted: {ex!r}')
+                    raise ex
+                if format in ('csv', 'json', 'geojson'):
+                    chunks = query_stream.to_csv(result, limits, on_truncated, on_error) if format == 'csv' else \
+                            query_stream.to_json(result, limits, on_truncated, on_error) if format == 'json' else \
+                            query_stream.to_geojson(result, geometry_column, limits, on_truncated, on_error) # type: ignore
+                    def generate() -> Iterator[bytes]:
+                        with conn:
+                            try:
+                                yield from chunks
+                            finally:
+                                result.close()
+                    response = app.response_class(stream_with_context(generate()))
+                else:
+                    with conn:
+                        try:
+                            df = pd.DataFrame(list(result.rows(rows_limit, on_error)), columns=result.columns)
+                        finally:
+                            result.close()
+                    buffer = StringIO() if format != 'xlsx' else BytesIO()
+                    saver.Save.to_buffer(df, buffer, format, None)
+                    response = make_response(buffer.getvalue()) # type: ignore
                 response.headers['Content-Type'] = 'application/json' if format in ('json', 'geojson') else \
                         'text/csv' if format == 'csv' else 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' if format == 'xlsx' \
                         else 'application/octet-stream'
@@ -1683,10 +3059,7 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
             @app.route('/api/logs/')
             @logged
             def logs() -> Response:
-                with open('provision_api.log', 'rt', encoding='utf-8') as f:
-                    res =  make_response(f.read())
-                    res.headers['Content-Type'] = 'text/plain; charset=utf-8'
-                    return res
+                return log_files_response(['provision_api.log'])
 
             @app.route('/api/logs/<command>')
             @app.route('/api/logs/<command>/')
@@ -1702,14 +3075,7 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
                     else:
                         fname = logs_list[log_n]
                 elif command in ('all', 'full'):
-                    logs_strs = []
-                    for fname in logs_list:
-                        with open(fname, 'rt', encoding='utf-8') as f:
-                            logs_strs.append(f.read())
-                    res = make_response(''.join(logs_strs))
-                    res.headers['Content-Type'] = 'text/plain; charset=utf-8'
-                    res.headers['Content-Disposition'] = f'filename=provision_api_{time.strftime("%Y-%d-%m %H.%M.%S")}.log'
-                    return res
+                    return log_files_response(logs_list, f'provision_api_{time.strftime("%Y-%d-%m %H.%M.%S")}.log')
                 elif command == 'delete':
                     for fname in logs_list[:-1]:
                         os.remove(fname)
@@ -1719,11 +3085,7 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
                         fname = f'provision_api.{command}.log'
                     else:
                         return make_response(jsonify({'error': f'Requested log (provision_api.{command}.log) is not found, try: /api/logs/list'}), 404)
-                with open(fname, 'rt', encoding='utf-8') as f:
-                    res =  make_response(f.read())
-                    res.headers['Content-Type'] = 'text/plain; charset=utf-8'
-                    res.headers['Content-Disposition'] = f'filename=provision_api_{time.strftime("%Y-%d-%m %H.%M.%S")}.log'
-                    return res
+                return log_files_response([fname], f'provision_api_{time.strftime("%Y-%d-%m %H.%M.%S")}.log')
 
             @app.route('/api/db/query')
             @logged
@@ -1752,7 +3114,35 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
 
     logger.info('Getting global data')
 
-    update_global_data()
+    globals()['snapshot_path'] = snapshot_file
+    opened_snapshot: Optional[snapshot.Snapshot] = None
+    if snapshot_file is not None:
+        try:
+            opened_snapshot = snapshot.open_snapshot(snapshot_file)
+        except Exception as ex:
+            logger.error(f'Snapshot {snapshot_file} could not be opened, loading data from the database: {ex!r}')
+    if workers > 1:
+        globals()['deferred_city_loads'] = []
+    if opened_snapshot is not None:
+        globals()['global_data'] = load_global_data_from_snapshot(opened_snapshot, 1, default_city)
+        logger.info(f'Data is loaded from snapshot {snapshot_file} created at {opened_snapshot.created_at}, revalidating it in the background')
+        if workers == 1:
+            threading.Thread(target=revalidate_snapshot, args=(opened_snapshot,), daemon=True).start()
+    else:
+        update_global_data(default_city)
+        if snapshot_file is not None and workers == 1:
+            threading.Thread(target=save_snapshot, args=(snapshot_file, global_data), daemon=True).start()
+    globals()['preload_default_city'] = preload_default_city
+    globals()['db_json'] = db_json
+    globals()['zones_concurrency'] = zones_concurrency
+    globals()['engine_cache_size'] = engine_cache_size
+    globals()['profile_token'] = profile_token or None
+    globals()['profile_clients'] = [client.strip() for client in profile_clients.split(',') if client.strip()]
+    if preload_default_city:
+        if workers == 1:
+            threading.Thread(target=global_data.cities.get, args=(default_city,), daemon=True).start()
+        else:
+            global_data.cities.get(default_city)
 
     logger.opt(colors=True).info(f'Starting application on 0.0.0.0:{port} with houses DB as'
             f' (<magenta>{houses_properties.db_user}@{houses_properties.db_addr}:{houses_properties.db_port}/{houses_properties.db_name}</magenta>) and provision DB as'
@@ -1761,20 +3151,50 @@ def main(port: int, houses_db_addr: str, houses_db_port: int, houses_db_name: st
     logger.opt(colors=True).info(f'Public_ransport endpoint is set to <green>"{public_transport_endpoint}"</green>'
             f' personal_transport endpoint = <green>"{personal_transport_endpoint}"</green>,'
             f' walking endpoint = <green>"{walking_endpoint}"</green>')
-    collect_geom = collect_geometry.CollectGeometry(isochrones_properties.conn, public_transport_endpoint, personal_transport_endpoint,
+    collect_geom = collect_geometry.CollectGeometry(lambda: isochrones_properties.conn, public_transport_endpoint, personal_transport_endpoint,
             walking_endpoint, use_alternative_personal_transport=True, use_alternative_public_transport=True,
-            raise_exceptions=True, download_geometry_after_timeout=True, walking_endpoint_allow_multiple_times=True)
+            raise_exceptions=True, download_geometry_after_timeout=True, walking_endpoint_allow_multiple_times=True,
+            connect=isochrones_properties.connect)
 
     if debug:
         app.run(host='0.0.0.0', port=port, debug=debug)
     else:
         import gevent.pywsgi
 
-        app_server = gevent.pywsgi.WSGIServer(('0.0.0.0', port), app)
-        try:
-            app_server.serve_forever()
-        except KeyboardInterrupt:
-            app_server.stop()
+        if workers > 1:
+            def startup() -> bool:
+                if opened_snapshot is None:
+                    if snapshot_file is not None:
+                        save_snapshot(snapshot_file, global_data)
+                    return False
+                generation = global_data.generation
+                revalidate_snapshot(opened_snapshot)
+                if global_data.generation == generation:
+                    return process_deferred_city_loads()
+                if preload_default_city:
+                    global_data.cities.get(global_data.default_city)
+                return True
+
+            def close_connections() -> None:
+                houses_properties.close()
+                isochrones_properties.close()
+
+            def reopen_connections() -> None:
+                houses_properties.reopen_pool()
+                isochrones_properties.reopen_pool()
+                attach_mongo_logger()
+
+            globals()['master_pid'] = os.getpid()
+            app_server = gevent.pywsgi.WSGIServer(('0.0.0.0', port), app, spawn=gevent.pool.Pool())
+            server = prefork.PreforkServer(app_server, workers, close_connections, reopen_connections, reload_workers_data, load_worker_city)
+            globals()['prefork_server'] = server
+            server.serve(startup)
+        else:
+            app_server = gevent.pywsgi.WSGIServer(('0.0.0.0', port), app)
+            try:
+                app_server.serve_forever()
+            except KeyboardInterrupt:
+                app_server.stop()
     logger.info('Finishing the provision_api server')
 
 
@@ -0,0 +1,220 @@
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_METERS = 6371008.8
+
+Accessibility = NamedTuple('Accessibility', [
+    ('houses', pd.DataFrame),
+    ('services', pd.DataFrame),
+    ('pair_houses', np.ndarray),
+    ('pair_services', np.ndarray),
+    ('service_offsets', np.ndarray),
+    ('house_pairs', np.ndarray),
+    ('house_offsets', np.ndarray)
+])
+
+Evaluation = NamedTuple('Evaluation', [
+    ('house_counts', np.ndarray),
+    ('service_loads', np.ndarray),
+    ('service_reserves', np.ndarray),
+    ('house_reserves', np.ndarray)
+])
+
+NewService = NamedTuple('NewService', [
+    ('longitude', float),
+    ('latitude', float),
+    ('max_load', float),
+    ('houses', np.ndarray)
+])
+
+
+def _offsets(positions: np.ndarray, size: int) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(np.bincount(positions, minlength=size))))
+
+def _accessibility(houses: pd.DataFrame, services: pd.DataFrame, pair_houses: np.ndarray, pair_services: np.ndarray) -> Accessibility:
+    order = np.lexsort((pair_houses, pair_services))
+    pair_houses, pair_services = pair_houses[order], pair_services[order]
+    return Accessibility(houses, services, pair_houses, pair_services, _offsets(pair_services, services.shape[0]),
+            np.argsort(pair_houses, kind='stable'), _offsets(pair_houses, houses.shape[0]))
+
+def build_accessibility(houses: pd.DataFrame, services: pd.DataFrame, pairs: pd.DataFrame) -> Accessibility:
+    pairs = pairs.drop_duplicates(['house_id', 'service_id'])
+    pair_houses = houses.index.get_indexer(pairs['house_id'])
+    pair_services = services.index.get_indexer(pairs['service_id'])
+    known = (pair_houses != -1) & (pair_services != -1)
+    return _accessibility(houses, services, pair_houses[known], pair_services[known])
+
+def _segments(offsets: np.ndarray, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    starts = offsets[positions]
+    lengths = offsets[positions + 1] - starts
+    indexes = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return indexes, np.repeat(np.arange(positions.shape[0]), lengths)
+
+def _ratios(numerators: np.ndarray, denominators: np.ndarray) -> np.ndarray:
+    return np.divide(numerators, denominators, out=np.zeros(numerators.shape[0]), where=denominators != 0)
+
+def _reserves(service_loads: np.ndarray, normative: Dict[str, Any], max_loads: Any) -> np.ndarray:
+    return max_loads - np.round(service_loads * normative['normative'] / 1000, 2)
+
+def coefficients(values: np.ndarray, scale: Sequence[float]) -> np.ndarray:
+    if len(scale) == 0:
+        return np.zeros(values.shape[0], dtype=int)
+    exceeded = values[:, None] > np.array(scale, dtype=float)[None, :]
+    return np.where(exceeded.all(axis=1), len(scale), exceeded.argmin(axis=1))
+
+def population(accessibility: Accessibility) -> np.ndarray:
+    return accessibility.houses['population'].to_numpy(dtype=float)
+
+def evaluate(accessibility: Accessibility, normative: Dict[str, Any]) -> Evaluation:
+    houses_population = population(accessibility)
+    pair_houses, pair_services = accessibility.pair_houses, accessibility.pair_services
+    house_counts = np.bincount(pair_houses, minlength=accessibility.houses.shape[0])
+    pair_loads = houses_population[pair_houses] / house_counts[pair_houses]
+    service_loads = np.bincount(pair_services, weights=pair_loads, minlength=accessibility.services.shape[0])
+    service_reserves = _reserves(service_loads, normative, normative['max_load'])
+    house_reserves = np.bincount(pair_houses, weights=service_reserves[pair_services] * _ratios(pair_loads, service_loads[pair_services]),
+            minlength=accessibility.houses.shape[0])
+    house_reserves = np.where(house_counts == 0, -houses_population * normative['normative'] / 1000, house_reserves)
+    return Evaluation(house_counts, service_loads, service_reserves, house_reserves)
+
+def houses_within(accessibility: Accessibility, longitude: float, latitude: float, radius_meters: float) -> np.ndarray:
+    longitudes = accessibility.houses['longitude'].to_numpy(dtype=float)
+    latitudes = accessibility.houses['latitude'].to_numpy(dtype=float)
+    delta = np.degrees(radius_meters / EARTH_RADIUS_METERS)
+    candidates = np.flatnonzero((np.abs(latitudes - latitude) <= delta) &
+            (np.abs(longitudes - longitude) <= delta / max(np.cos(np.radians(latitude)), 1e-6)))
+    lon1, lat1 = np.radians(longitude), np.radians(latitude)
+    lon2, lat2 = np.radians(longitudes[candidates]), np.radians(latitudes[candidates])
+    haversine = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return candidates[2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(haversine)) <= radius_meters]
+
+def accessibility_by_radius(accessibility: Accessibility, radius_meters: float, chunk_size: int = 256) -> Accessibility:
+    longitudes = accessibility.houses['longitude'].to_numpy(dtype=float)
+    latitudes = accessibility.houses['latitude'].to_numpy(dtype=float)
+    by_latitude = np.argsort(latitudes, kind='stable')
+    sorted_latitudes = latitudes[by_latitude]
+    service_longitudes = accessibility.services['longitude'].to_numpy(dtype=float)
+    service_latitudes = accessibility.services['latitude'].to_numpy(dtype=float)
+    located = np.flatnonzero(~np.isnan(service_longitudes) & ~np.isnan(service_latitudes))
+    delta = np.degrees(radius_meters / EARTH_RADIUS_METERS)
+    pair_houses: List[np.ndarray] = []
+    pair_services: List[np.ndarray] = []
+    for start in range(0, located.shape[0], chunk_size):
+        services = located[start:start + chunk_size]
+        lows = np.searchsorted(sorted_latitudes, service_latitudes[services] - delta, 'left')
+        highs = np.searchsorted(sorted_latitudes, service_latitudes[services] + delta, 'right')
+        candidates, local_services = _segments(np.stack((lows, highs), axis=1).ravel(), np.arange(services.shape[0]) * 2)
+        candidates, candidate_services = by_latitude[candidates], services[local_services]
+        lon1, lat1 = np.radians(service_longitudes[candidate_services]), np.radians(service_latitudes[candidate_services])
+        lon2, lat2 = np.radians(longitudes[candidates]), np.radians(latitudes[candidates])
+        haversine = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        within = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(haversine)) <= radius_meters
+        pair_houses.append(candidates[within])
+        pair_services.append(candidate_services[within])
+    return _accessibility(accessibility.houses, accessibility.services,
+            np.concatenate(pair_houses) if len(pair_houses) != 0 else np.zeros(0, dtype=int),
+            np.concatenate(pair_services) if len(pair_services) != 0 else np.zeros(0, dtype=int))
+
+def house_positions(accessibility: Accessibility, house_ids: Sequence[int]) -> np.ndarray:
+    positions = accessibility.houses.index.get_indexer(list(house_ids))
+    return np.unique(positions[positions != -1])
+
+def houses_frame(accessibility: Accessibility, evaluation: Evaluation, normative: Dict[str, Any]) -> pd.DataFrame:
+    reserves = np.round(evaluation.house_reserves, 2)
+    return pd.DataFrame({
+        'reserve_resources': reserves,
+        'provision': coefficients(reserves, normative['house_evaluation'])
+    }, index=accessibility.houses.index)
+
+def services_frame(accessibility: Accessibility, evaluation: Evaluation, normative: Dict[str, Any]) -> pd.DataFrame:
+    return pd.DataFrame({
+        'houses_in_access': np.diff(accessibility.service_offsets),
+        'people_in_access': np.bincount(accessibility.pair_services, weights=population(accessibility)[accessibility.pair_houses],
+                minlength=accessibility.services.shape[0]).astype(int),
+        'service_load': evaluation.service_loads.astype(int),
+        'needed_capacity': np.round(evaluation.service_loads * normative['normative'] / 1000, 2).astype(int),
+        'reserve_resource': np.round(evaluation.service_reserves, 2),
+        'provision': coefficients(evaluation.service_reserves, normative['service_evaluation'])
+    }, index=accessibility.services.index)
+
+def what_if(accessibility: Accessibility, normative: Dict[str, Any], baseline: Evaluation, added: List[NewService],
+        removed: np.ndarray) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    houses_population = population(accessibility)
+    pair_houses, pair_services = accessibility.pair_houses, accessibility.pair_services
+    removed = np.unique(removed)
+    is_removed = np.zeros(accessibility.services.shape[0], dtype=bool)
+    is_removed[removed] = True
+
+    removed_pairs, _ = _segments(accessibility.service_offsets, removed)
+    house_counts = baseline.house_counts.copy()
+    np.subtract.at(house_counts, pair_houses[removed_pairs], 1)
+    for service in added:
+        house_counts[service.houses] += 1
+    changed_houses = np.unique(np.concatenate([pair_houses[removed_pairs]] + [service.houses for service in added]))
+
+    touched_pairs, _ = _segments(accessibility.house_offsets, changed_houses)
+    affected_services = np.unique(pair_services[accessibility.house_pairs[touched_pairs]])
+    affected_services = affected_services[~is_removed[affected_services]]
+    affected_pairs, local_services = _segments(accessibility.service_offsets, affected_services)
+    service_loads = baseline.service_loads.copy()
+    service_loads[affected_services] = np.bincount(local_services,
+            weights=houses_population[pair_houses[affected_pairs]] / house_counts[pair_houses[affected_pairs]], minlength=affected_services.shape[0])
+    service_reserves = baseline.service_reserves.copy()
+    service_reserves[affected_services] = _reserves(service_loads[affected_services], normative, normative['max_load'])
+    added_loads = np.array([(houses_population[service.houses] / house_counts[service.houses]).sum() for service in added])
+    added_reserves = _reserves(added_loads, normative, np.array([service.max_load for service in added]))
+
+    recomputed = np.union1d(changed_houses, pair_houses[affected_pairs])
+    house_pair_indexes, local_houses = _segments(accessibility.house_offsets, recomputed)
+    house_pair_indexes = accessibility.house_pairs[house_pair_indexes]
+    houses, services = pair_houses[house_pair_indexes], pair_services[house_pair_indexes]
+    pair_loads = _ratios(houses_population[houses], house_counts[houses].astype(float))
+    house_reserves = np.bincount(local_houses, minlength=recomputed.shape[0],
+            weights=np.where(is_removed[services], 0.0, service_reserves[services] * _ratios(pair_loads, service_loads[services])))
+    for service, load, reserve in zip(added, added_loads, added_reserves):
+        house_reserves += np.bincount(np.searchsorted(recomputed, service.houses), minlength=recomputed.shape[0],
+                weights=reserve * _ratios(houses_population[service.houses] / house_counts[service.houses], np.full(service.houses.shape[0], load)))
+    house_reserves = np.where(house_counts[recomputed] == 0, -houses_population[recomputed] * normative['normative'] / 1000, house_reserves)
+
+    reserves_before, reserves_after = np.round(baseline.house_reserves[recomputed], 2), np.round(house_reserves, 2)
+    houses_delta = accessibility.houses.iloc[recomputed][['district', 'municipality', 'block', 'population']].rename_axis('house_id').assign(
+        reserve_resources_before=reserves_before,
+        reserve_resources_after=reserves_after,
+        provision_before=coefficients(reserves_before, normative['house_evaluation']),
+        provision_after=coefficients(reserves_after, normative['house_evaluation'])
+    )
+    houses_delta = houses_delta[(houses_delta['reserve_resources_before'] != houses_delta['reserve_resources_after'])
+            | (houses_delta['provision_before'] != houses_delta['provision_after'])]
+
+    def services_part(positions: np.ndarray, status: str, after: bool) -> pd.DataFrame:
+        return accessibility.services.iloc[positions].reindex(columns=['district', 'municipality', 'block', 'longitude', 'latitude']) \
+                .rename_axis('service_id').reset_index().assign(
+            status=status,
+            houses_in_access=np.diff(accessibility.service_offsets)[positions],
+            service_load_before=baseline.service_loads[positions].astype(int),
+            service_load_after=service_loads[positions].astype(int) if after else None,
+            reserve_resource_before=np.round(baseline.service_reserves[positions], 2),
+            reserve_resource_after=np.round(service_reserves[positions], 2) if after else None,
+            provision_before=coefficients(baseline.service_reserves[positions], normative['service_evaluation']),
+            provision_after=coefficients(service_reserves[positions], normative['service_evaluation']) if after else None
+        )
+    new_services = pd.DataFrame({
+        'service_id': [None] * len(added),
+        'longitude': [service.longitude for service in added],
+        'latitude': [service.latitude for service in added],
+        'status': 'added',
+        'houses_in_access': [service.houses.shape[0] for service in added],
+        'service_load_before': None,
+        'service_load_after': added_loads.astype(int),
+        'reserve_resource_before': None,
+        'reserve_resource_after': np.round(added_reserves, 2),
+        'provision_before': None,
+        'provision_after': coefficients(added_reserves, normative['service_evaluation'])
+    })
+    changed_services = services_part(affected_services, 'changed', True)
+    changed_services = changed_services[(changed_services['reserve_resource_before'] != changed_services['reserve_resource_after'])
+            | (changed_services['service_load_before'] != changed_services['service_load_after'])]
+    services_delta = pd.concat([new_services, services_part(removed, 'removed', False), changed_services], ignore_index=True)
+    return houses_delta, services_delta
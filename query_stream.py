@@ -0,0 +1,149 @@
+import csv
+import datetime
+import io
+import re
+import uuid
+from decimal import Decimal
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Sequence
+
+import psycopg2
+import psycopg2.extensions
+import simplejson as json
+from psycopg2 import sql
+
+FETCH_SIZE = 2000
+_LEADING_COMMENTS = re.compile(r'^(\s+|--[^\n]*(\n|$)|/\*.*?\*/)*', re.DOTALL)
+_CURSOR_STATEMENTS = ('select', 'with', 'values', 'table')
+
+Limits = NamedTuple('Limits', [
+    ('rows', int),
+    ('bytes', int)
+])
+
+
+def _first_word(query: str) -> str:
+    query = _LEADING_COMMENTS.sub('', query, count=1)
+    match = re.match(r'\(*\s*(\w+)', query)
+    return match.group(1).lower() if match is not None else ''
+
+def execute(conn: 'psycopg2.connection', query: str, statement_timeout: float,
+        geometry_column: Optional[str] = None) -> 'QueryResult':
+    query = query.strip().rstrip(';').strip()
+    with conn.cursor() as cur:
+        cur.execute('SET LOCAL statement_timeout = %s', (max(int(statement_timeout * 1000), 1),))
+        if geometry_column is not None and _first_word(query) in _CURSOR_STATEMENTS:
+            cur.execute(sql.SQL('SELECT * FROM ({}) q LIMIT 0').format(sql.SQL(query)))
+            columns = [column.name for column in cur.description]
+            if geometry_column in columns:
+                query = sql.SQL('SELECT {} FROM ({}) q').format(sql.SQL(', ').join(
+                    sql.SQL('ST_AsGeoJSON(q.{0}) AS {0}').format(sql.Identifier(column)) if column == geometry_column \
+                            else sql.SQL('q.{}').format(sql.Identifier(column)) for column in columns
+                ), sql.SQL(query)).as_string(conn)
+    if _first_word(query) in _CURSOR_STATEMENTS:
+        cur = conn.cursor(name=f'db_select_{uuid.uuid4().hex[:12]}')
+        cur.itersize = FETCH_SIZE
+    else:
+        cur = conn.cursor()
+    cur.execute(query)
+    return QueryResult(cur)
+
+class QueryResult:
+    def __init__(self, cur: psycopg2.extensions.cursor):
+        self.cursor = cur
+        self._first_batch: List[Sequence[Any]] = cur.fetchmany(FETCH_SIZE) if cur.name or cur.description is not None else []
+        self.columns: List[str] = [column.name for column in cur.description] if cur.description is not None else []
+
+    def rows(self, limit: int, on_error: Callable[[Exception], None]) -> Iterator[Sequence[Any]]:
+        batch, self._first_batch = self._first_batch, []
+        while limit > 0 and batch:
+            yield from batch[:limit]
+            limit -= len(batch)
+            if limit <= 0 or len(batch) < FETCH_SIZE:
+                return
+            try:
+                batch = self.cursor.fetchmany(FETCH_SIZE)
+            except psycopg2.Error as ex:
+                on_error(ex)
+                return
+
+    def close(self) -> None:
+        if not self.cursor.closed:
+            self.cursor.close()
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (memoryview, bytes)):
+        return bytes(value).hex()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_json_default, ignore_nan=True)
+
+def _budgeted(head: str, items: Iterator[str], tail: str, budget: int, on_truncated: Callable[[str], None]) -> Iterator[bytes]:
+    tail_bytes = tail.encode()
+    used = len(tail_bytes)
+    chunk: List[bytes] = [head.encode()]
+    chunk_size = len(chunk[0])
+    for item in items:
+        encoded = item.encode()
+        if used + chunk_size + len(encoded) > budget:
+            on_truncated(f'bytes limit of {budget} is reached')
+            break
+        chunk.append(encoded)
+        chunk_size += len(encoded)
+        if chunk_size >= 64 * 1024:
+            used += chunk_size
+            yield b''.join(chunk)
+            chunk, chunk_size = [], 0
+    chunk.append(tail_bytes)
+    yield b''.join(chunk)
+
+def _limited(result: QueryResult, limits: Limits, on_truncated: Callable[[str], None],
+        on_error: Callable[[Exception], None]) -> Iterator[Sequence[Any]]:
+    count = 0
+    for row in result.rows(limits.rows + 1, on_error):
+        count += 1
+        if count > limits.rows:
+            on_truncated(f'rows limit of {limits.rows} is reached')
+            return
+        yield row
+
+def to_csv(result: QueryResult, limits: Limits, on_truncated: Callable[[str], None],
+        on_error: Callable[[Exception], None]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    def line(values: Sequence[Any]) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+    head = line(result.columns) if result.columns else ''
+    return _budgeted(head, (line(row) for row in _limited(result, limits, on_truncated, on_error)), '', limits.bytes, on_truncated)
+
+def to_json(result: QueryResult, limits: Limits, on_truncated: Callable[[str], None],
+        on_error: Callable[[Exception], None]) -> Iterator[bytes]:
+    names = result.columns
+    items = ((', ' if i != 0 else '') + _dumps(dict(zip(names, row))) \
+            for i, row in enumerate(_limited(result, limits, on_truncated, on_error)))
+    return _budgeted('[', items, ']', limits.bytes, on_truncated)
+
+def to_geojson(result: QueryResult, geometry_column: str, limits: Limits, on_truncated: Callable[[str], None],
+        on_error: Callable[[Exception], None]) -> Iterator[bytes]:
+    names = result.columns
+    geometry_index = names.index(geometry_column) if geometry_column in names else None
+    def feature(row: Sequence[Any]) -> str:
+        geometry = row[geometry_index] if geometry_index is not None else None
+        if isinstance(geometry, str):
+            geometry = json.RawJSON(geometry)
+        return _dumps({
+            'type': 'Feature',
+            'geometry': geometry,
+            'properties': {name: value for i, (name, value) in enumerate(zip(names, row)) if i != geometry_index}
+        })
+    items = ((', ' if i != 0 else '') + feature(row) for i, row in enumerate(_limited(result, limits, on_truncated, on_error)))
+    return _budgeted('{"type": "FeatureCollection", "features": [', items, ']}', limits.bytes, on_truncated)
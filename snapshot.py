@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+MAGIC = b'PROVSNAP'
+FORMAT_VERSION = 1
+_ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sII')
+
+
+class SnapshotError(Exception):
+    pass
+
+def frame_fingerprint(frame: pd.DataFrame) -> str:
+    digest = hashlib.sha256(','.join(map(str, (frame.index.name, *frame.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def fingerprint(frames: Dict[str, pd.DataFrame], values: Dict[str, Any]) -> str:
+    digest = hashlib.sha256(json.dumps(values, sort_keys=True, ensure_ascii=False).encode())
+    for name in sorted(frames):
+        digest.update(name.encode())
+        digest.update(frame_fingerprint(frames[name]).encode())
+    return digest.hexdigest()
+
+def _serialize(frame: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _padding(length: int) -> bytes:
+    return b'\0' * (-length % _ALIGNMENT)
+
+def write(path: str, frames: Dict[str, pd.DataFrame], values: Dict[str, Any], fingerprint_value: str) -> None:
+    segments: List[bytes] = []
+    tables: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, frame in frames.items():
+        flat = frame.reset_index() if frame.index.name is not None else frame
+        segment = _serialize(flat)
+        tables[name] = {
+            'offset': offset,
+            'length': len(segment),
+            'index': frame.index.name,
+            'dtypes': {column: str(dtype) for column, dtype in flat.dtypes.items()}
+        }
+        segments.append(segment + _padding(len(segment)))
+        offset += len(segments[-1])
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'fingerprint': fingerprint_value,
+        'values': values,
+        'tables': tables
+    }, ensure_ascii=False).encode()
+    header += b' ' * (-(_PREFIX.size + len(header)) % _ALIGNMENT)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        for segment in segments:
+            file.write(segment)
+    os.replace(tmp_path, path)
+
+def _restore_dtypes(frame: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+    for column, dtype in dtypes.items():
+        if dtype == 'object' and frame[column].dtype != object:
+            values = frame[column].astype(object)
+            frame[column] = values.where(frame[column].notna(), None)
+        elif dtype != str(frame[column].dtype):
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+class Snapshot:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = pa.memory_map(path, 'r')
+        self._buffer = self._file.read_buffer()
+        if self._buffer.size < _PREFIX.size:
+            raise SnapshotError(f'{path} is too short to be a snapshot')
+        magic, version, header_length = _PREFIX.unpack(self._buffer[:_PREFIX.size].to_pybytes())
+        if magic != MAGIC:
+            raise SnapshotError(f'{path} is not a provision snapshot')
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f'{path} has format version {version}, but {FORMAT_VERSION} is supported')
+        header = json.loads(self._buffer[_PREFIX.size:_PREFIX.size + header_length].to_pybytes())
+        self._data_offset = _PREFIX.size + header_length
+        self.created_at: str = header['created_at']
+        self.fingerprint: str = header['fingerprint']
+        self.values: Dict[str, Any] = header['values']
+        self.tables: Dict[str, Dict[str, Any]] = header['tables']
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tables
+
+    def frame(self, name: str) -> pd.DataFrame:
+        description = self.tables[name]
+        start = self._data_offset + description['offset']
+        table = pa.ipc.open_file(self._buffer.slice(start, description['length'])).read_all()
+        frame = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype(), pa.int32(): pd.Int64Dtype()}.get)
+        frame = _restore_dtypes(frame, description['dtypes'])
+        if description['index'] is not None:
+            frame = frame.set_index(description['index'])
+        return frame
+
+    def close(self) -> None:
+        self._file.close()
+
+def open_snapshot(path: str) -> Optional[Snapshot]:
+    if not os.path.isfile(path):
+        return None
+    return Snapshot(path)
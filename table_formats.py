@@ -0,0 +1,66 @@
+import io
+from typing import Any, Dict, Optional
+
+import msgpack
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import simplejson as json
+from werkzeug.datastructures import MIMEAccept
+
+MIME_TYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    'msgpack': 'application/msgpack'
+}
+EXTENSIONS = {'arrow': 'arrows', 'parquet': 'parquet', 'msgpack': 'msgpack'}
+_ACCEPT_ALIASES = {
+    'application/json': 'json',
+    'application/hal+json': 'json',
+    **{mime_type: name for name, mime_type in MIME_TYPES.items()},
+    'application/x-parquet': 'parquet',
+    'application/x-msgpack': 'msgpack'
+}
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+def requested_format(format_parameter: Optional[str], accept: MIMEAccept) -> str:
+    if format_parameter:
+        if format_parameter.lower() == 'json' or format_parameter.lower() in MIME_TYPES:
+            return format_parameter.lower()
+        raise UnsupportedFormat(f"format must be one of 'json', {', '.join(map(repr, MIME_TYPES))}, but '{format_parameter}' is given")
+    best = accept.best_match(list(_ACCEPT_ALIASES), default='application/json')
+    return _ACCEPT_ALIASES[best]
+
+def _to_arrow(df: pd.DataFrame, parameters: Dict[str, Any]) -> pa.Table:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b'parameters': json.dumps(parameters, ensure_ascii=False).encode()
+    })
+
+def _column_values(column: pd.Series) -> list:
+    if isinstance(column.dtype, pd.api.extensions.ExtensionDtype) or column.dtype == object:
+        return column.astype(object).where(column.notna(), None).tolist()
+    return column.tolist()
+
+def serialize(df: pd.DataFrame, format: str, parameters: Dict[str, Any]) -> bytes:
+    if format == 'arrow':
+        table = _to_arrow(df, parameters)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    if format == 'parquet':
+        buffer = io.BytesIO()
+        pq.write_table(_to_arrow(df, parameters), buffer)
+        return buffer.getvalue()
+    if format == 'msgpack':
+        return msgpack.packb({
+            'parameters': parameters,
+            'columns': list(map(str, df.columns)),
+            'data': {str(name): _column_values(column) for name, column in df.items()}
+        })
+    raise UnsupportedFormat(f"'{format}' is not a binary format")
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+import provision_api
+import provision_engine
+
+
+def transport_service_type_data() -> provision_api.ServiceTypeData:
+    houses = pd.DataFrame({
+        'district': ['d1', 'd1', 'd2'],
+        'municipality': ['m1', 'm2', 'm3'],
+        'block': [1, 2, 3],
+        'population': [100, 250, 40],
+        'longitude': [30.30, 30.31, 30.50],
+        'latitude': [59.90, 59.91, 59.95]
+    }, index=pd.Index([11, 12, 13], name='house_id'))
+    services = pd.DataFrame({
+        'district': ['d1', 'd2'],
+        'municipality': ['m1', 'm3'],
+        'block': [1, 3],
+        'longitude': [30.30, 30.50],
+        'latitude': [59.90, 59.95]
+    }, index=pd.Index([21, 22], name='service_id'))
+    pairs = pd.DataFrame({'house_id': [11, 12, 13, 12], 'service_id': [21, 21, 22, 22]})
+    normative = {
+        'normative': 30.0,
+        'max_load': 10,
+        'radius_meters': None,
+        'public_transport_time': 20,
+        'service_evaluation': [-10, -5, 0, 2, 5],
+        'house_evaluation': [-100, -30, -10, 0, 10, 30, 100]
+    }
+    accessibility = provision_engine.build_accessibility(houses, services, pairs)
+    return provision_api.ServiceTypeData(accessibility, normative, provision_engine.evaluate(accessibility, normative))
+
+def accessibility_data(service_type_data: provision_api.ServiceTypeData) -> provision_api.AccessibilityData:
+    return provision_api.AccessibilityData(lambda _: service_type_data.accessibility.houses, lambda *_: service_type_data)
+
+def test_calculation_without_overrides_equals_baseline_for_transport_service_type():
+    service_type_data = transport_service_type_data()
+    calculation, cached = accessibility_data(service_type_data).calculate('city', 'service type', {})
+    assert not cached
+    baseline = service_type_data.baseline
+    assert np.array_equal(calculation.houses['reserve_resources'].to_numpy(), np.round(baseline.house_reserves, 2))
+    assert np.array_equal(calculation.services['service_load'].to_numpy(), baseline.service_loads.astype(int))
+    assert np.array_equal(calculation.services['houses_in_access'].to_numpy(), [2, 2])
+
+def test_calculation_with_normative_override_keeps_transport_accessibility():
+    service_type_data = transport_service_type_data()
+    calculation, _ = accessibility_data(service_type_data).calculate('city', 'service type', {'normative': 50})
+    assert calculation.normative['normative'] == 50
+    assert np.array_equal(calculation.services['houses_in_access'].to_numpy(), [2, 2])
+    evaluation = provision_engine.evaluate(service_type_data.accessibility, calculation.normative)
+    assert np.array_equal(calculation.houses['reserve_resources'].to_numpy(), np.round(evaluation.house_reserves, 2))
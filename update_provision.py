@@ -231,6 +231,16 @@ def process_tables(table1: pd.DataFrame, table2: pd.DataFrame, table3: pd.DataFr
 
 # insert results
 
+def refresh_readiness(cur: psycopg2.extensions.cursor, service_type_id: Optional[int] = None) -> None:
+    cur.execute('DELETE FROM provision.services_readiness' + (' WHERE city_service_type_id = %s' if service_type_id is not None else ''),
+            (service_type_id,) if service_type_id is not None else ())
+    cur.execute("INSERT INTO provision.services_readiness (city, city_service_type_id, evaluated, total, updated_at)"
+            "   SELECT a.city, a.city_service_type_id, count(ps.service_id), count(*), date_trunc('second', now())"
+            '   FROM all_services a'
+            '     LEFT JOIN provision.services ps ON a.functional_object_id = ps.service_id'
+            '   WHERE a.city IS NOT NULL AND a.city_service_type_id ' + ('= %s' if service_type_id is not None else 'IS NOT NULL') +
+            '   GROUP BY a.city, a.city_service_type_id', (service_type_id,) if service_type_id is not None else ())
+
 def ensure_tables(conn: psycopg2.extensions.connection):
     with conn, conn.cursor() as cur:
         cur.execute('CREATE SCHEMA IF NOT EXISTS provision')
@@ -371,6 +381,23 @@ def ensure_tables(conn: psycopg2.extensions.connection):
         cur.execute('CREATE INDEX IF NOT EXISTS houses_services_houses_index ON provision.houses_services(house_id)')
         cur.execute('CREATE INDEX IF NOT EXISTS houses_services_services_index ON provision.houses_services(service_id)')
 
+        cur.execute('ALTER TABLE provision.services ADD COLUMN IF NOT EXISTS load_total float')
+        cur.execute('ALTER TABLE provision.houses ADD COLUMN IF NOT EXISTS load float')
+
+        cur.execute("SELECT to_regclass('provision.services_readiness') IS NULL")
+        readiness_created = cur.fetchone()[0]
+        cur.execute('CREATE TABLE IF NOT EXISTS provision.services_readiness ('
+                '  city varchar NOT NULL,'
+                '  city_service_type_id int REFERENCES city_service_types(id) NOT NULL,'
+                '  evaluated int NOT NULL,'
+                '  total int NOT NULL,'
+                '  updated_at TIMESTAMPTZ NOT NULL,'
+                '  PRIMARY KEY(city, city_service_type_id)'
+                ')'
+        )
+        if readiness_created:
+            refresh_readiness(cur)
+
 def insert_results(conn: psycopg2.extensions.connection, table_1: pd.DataFrame, table_2: pd.DataFrame, table_3: pd.DataFrame,
         service_type: str, normative: Dict[str, Any]) -> None:
     with conn, conn.cursor() as cur:
@@ -547,9 +574,20 @@ def insert_results(conn: psycopg2.extensions.connection, table_1: pd.DataFrame,
             if func_id != -1 and house_id != -1:
                 cur.execute('INSERT INTO provision.houses_services (house_id, service_id, load) VALUES (%s, %s, %s)'
                         ' ON CONFLICT (house_id, service_id) DO UPDATE SET load = excluded.load', (house_id, func_id, load))
+
+        # load totals for houses and services drill-down
+        log.debug(f'load totals: updating "{service_type}" - {services.shape[0]} services')
+        cur.execute('UPDATE provision.services s SET load_total = coalesce((SELECT sum(load) FROM provision.houses_services WHERE service_id = s.service_id), 0)'
+                ' WHERE s.service_id = ANY(%s)', (list(map(int, services.index)),))
+        cur.execute('UPDATE provision.houses ph SET load = h.resident_number * %s / 1000.0 FROM houses h'
+                ' WHERE ph.house_id = h.functional_object_id AND ph.city_service_type_id = %s', (normative['normative'], service_type_id))
         
         cur.execute("UPDATE provision.normatives SET last_calculations = date_trunc('second', now()) WHERE city_service_type_id = %s", (service_type_id,))
 
+        # readiness statistics
+        log.debug(f'readiness statistics: refreshing after "{service_type}"')
+        refresh_readiness(cur, service_type_id)
+
 if __name__ == '__main__':
     properties = Properties('localhost', 5432, 'city_db_final', 'postgres', 'postgres')
     properties_geometry = Properties('localhost', 5432, 'provision', 'postgres', 'postgres')